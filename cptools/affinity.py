@@ -0,0 +1,177 @@
+"""
+CPU affinity for runs, so that the times of runs done at the same time (parallel cases, stress test stages, or several
+cptools processes) stay comparable to the times of runs done alone.  The first physical core available to cptools is
+kept for runs that aren't timed (generators, reference solutions and checkers), and each timed run gets one of the other
+cores to itself for as long as it runs.  Timed runs are pinned to a single logical CPU of their core, so they never share
+a core with another run through SMT (hyper-threading).  Runs that aren't timed also use the cores that no timed run has
+reserved when they start.
+
+Cores are reserved with lock files in the temporary directory, so that cptools processes running at the same time
+(i.e. in several terminals, or stress test worker processes) don't give out the same core twice.  When all cores are
+taken, timed runs wait for any of them to be released.  Nothing is pinned if there are fewer than two physical cores, if
+the cpu_affinity config option is off, or on systems without sched_setaffinity
+"""
+
+import contextlib
+import functools
+import itertools
+import logging
+import os
+import tempfile
+import time
+
+from cptools.data import get_option
+
+try:
+    import fcntl
+except ImportError:  # Not available on Windows
+    fcntl = None
+
+SYSFS_CPU_DIR = '/sys/devices/system/cpu'
+LOCK_DIR = os.path.join(tempfile.gettempdir(), 'cptools-cores')
+# Seconds between checks for a released core when they are all taken
+ACQUIRE_POLL_INTERVALS = (0.001, 0.002, 0.005, 0.01, 0.02)
+
+
+def parse_cpu_list(text):
+    """
+    Parses a list of CPUs in the format used by the kernel (i.e. "0-3,8,10-11")
+    :return: A set of CPU numbers
+    """
+    cpus = set()
+    for part in text.strip().split(','):
+        if part:
+            start, _, end = part.partition('-')
+            cpus.update(range(int(start), int(end or start) + 1))
+    return cpus
+
+
+def physical_cores(cpus, sysfs_dir=SYSFS_CPU_DIR):
+    """
+    Groups CPUs by the physical core they belong to (CPUs of the same core are SMT siblings)
+    :param cpus: The CPUs to group
+    :param sysfs_dir: Directory containing the topology of the CPUs
+    :return: A sorted list of tuples of sorted CPUs, one for each physical core.  Only CPUs in cpus are included
+    """
+    cores = set()
+    for cpu in cpus:
+        try:
+            with open(os.path.join(sysfs_dir, f'cpu{cpu}', 'topology', 'thread_siblings_list')) as f:
+                siblings = parse_cpu_list(f.read()) & set(cpus)
+        except (OSError, ValueError):
+            siblings = set()
+        cores.add(tuple(sorted(siblings | {cpu})))
+    return sorted(cores)
+
+
+class CoreLayout:
+    """
+    The split of the available physical cores between timed and untimed runs
+    """
+
+    def __init__(self, cores):
+        """
+        :param cores: The physical cores (see physical_cores).  There must be at least two
+        """
+        self.untimed_core = cores[0]
+        self.timed_cores = cores[1:]
+        self._next_core = itertools.count()
+
+    def describe(self):
+        timed = ', '.join(f'CPU {core[0]}' for core in self.timed_cores)
+        return f'Timed runs are pinned to {timed} (one per physical core), and other runs to CPUs ' \
+               f'{", ".join(map(str, self.untimed_core))} and the cores not reserved by timed runs'
+
+    @staticmethod
+    def _lock_path(core):
+        return os.path.join(LOCK_DIR, f'cpu{core[0]}.lock')
+
+    def _try_lock(self, core):
+        """
+        Reserves a core if it's free
+        :return: The lock file to close to release the core, or None if the core is taken
+        """
+        f = open(self._lock_path(core), 'a')
+        try:
+            fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            f.close()
+            return None
+        except BaseException:
+            f.close()
+            raise
+        return f
+
+    def untimed_cpus(self):
+        """
+        Returns the CPUs that a run that isn't timed can use: those of the first core and of the timed cores that aren't
+        reserved at the moment
+        """
+        os.makedirs(LOCK_DIR, exist_ok=True)
+        cpus = set(self.untimed_core)
+        for core in self.timed_cores:
+            lock = self._try_lock(core)
+            if lock is not None:
+                lock.close()
+                cpus.update(core)
+        return cpus
+
+    def acquire(self):
+        """
+        Reserves a timed core, waiting for any of them to be released if they are all taken
+        :return: A tuple (CPU to pin the run to, lock file to close to release the core)
+        """
+        os.makedirs(LOCK_DIR, exist_ok=True)
+        start = next(self._next_core) % len(self.timed_cores)  # Spread runs over the cores when several are free
+        cores = self.timed_cores[start:] + self.timed_cores[:start]
+        intervals = iter(ACQUIRE_POLL_INTERVALS)
+        while True:
+            for core in cores:
+                lock = self._try_lock(core)
+                if lock is not None:
+                    return core[0], lock
+            time.sleep(next(intervals, ACQUIRE_POLL_INTERVALS[-1]))
+
+
+@functools.lru_cache(maxsize=None)
+def get_layout():
+    """
+    Returns the CoreLayout used by this process, or None if runs aren't pinned
+    """
+    if not get_option('cpu_affinity') or fcntl is None or not hasattr(os, 'sched_setaffinity'):
+        return None
+    cores = physical_cores(os.sched_getaffinity(0))
+    if len(cores) < 2:
+        logging.debug('Runs are not pinned to CPUs, since only one physical core is available')
+        return None
+    layout = CoreLayout(cores)
+    logging.debug(layout.describe())
+    return layout
+
+
+@contextlib.contextmanager
+def run_cpus(timed):
+    """
+    Context manager that gives the CPUs a run should be pinned to, for as long as the run lasts
+    :param timed: Whether the run is timed.  A timed run gets a core to itself, and so may have to wait for one
+    :return: A set of CPUs, or None if the run shouldn't be pinned
+    """
+    layout = get_layout()
+    if layout is None:
+        yield None
+    elif not timed:
+        try:
+            cpus = layout.untimed_cpus()
+        except OSError as e:
+            logging.debug(f'Could not check which cores are reserved (Error: {e})')
+            cpus = set(layout.untimed_core)
+        yield cpus
+    else:
+        try:
+            cpu, lock = layout.acquire()
+        except OSError as e:  # i.e. the lock directory belongs to another user
+            logging.debug(f'Could not reserve a core for the run (Error: {e})')
+            yield None
+            return
+        with lock:
+            yield {cpu}
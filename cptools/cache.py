@@ -0,0 +1,292 @@
+import hashlib
+import logging
+import os
+import re
+import shutil
+import subprocess as sub
+import tempfile
+
+import cptools.data as data
+import cptools.trace as trace
+
+INCLUDE_REGEX = re.compile(rb'^\s*#\s*include\s*"([^"]+)"', re.MULTILINE)
+
+
+def hash_key(*parts):
+    """
+    Returns a hex digest identifying the given parts
+    :param parts: Any number of str or bytes objects
+    """
+    h = hashlib.sha256()
+    for part in parts:
+        if type(part) == str:
+            part = part.encode('utf8')
+        h.update(len(part).to_bytes(8, 'little'))  # So that ('ab', 'c') and ('a', 'bc') have different keys
+        h.update(part)
+    return h.hexdigest()
+
+
+class FileCache:
+    """
+    A directory of files addressed by key, with size-bounded LRU eviction.  The mtime of an entry is used as its last
+    use time
+    """
+
+    # When the cache is too big, entries are evicted until it is this fraction of its maximum size, so that a full cache
+    # isn't scanned on every write
+    EVICT_TARGET = 0.9
+
+    def __init__(self, path, max_size):
+        """
+        :param path: The directory to store the cache in (created if it does not exist)
+        :param max_size: The maximum total size of the cache in bytes
+        """
+        self.path = path
+        self.max_size = max_size
+        self._size = None  # Estimated total size of the entries, or None if the cache hasn't been scanned yet
+        os.makedirs(self.path, exist_ok=True)
+
+    def _entry_path(self, key):
+        return os.path.join(self.path, key)
+
+    def get(self, key, dest):
+        """
+        Puts the cached file for key at dest (by hard linking it if possible, and copying it otherwise)
+        :param key: The key
+        :param dest: The destination path.  If the file exists already it is replaced
+        :return: True if the key was in the cache, and False otherwise
+        """
+        entry = self._entry_path(key)
+        if not os.path.exists(entry):
+            return False
+
+        try:
+            if os.path.exists(dest):
+                os.unlink(dest)
+            try:
+                os.link(entry, dest)
+            except OSError:  # Different file systems, or links aren't supported
+                shutil.copy2(entry, dest)
+            os.utime(entry)
+        except OSError as e:
+            logging.warning(f'Could not retrieve cached file {entry} (Error: {e})')
+            return False
+        return True
+
+    def read(self, key):
+        """
+        Returns the content (bytes) of the cached file for key, or None if the key is not in the cache
+        """
+        entry = self._entry_path(key)
+        try:
+            with trace.span('cache_read'), open(entry, 'rb') as f:
+                content = f.read()
+            os.utime(entry)
+        except OSError:
+            return None
+        return content
+
+    def put(self, key, src):
+        """
+        Adds a copy of the file src to the cache under key, and evicts old entries if the cache is too big
+        """
+        self._add(key, lambda tmp_path: shutil.copy2(src, tmp_path), src)
+
+    def write(self, key, content):
+        """
+        Adds a file with the given content (bytes) to the cache under key, and evicts old entries if the cache is too big
+        """
+        def write_tmp(tmp_path):
+            with open(tmp_path, 'wb') as f:
+                f.write(content)
+
+        self._add(key, write_tmp, f'entry {key}')
+
+    def _add(self, key, write_tmp, name):
+        with trace.span('cache_write'):
+            fd, tmp_path = tempfile.mkstemp(dir=self.path, prefix='.tmp')
+            os.close(fd)
+            try:
+                write_tmp(tmp_path)
+                size = os.path.getsize(tmp_path)
+                os.replace(tmp_path, self._entry_path(key))  # Atomic, so other processes never see partial entries
+            except OSError as e:
+                logging.warning(f'Could not add {name} to cache (Error: {e})')
+                if os.path.exists(tmp_path):
+                    os.unlink(tmp_path)
+                return
+
+            if self._size is None or self._size + size > self.max_size:
+                self.evict()
+            else:
+                self._size += size
+
+    def evict(self):
+        """
+        Removes the least recently used entries if the cache is over its size limit, until it is within EVICT_TARGET of
+        the limit
+        """
+        entries = []
+        for entry in os.scandir(self.path):
+            if entry.is_file() and not entry.name.startswith('.tmp'):
+                stat = entry.stat()
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+
+        total = sum(size for _, size, _ in entries)
+        if total > self.max_size:
+            for _, size, path in sorted(entries):
+                if total <= self.max_size * self.EVICT_TARGET:
+                    break
+                try:
+                    os.unlink(path)
+                    total -= size
+                except OSError:  # Another process may have removed it already
+                    pass
+        self._size = total
+
+
+"""
+COMPILE CACHE
+"""
+
+__compiler_versions = {}
+
+
+def compiler_version(compiler):
+    """
+    Returns the output of `<compiler> --version`, or an empty string if it could not be run
+    """
+    if compiler not in __compiler_versions:
+        try:
+            res = sub.run([compiler, '--version'], stdout=sub.PIPE, stderr=sub.PIPE)
+            __compiler_versions[compiler] = str(res.stdout, 'utf8', errors='replace')
+        except OSError:
+            __compiler_versions[compiler] = ''
+    return __compiler_versions[compiler]
+
+
+def _read_sources(src_path, seen):
+    """
+    Yields the content of src_path and of any local headers that it includes (#include "..."), recursively
+    """
+    src_path = os.path.normpath(src_path)
+    if src_path in seen or not os.path.isfile(src_path):
+        return
+    seen.add(src_path)
+
+    with open(src_path, 'rb') as f:
+        content = f.read()
+    yield src_path
+    yield content
+    for header in INCLUDE_REGEX.findall(content):
+        yield from _read_sources(os.path.join(os.path.dirname(src_path), str(header, 'utf8', errors='replace')), seen)
+
+
+def source_files(src_path):
+    """
+    Returns the paths of a source file and of the local headers that it includes (recursively)
+    """
+    return list(_read_sources(src_path, set()))[::2]
+
+
+def compile_key(src_path, command):
+    """
+    Returns the compile cache key for a source file
+    :param src_path: Path to the source file
+    :param command: The compile command, with placeholders substituted
+    """
+    return hash_key(*_read_sources(src_path, set()), '\0'.join(command), compiler_version(command[0]))
+
+
+def _get_cache(option, local_path, enable=False):
+    location = data.get_option(option)
+    if location is False or location == 'off':  # YAML reads an unquoted off as False
+        if not enable:
+            return None
+        location = 'local'
+    path = local_path if location == 'local' else os.path.join(data.GLOBAL_DATA_DIR, os.path.basename(local_path))
+    return FileCache(path, data.get_option(f'{option}_size') * 1024 * 1024)
+
+
+def get_compile_cache():
+    """
+    Returns the FileCache for compiled executables based on the compile_cache config options, or None if it is disabled
+    """
+    return _get_cache('compile_cache', data.COMPILE_CACHE_DIR)
+
+
+"""
+STRESS TEST CACHE
+"""
+
+
+def program_key(exc):
+    """
+    Returns a key identifying the program run by an executor (which must be set up already): its run command and the
+    content of the file that it runs (the executable for compiled languages, and the source file otherwise)
+    """
+    with open(exc.exec_file, 'rb') as f:
+        content = f.read()
+    return hash_key('\0'.join(exc.executor_info['command']), content)
+
+
+class CaseCache:
+    """
+    Cache of the cases generated for a stress test, so that running it again on the same seeds only runs the tested
+    solution.  The output (STDOUT and STDERR) of the generator is keyed by the generator and the seed, and the output of
+    the reference solution is keyed by the reference solution and the input.  Both programs are assumed to be
+    deterministic.  Outputs of batch runs (see cptools.gutils.batch) are kept apart from those of single case runs,
+    since programs may not print the same thing with both protocols (i.e. the STDERR of a batch generator isn't split
+    into cases when there's a reference solution)
+    """
+
+    def __init__(self, files, gen_exc, slow_exc):
+        """
+        :param files: The FileCache to store the cases in
+        :param gen_exc: The generator executor
+        :param slow_exc: The reference solution executor, or None if there is none
+        """
+        self.files = files
+        self.gen_key = program_key(gen_exc)
+        self.slow_key = slow_exc and program_key(slow_exc)
+
+    def _read(self, key):
+        content = self.files.read(key)
+        return None if content is None else str(content, 'utf8')
+
+    @staticmethod
+    def _protocol(batch):
+        return 'batch' if batch else 'single'
+
+    def get_generated(self, seed, batch=False):
+        """
+        Returns a tuple (STDOUT, STDERR) with the output of the generator for seed, or None if it is not cached
+        :param batch: Whether the generator is run with the batch protocol
+        """
+        protocol = self._protocol(batch)
+        out = self._read(hash_key(self.gen_key, protocol, 'stdout', str(seed)))
+        err = out is not None and self._read(hash_key(self.gen_key, protocol, 'stderr', str(seed)))
+        return None if out is None or err is None else (out, err)
+
+    def put_generated(self, seed, out, err, batch=False):
+        protocol = self._protocol(batch)
+        self.files.write(hash_key(self.gen_key, protocol, 'stdout', str(seed)), out.encode('utf8'))
+        self.files.write(hash_key(self.gen_key, protocol, 'stderr', str(seed)), err.encode('utf8'))
+
+    def get_reference(self, case_in, batch=False):
+        """
+        Returns the output of the reference solution for an input, or None if it is not cached
+        :param batch: Whether the reference solution is run with the batch protocol
+        """
+        return self._read(hash_key(self.slow_key, self._protocol(batch), case_in))
+
+    def put_reference(self, case_in, out, batch=False):
+        self.files.write(hash_key(self.slow_key, self._protocol(batch), case_in), out.encode('utf8'))
+
+
+def get_stress_cache(enable=False):
+    """
+    Returns the FileCache for stress test cases based on the stress_cache config options, or None if it is disabled
+    :param enable: If True, a local cache is used even if the stress_cache option is off
+    """
+    return _get_cache('stress_cache', data.STRESS_CACHE_DIR, enable)
@@ -0,0 +1,114 @@
+"""
+Test sets stored as a directory of files instead of a single .yml file.  Case i is stored in <i>.in and <i>.out, and
+the checker is stored in info.yml.  Cases are only read when they are accessed, so opening a directory takes the same
+time no matter how big its cases are
+"""
+
+import os
+import re
+from collections.abc import Mapping, Sequence
+
+import yaml
+
+import cptools.data as data
+
+INFO_FILE = 'info.yml'
+CASE_FILE_REGEX = re.compile(r'(\d+)\.in')
+
+
+def _read_text(path):
+    if not os.path.exists(path):
+        return ''
+    with open(path, encoding='utf8', newline='') as f:
+        text = f.read().replace('\r\n', '\n')
+    if text and text[-1] != '\n':
+        text += '\n'
+    return text
+
+
+class DirectoryCase(Mapping):
+    """
+    A single case of a DirectoryCases object.  Like the cases of a .yml file, it has the keys in and out, but their
+    values are read from the case's files each time they are accessed
+    """
+
+    def __init__(self, in_path, out_path):
+        self.in_path = in_path
+        self.out_path = out_path
+
+    def __getitem__(self, key):
+        if key == 'in':
+            return _read_text(self.in_path)
+        if key == 'out':
+            return _read_text(self.out_path)
+        raise KeyError(key)
+
+    def __iter__(self):
+        return iter(('in', 'out'))
+
+    def __len__(self):
+        return 2
+
+
+class DirectoryCases(Sequence):
+    """
+    The cases of a test set directory.  Only the directory listing is read when it is created
+    """
+
+    def __init__(self, path):
+        self.path = path
+        indices = sorted(int(match.group(1)) for match in map(CASE_FILE_REGEX.fullmatch, os.listdir(path)) if match)
+        if indices != list(range(len(indices))):
+            raise ValueError(f'Cases in {path} should be numbered 0 to {len(indices) - 1} without gaps')
+        self.count = len(indices)
+
+    def __len__(self):
+        return self.count
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(self.count))]
+        if index < 0:
+            index += self.count
+        if not 0 <= index < self.count:
+            raise IndexError('case index out of range')
+        return DirectoryCase(os.path.join(self.path, f'{index}.in'), os.path.join(self.path, f'{index}.out'))
+
+
+def load_directory(path):
+    """
+    Opens a test set directory
+    :param path: Path to the directory
+    :return: A data object like the ones loaded from .yml files: a dict with the keys checker and cases, where cases is
+    a DirectoryCases object
+    """
+    info = {}
+    info_path = os.path.join(path, INFO_FILE)
+    if os.path.exists(info_path):
+        with open(info_path) as f:
+            info = yaml.safe_load(f) or {}
+    return {'checker': info.get('checker', data.get_option('default_checker')), 'cases': DirectoryCases(path)}
+
+
+def write_directory(path, checker, cases):
+    """
+    Writes a test set directory
+    :param path: Path to the directory (created if it doesn't exist).  Existing cases in it are replaced
+    :param checker: The checker string
+    :param cases: An iterable of cases (mappings with the keys in and out)
+    """
+    os.makedirs(path, exist_ok=True)
+    with open(os.path.join(path, INFO_FILE), 'w') as f:
+        yaml.safe_dump({'checker': checker}, f)
+    count = 0
+    for i, case in enumerate(cases):
+        for ext in ('in', 'out'):
+            with open(os.path.join(path, f'{i}.{ext}'), 'w', encoding='utf8', newline='') as f:
+                f.write(case[ext])
+        count = i + 1
+
+    # Remove cases left over from a bigger test set
+    for name in os.listdir(path):
+        match = re.fullmatch(r'(\d+)\.(in|out)', name)
+        if match and int(match.group(1)) >= count:
+            os.unlink(os.path.join(path, name))
@@ -1,11 +1,34 @@
+import array
+import collections
 import logging
+import math
+import os
+import queue
+import warnings
+import threading
+import subprocess as sub
 
 import cptools.data as data
 import cptools.common as common
-from cptools.executor import Executor, default_executor_name
+import cptools.tokens as tokens
+import cptools.trace as trace
+from cptools.executor import Executor, OutputFile, default_executor_name
+
+try:
+    import numpy
+except ImportError:  # Optional, only used to speed up the float checker
+    numpy = None
+
+# STDERR of streaming checkers is read in chunks of up to this many bytes, and only the last few chunks are kept (to be
+# shown if the checker fails)
+STDERR_CHUNK_SIZE = 4096
+STDERR_CHUNKS_KEPT = 16
 
 
 class Checker:
+    # Whether _check accepts outputs given as OutputFile objects.  If not, they're read into a str first
+    streaming = False
+
     def __init__(self, *_):
         pass
 
@@ -16,7 +39,10 @@ class Checker:
         pass
 
     def check(self, input, expected, output):
-        res = self._check(input, expected, output)
+        with trace.span('check', checker=type(self).__name__):
+            if type(output) == OutputFile and not self.streaming:
+                output = output.text()
+            res = self._check(input, expected, output)
         if type(res) == str:
             return False, res
         elif type(res) == bool:
@@ -27,25 +53,141 @@ class Checker:
 
 
 class IdenticalChecker(Checker):
+    streaming = True
+
     def _check(self, _, expected, output):
-        return expected == output
+        diff = tokens.first_byte_difference(expected, output)
+        if diff is None:
+            return True
+        line, col = tokens.line_col(output, diff)
+        return f'first difference at line {line}, column {col}'
 
 
 class TokensChecker(Checker):
+    streaming = True
+
     def _check(self, _, expected, output):
-        return expected.split() == output.split()
+        if tokens.first_byte_difference(expected, output) is None:  # Fast path, since it's mostly done in C
+            return True
+
+        diff = tokens.first_token_difference(expected, output)
+        if diff is None:
+            return True
+        index, exp, out, offset = diff
+        line, col = tokens.line_col(output, offset)
+        return f'token #{index + 1} (line {line}, column {col}): expected {tokens.describe_token(exp)}, ' \
+               f'got {tokens.describe_token(out)}'
 
 
 class FloatChecker(Checker):
-    def __init__(self, eps):
-        self.eps = float(eps)
+    """
+    Compares the outputs as whitespace-separated floating-point numbers.  The argument is either a single epsilon
+    (absolute error), or a comma-separated list of abs=<eps> and/or rel=<eps>.  A number is accepted if either its
+    absolute or relative error is less than the corresponding epsilon
+    """
+
+    streaming = True
+
+    def __init__(self, arg):
+        self.abs_eps, self.rel_eps = 0., 0.
+        try:
+            if '=' not in arg:
+                self.abs_eps = float(arg)
+            else:
+                for part in arg.split(','):
+                    key, value = part.split('=')
+                    if key.strip() not in ('abs', 'rel'):
+                        raise ValueError(f'unknown tolerance type "{key}"')
+                    setattr(self, f'{key.strip()}_eps', float(value))
+        except ValueError as e:
+            logging.error(f'Invalid float checker argument "{arg}" ({e})')
+            logging.error('Must be either an epsilon (i.e. float:1e-6) or a list of abs=<eps> and/or rel=<eps> '
+                          '(i.e. float:abs=1e-6,rel=1e-9)')
+            common.exit()
+
+    @staticmethod
+    def _parse(source):
+        """
+        Parses all numbers in source, returning them as a numpy array if numpy is available and an array.array otherwise
+        """
+        try:
+            if numpy is not None:
+                return FloatChecker._parse_numpy(source)
+
+            res = array.array('d')
+            for batch in tokens.iter_token_batches(source):
+                res.extend(map(float, batch))
+            return res
+        except (ValueError, DeprecationWarning):
+            pass
+
+        # Slow path to find the first invalid token for the error message
+        for batch in tokens.iter_token_batches(source):
+            for token in batch:
+                try:
+                    float(token)
+                except ValueError:
+                    raise ValueError(f'could not convert string to float: {tokens.describe_token(token)}')
+        raise ValueError('could not convert string to float')
+
+    @staticmethod
+    def _parse_numpy(source):
+        parsed, pending = [], b''
+        with warnings.catch_warnings():
+            warnings.simplefilter('error', DeprecationWarning)  # Older numpy versions only warn about invalid data
+            for chunk in tokens.iter_chunks(source):
+                buf = pending + chunk if pending else chunk
+                pending = b''
+                if not buf[-1:].isspace():  # The last number might continue in the next chunk
+                    *rest, pending = buf.rsplit(None, 1)
+                    buf = rest[0] if rest else b''
+                if buf and not buf.isspace():  # fromstring doesn't handle whitespace-only strings properly
+                    parsed.append(numpy.fromstring(buf, sep=' '))
+            if pending:
+                parsed.append(numpy.fromstring(pending, sep=' '))
+        return numpy.concatenate(parsed) if parsed else numpy.empty(0)
+
+    def _worst_error(self, expected, output):
+        """
+        Returns the index of the number with the worst error relative to its tolerance, out of the numbers that aren't
+        accepted, or None if all numbers are accepted
+        """
+        if numpy is not None:
+            with numpy.errstate(invalid='ignore', divide='ignore'):
+                diff = numpy.abs(expected - output)
+                tol = numpy.maximum(self.abs_eps, self.rel_eps * numpy.abs(expected))
+                bad = ~((diff < tol) | (expected == output))
+                if not bad.any():
+                    return None
+                ratio = numpy.where(numpy.isnan(diff), numpy.inf, diff / tol)
+                return int(numpy.argmax(numpy.where(bad, ratio, -1.)))
+
+        worst, worst_ratio = None, -1.
+        for i, (exp, out) in enumerate(zip(expected, output)):
+            diff = abs(exp - out)
+            tol = max(self.abs_eps, self.rel_eps * abs(exp))
+            if diff < tol or exp == out:
+                continue
+            ratio = diff / tol if tol > 0 and not math.isnan(diff) else math.inf
+            if ratio > worst_ratio:
+                worst, worst_ratio = i, ratio
+        return worst
 
     def _check(self, _, expected, output):
         try:
-            return all(map(lambda tup: abs(float(tup[0]) - float(tup[1])) < self.eps, zip(expected.split(), output.split())))
+            expected, output = self._parse(expected), self._parse(output)
         except ValueError as e:
             return str(e)
 
+        if len(expected) != len(output):
+            return f'expected {len(expected)} numbers, got {len(output)}'
+
+        worst = self._worst_error(expected, output)
+        if worst is None:
+            return True
+        exp, out = float(expected[worst]), float(output[worst])
+        return f'worst error at number #{worst + 1}: expected {exp:.10g}, got {out:.10g} (error {abs(exp - out):.3g})'
+
 
 class CustomChecker(Checker):
     def __init__(self, src_path, exc_name=None):
@@ -60,19 +202,19 @@ class CustomChecker(Checker):
             logging.error('Checker compile failed!')
             common.exit()
 
-    def _check(self, input, expected, output):
-        res, _, tle = self.exc.run('', self.exc.executor_info['command'] + [input, expected, output])
+    def _log_case(self, input, output):
+        logging.error(f'Case Input (Debug): \n{input.strip()}')
+        logging.error(f'Case Output (Debug): \n{output.strip()}')
 
-        def log_case():
-            logging.error(f'Case Input (Debug): \n{input.strip()}')
-            logging.error(f'Case Output (Debug): \n{output.strip()}')
+    def _check(self, input, expected, output):
+        res, _, tle = self.exc.run('', self.exc.executor_info['command'] + [input, expected, output], judged=False)
 
         if tle:
-            log_case()
+            self._log_case(input, output)
             logging.error(f'Checker timed out')
             common.exit()
         elif res.returncode or res.stderr:
-            log_case()
+            self._log_case(input, output)
             logging.error(f'Checker encountered runtime error (exit code: {res.returncode})')
             logging.error(f'STDERR info: {res.stderr}')
             common.exit()
@@ -87,11 +229,123 @@ class CustomChecker(Checker):
         self.exc.cleanup()
 
 
+class StreamingCustomChecker(CustomChecker):
+    """
+    Custom checker that is started once and then checks every case over its STDIN/STDOUT, instead of being started once
+    per case with the case passed in its arguments.  For each case, the checker is sent the line
+    "<input length> <expected output length> <output length>", followed by the input, expected output and output
+    themselves (lengths are in bytes, UTF-8 encoded).  It should respond with the line "<feedback length>" followed by
+    the feedback, which is "OK" if the output is accepted.  See cptools.gutils.checker for a helper that implements
+    this for Python checkers
+    """
+
+    def __init__(self, src_path, exc_name=None):
+        super().__init__(src_path, exc_name)
+        self.proc, self.responses, self.lock, self.owner_pid = None, None, None, None
+        self.stderr, self.stderr_thread = None, None
+
+    def setup(self):
+        super().setup()
+        self._start()
+
+    def _start(self):
+        self.proc = self.exc.popen(stdin=sub.PIPE, stdout=sub.PIPE, stderr=sub.PIPE)
+        self.responses = queue.Queue()
+        self.stderr = collections.deque(maxlen=STDERR_CHUNKS_KEPT)
+        self.lock = threading.Lock()
+        self.owner_pid = os.getpid()
+        threading.Thread(target=self._read_responses, args=(self.proc.stdout, self.responses), daemon=True).start()
+        self.stderr_thread = threading.Thread(target=self._read_stderr, args=(self.proc.stderr, self.stderr),
+                                              daemon=True)
+        self.stderr_thread.start()
+
+    @staticmethod
+    def _read_responses(stdout, responses):
+        """
+        Puts each response of the checker in responses, followed by None once the checker exits.  If a response is
+        malformed, the exception raised while reading it is put in responses instead
+        """
+        try:
+            while True:
+                header = stdout.readline()
+                if not header.strip():
+                    break
+                responses.put(str(stdout.read(int(header)), 'utf8'))
+        except BaseException as e:
+            responses.put(e)
+            return
+        responses.put(None)
+
+    @staticmethod
+    def _read_stderr(stderr, chunks):
+        for chunk in iter(lambda: stderr.read1(STDERR_CHUNK_SIZE), b''):
+            chunks.append(chunk)
+
+    def _fail(self, input, output, message):
+        """
+        Logs an error, along with the case and the STDERR of the checker, and exits
+        """
+        self._log_case(input, output)
+        logging.error(message)
+        self.proc.kill()  # So that the rest of its STDERR can be read
+        self.proc.wait()
+        self.stderr_thread.join(1)
+        stderr = str(b''.join(self.stderr), 'utf8', errors='replace')
+        if stderr:
+            logging.error(f'STDERR info: {stderr}')
+        common.exit()
+
+    def _check(self, input, expected, output):
+        if not self.proc or self.owner_pid != os.getpid():  # Copied to another process (i.e. a stress test worker)
+            self._start()
+
+        payloads = [s.encode('utf8') for s in (input, expected, output)]
+        header = ' '.join(str(len(payload)) for payload in payloads) + '\n'
+        with self.lock:
+            try:
+                self.proc.stdin.write(header.encode('utf8') + b''.join(payloads))
+                self.proc.stdin.flush()
+            except BrokenPipeError:
+                pass  # Handled below, since the response queue will have the EOF marker
+
+            try:
+                feedback = self.responses.get(timeout=float(data.get_option('timeout')))
+            except queue.Empty:
+                self._fail(input, output, 'Checker timed out')
+
+        if feedback is None:
+            self._fail(input, output, f'Checker encountered runtime error (exit code: {self.proc.wait()})')
+        elif isinstance(feedback, BaseException):
+            self._fail(input, output, f'Checker sent a malformed response ({type(feedback).__name__}: {feedback})')
+
+        feedback = feedback.strip()
+        if feedback != 'OK':
+            return feedback
+        else:
+            return True
+
+    def cleanup(self):
+        if self.proc:
+            try:
+                self.proc.stdin.close()
+                self.proc.wait(timeout=float(data.get_option('timeout')))
+            except (BrokenPipeError, sub.TimeoutExpired):
+                self.proc.kill()
+        super().cleanup()
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        # Restarted by _check when needed
+        state['proc'], state['responses'], state['lock'], state['stderr'], state['stderr_thread'] = [None] * 5
+        return state
+
+
 CHECKERS = {
     'tokens': TokensChecker,
     'identical': IdenticalChecker,
     'float': FloatChecker,
-    'custom': CustomChecker
+    'custom': CustomChecker,
+    'custom-stream': StreamingCustomChecker
 }
 
 
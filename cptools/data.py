@@ -1,8 +1,9 @@
 import os
 import yaml
-from collections import namedtuple
 from pkg_resources import resource_string
 
+import cptools.trace as trace
+
 DEFAULT_CONFIG_PATH = 'cptools.local_data', 'default_config.yml'
 DEFAULT_EXECUTORS_PATH = 'cptools.local_data', 'default_executors.yml'
 DEFAULT_STRESS_TEST_PATH = 'cptools.local_data', 'default_stress_test.yml'
@@ -10,12 +11,11 @@ DEFAULT_STRESS_TEST_PATH = 'cptools.local_data', 'default_stress_test.yml'
 DATA_DIR = '.cptools'
 CONFIG_PATH = f'{DATA_DIR}/config.yml'
 EXECUTORS_PATH = f'{DATA_DIR}/executors.yml'
-RESULTS_LIST_PATH = f'{DATA_DIR}/results_list.yml'
-RESULTS_DIR = f'{DATA_DIR}/results'
-
-Result = namedtuple('Result', 'id src_name input_name checker cases')
-Case = namedtuple('Case', 'inp out expected_out err')
-
+RESULTS_DB_PATH = f'{DATA_DIR}/results.db'
+COMPILE_CACHE_DIR = f'{DATA_DIR}/compile_cache'
+STRESS_CACHE_DIR = f'{DATA_DIR}/stress_cache'
+PCH_DIR = f'{DATA_DIR}/pch'
+GLOBAL_DATA_DIR = os.path.join(os.path.expanduser('~'), DATA_DIR)
 
 # pkg_resources.resource_string but with some small fixes (such as removing \r)
 def get_resource_string_fix(*args):
@@ -41,16 +41,6 @@ def reset_executors(force=False):
             f.write(get_resource_string_fix(*DEFAULT_EXECUTORS_PATH))
 
 
-def reset_results(force=False):
-    if force or not os.path.exists(RESULTS_LIST_PATH):
-        with open(RESULTS_LIST_PATH, 'w') as f:
-            f.write('[]')
-    if force:
-        os.rmdir(RESULTS_DIR)
-    if not os.path.exists(RESULTS_DIR):
-        os.mkdir(RESULTS_DIR)
-
-
 def __verify_folder_exists():
     if not os.path.exists(DATA_DIR):
         os.mkdir(DATA_DIR)
@@ -64,18 +54,67 @@ def reset_all(force=False):
 
     reset_config(force)
     reset_executors(force)
-    reset_results(force)
+
+
+__file_cache = {}
+
+
+def __load_cached(path, reset, parse):
+    """
+    Parses a data file, reusing the result of the last parse if the file's content hasn't changed since then.  The
+    content is compared rather than the mtime, since the file can be written twice within the mtime's granularity
+    :param path: Path to the file
+    :param reset: Function that creates the file if it does not exist
+    :param parse: Function that takes the content of the file (str) and returns the parsed object
+    """
+
+    try:
+        with open(path) as f:
+            content = f.read()
+    except FileNotFoundError:
+        __verify_folder_exists()
+        reset(False)
+        with open(path) as f:
+            content = f.read()
+
+    abs_path = os.path.abspath(path)  # The working directory could change between calls
+    cached = __file_cache.get(abs_path)
+    if cached and cached[0] == content:
+        return cached[1]
+
+    with trace.span('parse_data', always=True, path=path):
+        obj = parse(content)
+    __file_cache[abs_path] = content, obj
+    return obj
+
+
+def __parse_config(content):
+    config = yaml.unsafe_load(get_resource_string_fix(*DEFAULT_CONFIG_PATH))
+    config.update(yaml.unsafe_load(content) or {})
+    return config
+
+
+def __parse_executors(content):
+    executors = yaml.unsafe_load(content)
+
+    # Index of file extension -> name of the first executor that supports it
+    ext_index = {}
+    for name, exc in executors.items():
+        if type(exc) == dict and type(exc.get('ext')) == list:
+            for ext in exc['ext']:
+                ext_index.setdefault(ext, name)
+
+    return executors, ext_index
 
 
 def get_config():
     """
-    Returns the entire config file as a dict
+    Returns the entire config file as a dict.  Options missing from the config file (i.e. options that were added after
+    the file was generated) take their default values.  The file is only re-parsed when it changes, so the returned
+    object is shared and should not be modified
     """
 
-    __verify_folder_exists()
-    reset_config(False)
-    with open(CONFIG_PATH) as f:
-        return yaml.unsafe_load(f)
+    return __load_cached(CONFIG_PATH, reset_config, __parse_config)
 
 
 def get_option(key):
@@ -98,71 +137,27 @@ def get_executor(name):
     :param name: The name of the executor to return.  Note that the correctness of name is not checked for
     """
 
-    __verify_folder_exists()
-    reset_executors(False)
-    with open(EXECUTORS_PATH) as f:
-        executors = yaml.unsafe_load(f.read())
-        if name not in executors:
-            raise ValueError(f'Invalid executor {name}')
-        return executors[name]
+    executors = get_executors()
+    if name not in executors:
+        raise ValueError(f'Invalid executor {name}')
+    return executors[name]
 
 
 def get_executors():
     """
-    Returns a list of all executors
-    """
-
-    __verify_folder_exists()
-    reset_executors(False)
-    with open(EXECUTORS_PATH) as f:
-        return yaml.unsafe_load(f.read())
-
-
-def get_result_list():
-    """
-    Returns a list of currently saved execution results
-    """
-
-    __verify_folder_exists()
-    reset_results(False)
-    with open(RESULTS_LIST_PATH) as f:
-        return yaml.unsafe_load(f.read())
-
-
-def get_result(result_id):
-    """
-    Returns the execution result with the given id
-    :param result_id: The id of the result to save
+    Returns a dict of all executors.  Like get_config, the returned object is shared and should not be modified
     """
 
-    __verify_folder_exists()
-    reset_results(False)
-    with open(RESULTS_LIST_PATH) as f:
-        results_info = yaml.full_load(f.read())
-        if result_id not in results_info:
-            raise ValueError(f'Invalid result id {result_id}')
-        with open(results_info[result_id]['path']) as ff:
-            return yaml.full_load(ff.read())  # Since its auto generated loading unsafe is not needed
+    return __load_cached(EXECUTORS_PATH, reset_executors, __parse_executors)[0]
 
 
-def add_result(result_obj: Result):
+def get_executor_name_for_ext(ext):
     """
-    Adds a result to the results file
-    :param result_obj: The result object to add
+    Returns the name of the first listed executor that supports the given file extension, or None if there is none
+    :param ext: The file extension, without the dot
     """
 
-    __verify_folder_exists()
-    reset_results(False)
-    path = f'{RESULTS_DIR}/{result_obj.id}.yml'
-    with open(RESULTS_LIST_PATH) as f:
-        result_list = yaml.full_load(f.read())
-    result_list.append({
-        'path': path,
-        'src_name': result_obj.src_name,
-        'input_name': result_obj.input_name
-    })
-    with open(path, 'w') as f:
-        f.write(yaml.dump(result_list))
+    return __load_cached(EXECUTORS_PATH, reset_executors, __parse_executors)[1].get(ext)
 
 
 """
@@ -170,27 +165,43 @@ VALIDATORS
 """
 
 v_int = lambda x: type(x) == int, 'expected int'
+v_bool = lambda x: type(x) == bool, 'expected bool'
 v_float = lambda x: type(x) == float, 'expected float'
 v_str = lambda x: type(x) == str, 'expected string'
 v_exist_file = lambda x: type(x) == str and os.path.exists(x), 'expected file (path specified does not exist)'
 v_dict = lambda x: type(x) == dict, 'expected dict'
 v_list_str = lambda x: type(x) == list and all((type(xx) == str for xx in x)), 'expected list of strings'
+v_dict_str = lambda x: type(x) == dict and all((type(k) == str and type(xx) == str for k, xx in x.items())), \
+             'expected dict of strings'
 v_list_node = lambda x: type(x) == list and all((type(xx) == dict for xx in x)), 'expected list of dict'
+# YAML reads an unquoted off as False
+v_cache_location = lambda x: x is False or x in ('local', 'global', 'off'), 'expected one of local, global, off'
 
 CONFIG_VALIDATORS = {
     'timeout': v_float,
+    'memory_limit': v_int,
+    'output_limit': v_int,
     'char_limit': v_int,
     'default_checker': v_str,  # Whether the checker string is valid is handled in checker.py :)
     'template_path': v_str,
-    'saved_files_dir': v_str
+    'saved_files_dir': v_str,
+    'compile_cache': v_cache_location,
+    'compile_cache_size': v_int,
+    'stress_cache': v_cache_location,
+    'stress_cache_size': v_int,
+    'pch_headers': v_list_str,
+    'cpu_affinity': v_bool,
+    'save_results': v_bool
 }
 
 
-def validate_keys(validator_dict, obj, pre=None):
+def validate_keys(validator_dict, obj, pre=None, optional=False):
     pre = f'in path "{pre}" ' if pre else ''
     for k, v in validator_dict.items():
         fun, msg = v
         if k not in obj:
+            if optional:
+                continue
             return f'Config key "{k}"" not found {pre}'
         if not fun(obj[k]):
             return f'Invalid value "{obj[k]}" for config key "{k}" {pre}({msg})'
@@ -215,6 +226,17 @@ COMPILED_EXECUTOR_VALIDATORS = {
     'exe_format': v_str
 }
 
+PROFILE_EXECUTOR_VALIDATORS = {
+    'report': (lambda x: x in ('cprofile', 'gprof'), 'expected one of cprofile, gprof')
+}
+
+# Keys of the profile node that can be left out
+PROFILE_EXECUTOR_OPTIONAL_VALIDATORS = {
+    'compile_flags': v_list_str,
+    'command': v_list_str,
+    'env': v_dict_str
+}
+
 
 def validate_executors_object(obj):
     """
@@ -232,6 +254,12 @@ def validate_executors_object(obj):
                 return f'Compiled key of executor {k} not a node'
             res_base = validate_keys(COMPILED_EXECUTOR_VALIDATORS, v['compiled'], f'{k}.compiled')
             if res_base: return res_base
+        if 'profile' in v:
+            if not v_dict[0](v['profile']):
+                return f'Profile key of executor {k} not a node'
+            res_base = validate_keys(PROFILE_EXECUTOR_VALIDATORS, v['profile'], f'{k}.profile') or \
+                validate_keys(PROFILE_EXECUTOR_OPTIONAL_VALIDATORS, v['profile'], f'{k}.profile', optional=True)
+            if res_base: return res_base
     return None
 
 
@@ -266,10 +294,18 @@ STRESS_TEST_VALIDATORS = {
 }
 
 
+# Keys that don't need to be specified
+OPTIONAL_STRESS_TEST_VALIDATORS = {
+    'batch': (lambda x: type(x) == int and x >= 1, 'expected positive int'),
+    'batch_slow': v_bool
+}
+
+
 def validate_stress_test_object(obj):
     """
     Returns an error message if the stress testing info object is invalid, and None otherwise
     :param obj: The object
     """
-    return validate_keys(STRESS_TEST_VALIDATORS, obj)
+    return validate_keys(STRESS_TEST_VALIDATORS, obj) or \
+        validate_keys(OPTIONAL_STRESS_TEST_VALIDATORS, obj, optional=True)
 
@@ -1,28 +1,351 @@
+import asyncio
+import functools
+import io
+import json
+import locale
 import logging
+import mmap
+import signal
+import socket
+import threading
 import time
 import os
 import subprocess as sub
+import sys
+import tempfile
+from collections import namedtuple
+
+import cptools.affinity as affinity
 import cptools.common as common
+import cptools.cache as cache
+import cptools.pch as pch
+import cptools.profiling as profiling
+import cptools.trace as trace
+
+from cptools.data import get_option, get_executor, get_executor_name_for_ext
+
+try:
+    import resource
+except ImportError:  # Not available on Windows, so resource usage and memory limits aren't supported there
+    resource = None
+
+# Substrings of STDERR that indicate that a process crashed because it could not allocate memory
+MLE_STDERR_MARKERS = ('std::bad_alloc', 'MemoryError', 'out of memory')
+MLE_STDERR_SEARCH_LIMIT = 1 << 16
+
+# Number of bytes kept from the end of an output stream that went over the output limit, to be displayed
+OUTPUT_TAIL_SIZE = 4096
 
-from cptools.data import get_option, get_executors, get_executor
+FORK_SERVER_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fork_server.py')
 
 
 # Returns None if no executor was found
 def default_executor_name(src_path):
     ext = os.path.splitext(src_path)[1][1:]  # Remove the dot
-    for exc_name in get_executors():
-        exc = get_executor(exc_name)
-        if ext in exc['ext']:
-            return exc_name
+    return get_executor_name_for_ext(ext)
+
+
+class ResourceUsage(namedtuple('ResourceUsage', 'user_time sys_time max_rss ctx_switches')):
+    """
+    Resource usage of a finished process.  Times are in seconds and max_rss (peak resident memory) is in bytes
+    """
+
+    @staticmethod
+    def from_rusage(rusage, max_rss=None):
+        """
+        :param max_rss: The peak memory of the process in bytes, if it's known better than by ru_maxrss
+        """
+        return ResourceUsage(rusage.ru_utime, rusage.ru_stime,
+                             ResourceUsage.rss_bytes(rusage.ru_maxrss) if max_rss is None else max_rss,
+                             rusage.ru_nvcsw + rusage.ru_nivcsw)
+
+    @staticmethod
+    def rss_bytes(ru_maxrss):
+        return ru_maxrss if sys.platform == 'darwin' else ru_maxrss * 1024  # macOS uses bytes, not KB
+
+
+# Seconds between reads of the peak memory of a running process.  They start short, so that quick runs are measured too
+PEAK_MEMORY_POLL_INTERVALS = (0.001, 0.002, 0.005, 0.01, 0.02, 0.05)
+
+
+def _read_peak_memory(pid):
+    """
+    Returns the peak resident memory (in bytes) of a running process so far (VmHWM in /proc/<pid>/status), or None if
+    it can't be read (i.e. the process has exited)
+    """
+    try:
+        with open(f'/proc/{pid}/status', 'rb') as f:
+            for line in f:
+                if line.startswith(b'VmHWM:'):
+                    return int(line.split()[1]) * 1024
+    except (OSError, ValueError):
+        pass
     return None
 
 
+def _wait_process(proc, timeout):
+    """
+    Waits for a process to exit (setting its returncode), killing it if it runs for longer than timeout seconds.
+
+    On Linux, the ru_maxrss of a child includes the memory of the process that called exec to start it (cptools), so
+    the peak memory of the program is read from /proc while it runs instead.  ru_maxrss is only used when it's higher
+    than the peak memory of cptools, since it can't come from cptools then
+    :return: A tuple (TLE, ResourceUsage or None if it's not available on this platform)
+    """
+    if not hasattr(os, 'waitid'):  # Windows
+        try:
+            proc.wait(timeout=timeout)
+            return False, None
+        except sub.TimeoutExpired:
+            proc.kill()
+            proc.wait()
+            return True, None
+
+    # The process is only reaped once it has exited (with wait4, which gives its resource usage), so that it can be
+    # killed without the risk of its PID having been reused
+    exited = threading.Event()
+
+    def wait_exit():
+        try:
+            os.waitid(os.P_PID, proc.pid, os.WEXITED | os.WNOWAIT)
+        except ChildProcessError:
+            pass
+        finally:
+            exited.set()
+
+    threading.Thread(target=wait_exit, daemon=True).start()
+    poll_memory = sys.platform.startswith('linux')
+    peak = 0
+    intervals = iter(PEAK_MEMORY_POLL_INTERVALS)
+    deadline = time.perf_counter() + timeout
+    tle = False
+    while True:
+        if poll_memory:
+            peak = max(peak, _read_peak_memory(proc.pid) or 0)
+        remaining = deadline - time.perf_counter()
+        if remaining <= 0:
+            proc.kill()
+            exited.wait()
+            tle = True
+            break
+        wait_time = min(next(intervals, PEAK_MEMORY_POLL_INTERVALS[-1]), remaining) if poll_memory else remaining
+        if exited.wait(wait_time):
+            break
+
+    try:
+        _, status, rusage = os.wait4(proc.pid, 0)
+    except ChildProcessError:  # Reaped by someone else (i.e. SIGCHLD is ignored)
+        proc.returncode = 0
+        return tle, None
+    proc.returncode = os.waitstatus_to_exitcode(status)
+    max_rss = None
+    if poll_memory and ResourceUsage.rss_bytes(rusage.ru_maxrss) <= \
+            ResourceUsage.rss_bytes(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss):
+        max_rss = peak
+    return tle, ResourceUsage.from_rusage(rusage, max_rss)
+
+
+class _ForkServer:
+    """
+    Client for a fork server (see fork_server.py), which runs a Python source file in a forked child of a warm
+    interpreter instead of starting a new interpreter for every run.  A server handles one run at a time
+    """
+
+    def __init__(self, command, src_path):
+        """
+        :param command: The interpreter command (i.e. ['python3'])
+        :param src_path: Path to the source file
+        """
+        self.sock, server_sock = socket.socketpair()
+        try:
+            self.proc = sub.Popen(command + [FORK_SERVER_SCRIPT, str(server_sock.fileno()), src_path],
+                                  pass_fds=(server_sock.fileno(),))
+        finally:
+            server_sock.close()
+        self._recv()  # Wait until it's ready, so that its startup time isn't counted as part of the first run
+
+    def _recv(self):
+        header = self._recv_exact(4)
+        return json.loads(self._recv_exact(int.from_bytes(header, 'little')))
+
+    def _recv_exact(self, size):
+        data = b''
+        while len(data) < size:
+            chunk = self.sock.recv(size - len(data))
+            if not chunk:
+                raise ConnectionError('Fork server exited unexpectedly')
+            data += chunk
+        return data
+
+    def run(self, args, files, memory_limit, file_size_limit, cpus, timeout):
+        """
+        Runs the source file
+        :param args: Extra arguments (list of str)
+        :param files: The STDIN, STDOUT and STDERR files of the run
+        :param memory_limit: The memory limit in bytes, or 0 for no limit
+        :param file_size_limit: The maximum size of files written by the run in bytes, or 0 for no limit
+        :param cpus: The CPUs to pin the run to, or None to not pin it
+        :param timeout: The timeout in seconds
+        :return: A tuple (returncode, ResourceUsage, execution_time, TLE)
+        """
+        request = json.dumps({'args': args, 'memory_limit': memory_limit, 'file_size_limit': file_size_limit,
+                              'cpus': sorted(cpus) if cpus else None}).encode('utf8')
+        start_time = time.perf_counter()
+        socket.send_fds(self.sock, [len(request).to_bytes(4, 'little') + request], [f.fileno() for f in files])
+
+        self.sock.settimeout(None)
+        pid = self._recv()['pid']
+        self.sock.settimeout(max(timeout - (time.perf_counter() - start_time), 0))
+        try:
+            result = self._recv()
+            tle = False
+        except socket.timeout:
+            try:
+                os.kill(pid, signal.SIGKILL)
+            except ProcessLookupError:  # It finished just now
+                pass
+            self.sock.settimeout(None)
+            result = self._recv()
+            tle = True
+        elapsed = time.perf_counter() - start_time
+
+        user_time, sys_time, max_rss, ctx_switches = result['rusage']
+        usage = ResourceUsage(user_time, sys_time, ResourceUsage.rss_bytes(max_rss), ctx_switches)
+        return os.waitstatus_to_exitcode(result['status']), usage, elapsed, tle
+
+    def close(self):
+        self.sock.close()  # The server exits once the socket is closed
+        try:
+            self.proc.wait(1)
+        except sub.TimeoutExpired:
+            self.proc.kill()
+            self.proc.wait()
+
+
+class _CappedStream:
+    """
+    Reads an output pipe of a process in a background thread.  If more than limit bytes are written to it, the process
+    is killed right away, and only the last OUTPUT_TAIL_SIZE bytes of the output are kept from then on, so that a
+    program stuck printing in a loop can't use up memory
+    """
+
+    CHUNK_SIZE = 1 << 16
+
+    def __init__(self, pipe, limit, proc):
+        """
+        :param pipe: The pipe (a binary file)
+        :param limit: The maximum number of bytes, or 0 for no limit
+        :param proc: The Popen object of the process
+        """
+        self.pipe, self.limit, self.proc = pipe, limit, proc
+        self.data = bytearray()
+        self.total, self.exceeded = 0, False
+        self.thread = threading.Thread(target=self._read, daemon=True)
+        self.thread.start()
+
+    def _read(self):
+        while chunk := self.pipe.read1(self.CHUNK_SIZE):
+            self.total += len(chunk)
+            self.data += chunk
+            if self.limit and self.total > self.limit:
+                if not self.exceeded:
+                    self.exceeded = True
+                    self.proc.kill()
+                del self.data[:-OUTPUT_TAIL_SIZE]
+        self.pipe.close()
+
+    def text(self):
+        """
+        Returns the output decoded as a str (like text=True would).  If the output went over the limit, this is the last
+        OUTPUT_TAIL_SIZE bytes, following a line saying how much was left out
+        """
+        text = io.TextIOWrapper(io.BytesIO(self.data), errors='replace' if self.exceeded else None).read()
+        if self.exceeded:
+            return _omitted_line(self.total - len(self.data)) + text
+        return text
+
+
+def _omitted_line(size):
+    return f'[Output limit exceeded: {size} bytes not shown]\n'
+
+
+def _write_input(pipe, data):
+    try:
+        pipe.write(data)
+        pipe.close()
+    except BrokenPipeError:  # The process exited (or was killed) without reading all of its input
+        pass
+
+
+class OutputFile:
+    """
+    Output stream of a program that was spooled to a temporary file (see Executor.run_file) instead of being kept in
+    memory.  Evaluates to False if the stream is empty, like an empty str would
+    """
+
+    CHUNK_SIZE = 1 << 16
+
+    def __init__(self, file):
+        self.file = file
+        self.size = os.fstat(file.fileno()).st_size
+
+    def __bool__(self):
+        return self.size > 0
+
+    def mmap(self):
+        """
+        Returns a read-only memory map of the output (or an empty bytes object if the output is empty, since empty files
+        can't be memory-mapped)
+        """
+        if not self.size:
+            return b''
+        return mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def chunks(self, chunk_size=CHUNK_SIZE):
+        """
+        Yields the output as bytes objects of at most chunk_size bytes
+        """
+        self.file.seek(0)
+        while True:
+            chunk = self.file.read(chunk_size)
+            if not chunk:
+                break
+            yield chunk
+
+    def text(self, limit=None):
+        """
+        Returns the output decoded as a str
+        :param limit: If specified, only the first limit bytes are read
+        """
+        self.file.seek(0)
+        return str(self.file.read(-1 if limit is None else limit), 'utf8', errors='replace').replace('\r\n', '\n')
+
+    def tail(self):
+        """
+        Returns the last OUTPUT_TAIL_SIZE bytes of the output decoded as a str, following a line saying how much was
+        left out (if anything was).  Used to display outputs that went over the output limit
+        """
+        self.file.seek(max(self.size - OUTPUT_TAIL_SIZE, 0))
+        text = str(self.file.read(), 'utf8', errors='replace').replace('\r\n', '\n')
+        if self.size > OUTPUT_TAIL_SIZE:
+            return _omitted_line(self.size - OUTPUT_TAIL_SIZE) + text
+        return text
+
+    def close(self):
+        self.file.close()
+
+
 class Executor:
     def __init__(self, src_file, executor_info):
         self.src_file = src_file
         self.executor_info = executor_info
 
         self.exec_file, self.setup_passed = None, False
+        self.cache_hit = False
+
+        # Fork servers, if the executor has the fork_server option.  Each thread gets its own server
+        self._fork_servers = None
+        self._fork_servers_lock = threading.Lock()
 
         # Auxillary info
         if self.is_compiled():
@@ -30,15 +353,16 @@ class Executor:
         else:
             self.compile_command = None
 
-    def _sub_placeholder(self, fmt_str):
+    def _sub_placeholder(self, fmt_str, **extra):
         return fmt_str.format(
             src_path=self.src_file,
             src_name=os.path.splitext(self.src_file)[0],
-            exe_path=self.exec_file
+            exe_path=self.exec_file,
+            **extra
         )
 
-    def _sub_placeholder_list(self, fmt_list):
-        return [self._sub_placeholder(fmt_name) for fmt_name in fmt_list]
+    def _sub_placeholder_list(self, fmt_list, **extra):
+        return [self._sub_placeholder(fmt_name, **extra) for fmt_name in fmt_list]
 
     def is_compiled(self):
         return 'compiled' in self.executor_info
@@ -50,11 +374,23 @@ class Executor:
         """
 
         if self.is_compiled():
-            self.exec_file = self._sub_placeholder(self.executor_info['compiled']['exe_format'])
-            ctime = time.time()
-            sub.call(self._sub_placeholder_list(self.executor_info['compiled']['command']))
-            elapsed = time.time() - ctime
-            self.setup_passed = os.path.exists(self.exec_file)
+            with trace.span('compile', src=self.src_file):
+                self.exec_file = self._sub_placeholder(self.executor_info['compiled']['exe_format'])
+                command = self._sub_placeholder_list(self.executor_info['compiled']['command'])
+                ctime = time.perf_counter()
+
+                compile_cache = cache.get_compile_cache()
+                key = compile_cache and cache.compile_key(self.src_file, command)
+                self.cache_hit = bool(compile_cache) and compile_cache.get(key, self.exec_file)
+                if not self.cache_hit:
+                    if self.executor_info['compiled'].get('pch'):
+                        command = pch.add_pch(command, self.src_file, self.exec_file)
+                    ret = sub.call(command)
+                    if compile_cache and ret == 0 and os.path.exists(self.exec_file):
+                        compile_cache.put(key, self.exec_file)
+
+                elapsed = time.perf_counter() - ctime
+                self.setup_passed = os.path.exists(self.exec_file)
         else:
             self.setup_passed = True
             self.exec_file = self.src_file
@@ -62,31 +398,263 @@ class Executor:
 
         return elapsed
 
-    def run(self, input, command=None, *args):
+    @staticmethod
+    def _limit_resources(memory_limit, file_size_limit):
+        """
+        Run in the child process before the program is started, to apply resource limits
+        :param memory_limit: The memory limit in bytes, or 0 for no limit
+        :param file_size_limit: The maximum size of files written by the process in bytes, or 0 for no limit
+        """
+        if memory_limit:
+            resource.setrlimit(resource.RLIMIT_AS, (memory_limit, memory_limit))
+        if file_size_limit:
+            resource.setrlimit(resource.RLIMIT_FSIZE, (file_size_limit, file_size_limit))
+
+    @staticmethod
+    def _output_limit(judged):
+        """
+        Returns the output limit (in bytes) of a run, or 0 if there is none
+        """
+        return get_option('output_limit') * 1024 * 1024 if judged else 0
+
+    def _run_process(self, cmd, input, judged, output_files=None, **popen_kwargs):
+        """
+        Runs a process to completion (or until it times out), recording its resource usage
+        :param input: The input (str) if STDIN is a pipe, or None
+        :param output_files: If specified, a tuple of binary files that STDOUT and STDERR are written to.  They are
+        returned as OutputFile objects.  Otherwise, STDOUT and STDERR are captured (up to the output limit) and
+        returned as str
+        :return: A tuple (CompletedProcess, execution_time, TLE).  The CompletedProcess has three extra attributes:
+        usage, a ResourceUsage object (or None if it is not available on this platform), mle, a bool specifying whether
+        the process exceeded the memory limit, and ole, a bool specifying whether it exceeded the output limit
+        """
+
+        memory_limit = get_option('memory_limit') * 1024 * 1024 if judged and resource is not None else 0
+        output_limit = self._output_limit(judged)
+        # Output files are limited by the OS, and pipes by _CappedStream.  The file size limit is one byte above the
+        # output limit, so that going over it can be told apart from writing exactly the limit
+        file_size_limit = output_limit + 1 if output_files and output_limit and resource is not None else 0
+
+        if output_files:
+            popen_kwargs['stdout'], popen_kwargs['stderr'] = output_files
+        else:
+            popen_kwargs['stdout'] = popen_kwargs['stderr'] = sub.PIPE
+
+        with trace.span('run', cmd=cmd[0]), affinity.run_cpus(judged) as cpus:  # Held until the process exits
+            preexec_fn = None
+            if memory_limit or file_size_limit:
+                preexec_fn = functools.partial(self._limit_resources, memory_limit, file_size_limit)
+
+            start_time = time.perf_counter()
+            with trace.span('spawn'):
+                proc = sub.Popen(cmd, preexec_fn=preexec_fn, **popen_kwargs)
+                if cpus:
+                    # Pinned after it's started rather than in preexec_fn, which isn't safe with threads and keeps
+                    # subprocess from using vfork
+                    try:
+                        os.sched_setaffinity(proc.pid, cpus)
+                    except ProcessLookupError:  # Already exited
+                        pass
+            with proc:
+                streams = []
+                if not output_files:
+                    streams = [_CappedStream(proc.stdout, output_limit, proc),
+                               _CappedStream(proc.stderr, output_limit, proc)]
+                if input is not None:
+                    writer = threading.Thread(target=_write_input,
+                                              args=(proc.stdin, input.encode(locale.getpreferredencoding(False))),
+                                              daemon=True)
+                    writer.start()
+                tle, usage = _wait_process(proc, float(get_option('timeout')))
+                for stream in streams:
+                    stream.thread.join()
+            elapsed = time.perf_counter() - start_time
+
+        if output_files:
+            stdout, stderr = map(OutputFile, output_files)
+            ole = bool(file_size_limit) and any(f.size > output_limit for f in (stdout, stderr))
+        else:
+            stdout, stderr = (stream.text() for stream in streams)
+            ole = any(stream.exceeded for stream in streams)
+        res = sub.CompletedProcess(cmd, -1 if tle else proc.returncode, stdout, stderr)
+        res.usage = usage
+        res.ole = ole and not tle
+        res.mle = bool(memory_limit) and not tle and not res.ole and self._is_mle(res)
+        return res, elapsed, tle
+
+    @staticmethod
+    def _is_mle(res):
+        if res.usage and res.usage.max_rss >= get_option('memory_limit') * 1024 * 1024:
+            return True
+        if not res.returncode:
+            return False
+        # A process that failed to allocate memory usually crashes instead of going over the limit
+        stderr = res.stderr if type(res.stderr) == str else res.stderr.text(MLE_STDERR_SEARCH_LIMIT)
+        return any(marker in stderr for marker in MLE_STDERR_MARKERS)
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['_fork_servers'] = None  # The servers belong to the process that started them
+        state['_fork_servers_lock'] = None
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._fork_servers_lock = threading.Lock()
+
+    def _uses_fork_server(self, command):
+        return bool(self.executor_info.get('fork_server')) and command is None and hasattr(os, 'fork')
+
+    def _fork_server(self):
+        """
+        Returns the fork server of the current thread, starting it if needed
+        """
+        with self._fork_servers_lock:
+            if self._fork_servers is None or self._fork_servers[0] != os.getpid():  # Not started by this process
+                self._fork_servers = os.getpid(), threading.local(), []
+            _, local, servers = self._fork_servers
+            if getattr(local, 'server', None) is None:
+                command = self.executor_info['command']
+                if '{src_path}' not in command:
+                    raise ValueError('Executors with the fork_server option need {src_path} in their command')
+                local.server = _ForkServer(command[:command.index('{src_path}')], self.src_file)
+                servers.append(local.server)
+            return local.server
+
+    def _run_forked(self, args, stdin, output_files, judged):
+        """
+        Runs the program with a fork server.  Takes and returns the same things as _run_process, except that the
+        standard streams are always files
+        """
+        memory_limit = get_option('memory_limit') * 1024 * 1024 if judged and resource is not None else 0
+        output_limit = self._output_limit(judged) if resource is not None else 0
+        limits = memory_limit, output_limit + 1 if output_limit else 0  # See _run_process for the file size limit
+        files = (stdin,) + output_files
+        with trace.span('run', cmd=self.src_file, fork_server=True), affinity.run_cpus(judged) as cpus:
+            try:
+                returncode, usage, elapsed, tle = self._fork_server().run(args, files, *limits, cpus,
+                                                                           float(get_option('timeout')))
+            except (ConnectionError, OSError):  # The server died, so start a new one and try again
+                logging.debug('Restarting fork server', exc_info=True)
+                self._fork_server().close()
+                self._fork_servers[1].server = None
+                stdin.seek(0)
+                for f in output_files:
+                    f.seek(0)
+                    f.truncate()
+                returncode, usage, elapsed, tle = self._fork_server().run(args, files, *limits, cpus,
+                                                                           float(get_option('timeout')))
+
+        res = sub.CompletedProcess(self.executor_info['command'], -1 if tle else returncode,
+                                   *map(OutputFile, output_files))
+        res.usage = usage
+        res.ole = bool(output_limit) and not tle and any(f.size > output_limit for f in (res.stdout, res.stderr))
+        res.mle = bool(memory_limit) and not tle and not res.ole and self._is_mle(res)
+        return res, elapsed, tle
+
+    def run(self, input, command=None, *args, judged=True):
         """
         Runs the program
         :param input: stdin
         :param command: The command to run (optional and generally only for internals)
         :param args: Any extra process arguments to specify
-        :return: Returns a tuple (CompletedProcess, execution_time, TLE)
+        :param judged: Whether this is a run of the solution being judged (as opposed to a generator, reference
+        solution, or checker).  Resource limits are only applied to judged runs
+        :return: Returns a tuple (CompletedProcess, execution_time, TLE).  See _run_process for the extra attributes of
+        the CompletedProcess
         """
 
-        start_time = time.time()
+        if self._uses_fork_server(command):
+            with tempfile.TemporaryFile() as stdin, tempfile.TemporaryFile() as stdout, \
+                    tempfile.TemporaryFile() as stderr:
+                stdin.write(input.encode(locale.getpreferredencoding(False)))  # Like _run_process
+                stdin.seek(0)
+                res, elapsed, tle = self._run_forked(list(args), stdin, (stdout, stderr), judged)
+                if res.ole:
+                    res.stdout, res.stderr = (f.tail() for f in (res.stdout, res.stderr))
+                else:
+                    res.stdout, res.stderr = (self._decode(f) for f in (stdout, stderr))  # Like text=True
+                return res, elapsed, tle
+
+        return self._run_process(self._sub_placeholder_list(command or self.executor_info['command']) + list(args),
+                                 input, judged, stdin=sub.PIPE)
+
+    async def run_async(self, input, command=None, *args, judged=True):
+        """
+        Like run, but as a coroutine, so that other work can be done while the program runs.  The program is waited
+        for in a worker thread of the event loop, so timing, resource usage and fork servers work the same way as in run
+        :return: See run
+        """
+
+        return await asyncio.to_thread(self.run, input, command, *args, judged=judged)
+
+    def run_profiled(self, input, profile_path):
+        """
+        Runs the program under the profiler of its executor (see profiling.py).  The executor should have been made
+        with profiling.profile_executor_info
+        :param input: stdin
+        :param profile_path: The path that the profile data is written to (the {profile_path} placeholder)
+        :return: See run
+        """
+
+        profile = self.executor_info['profile']
+        cmd = self._sub_placeholder_list(profile.get('command', self.executor_info['command']),
+                                         profile_path=profile_path)
+        env = dict(os.environ, **{name: self._sub_placeholder(value, profile_path=profile_path)
+                                  for name, value in profile.get('env', {}).items()})
+        return self._run_process(cmd, input, True, stdin=sub.PIPE, env=env)
+
+    @staticmethod
+    def _decode(f):
+        f.seek(0)
+        return io.TextIOWrapper(f).read()
+
+    def run_file(self, input_file, *args, command=None, judged=True):
+        """
+        Runs the program with its STDIN read directly from a file and its STDOUT/STDERR spooled to temporary files, so
+        that large inputs and outputs are never held in memory
+        :param input_file: Path to the input file, or a binary file object opened for reading (read from the current
+        position)
+        :param args: Any extra process arguments to specify
+        :param command: The command to run (optional and generally only for internals)
+        :param judged: See run
+        :return: Returns a tuple (CompletedProcess, execution_time, TLE), where the stdout and stderr attributes of the
+        CompletedProcess are OutputFile objects instead of str
+        """
+
+        stdin = open(input_file, 'rb') if type(input_file) == str else input_file
+        outputs = tempfile.TemporaryFile(), tempfile.TemporaryFile()
+        cmd = self._sub_placeholder_list(command or self.executor_info['command']) + list(args)
+
         try:
-            res = sub.run(self._sub_placeholder_list(command or self.executor_info['command']) + list(args), text=True, input=input,
-                          stdout=sub.PIPE, stderr=sub.PIPE, timeout=float(get_option('timeout')))
-            return res, time.time() - start_time, False
-        except sub.TimeoutExpired as e:
-            # Sometimes returned as str, sometimes as bytes
-            stdout = str(e.stdout, 'utf8') if type(e.stdout) == bytes else (e.stdout or '')  # If stream output is None
-            stderr = str(e.stderr, 'utf8') if type(e.stderr) == bytes else (e.stderr or '')  # "
-            return sub.CompletedProcess([], -1, stdout, stderr), time.time() - start_time, True
+            if self._uses_fork_server(command):
+                return self._run_forked(list(args), stdin, outputs, judged)
+            return self._run_process(cmd, None, judged, outputs, stdin=stdin)
+        finally:
+            if stdin is not input_file:
+                stdin.close()
+
+    def popen(self, *args, command=None, **kwargs):
+        """
+        Starts the program without waiting for it, for programs that are interacted with while they run
+        :param args: Any extra process arguments to specify
+        :param command: The command to run (optional and generally only for internals)
+        :param kwargs: Keyword arguments to pass to subprocess.Popen
+        :return: The Popen object
+        """
+
+        return sub.Popen(self._sub_placeholder_list(command or self.executor_info['command']) + list(args), **kwargs)
 
     def cleanup(self):
         """
         Does any cleanup work needed (removing executables primarily)
         """
 
+        if self._fork_servers is not None and self._fork_servers[0] == os.getpid():
+            for server in self._fork_servers[2]:
+                server.close()
+            self._fork_servers = None
+
         if 'compiled' in self.executor_info:
             if os.path.exists(self.exec_file):
                 try:
@@ -96,13 +664,14 @@ class Executor:
                     logging.warning('The executable will not be removed (you can remove it manually)')
 
 
-def compile_source_file(src_file, executor=None):
+def compile_source_file(src_file, executor=None, profile=False):
     """
     Compiles a source file with the specified executor (if the language is compiled.  If it's interpreted then it simply returns the executor for the source file.
     If any errors occur, they'll be printed to STDOUT and the process will be halted.  Note that if no executor is specified, then the default executor for the source
     file will be used
     :param src_file: The source file
     :param executor: The executor, or None if the default executor for the source file should be used.
+    :param profile: Whether to set up the executor for profiling (see Executor.run_profiled)
     :return: The executor for the source file, with all setup processes (compilation) completed
     """
 
@@ -111,7 +680,10 @@ def compile_source_file(src_file, executor=None):
 
     # Compile
     try:
-        exc = Executor(src_file, get_executor(exc_name))
+        executor_info = get_executor(exc_name)
+        if profile:
+            executor_info = profiling.profile_executor_info(executor_info)
+        exc = Executor(src_file, executor_info)
     except ValueError as e:
         logging.error(e)
         common.exit()
@@ -126,6 +698,7 @@ def compile_source_file(src_file, executor=None):
     compile_time = exc.setup()
     if exc.is_compiled():
         logging.debug(f'Compile time: {compile_time:.3f}s')
+        logging.debug(f'Compile cache: {"hit" if exc.cache_hit else "miss"}')
 
     if not exc.setup_passed:
         logging.error('Compile failed!')
@@ -0,0 +1,167 @@
+"""
+Fork server for Python executors with the fork_server option.  This file is run as a script by the interpreter of the
+executor (so it only uses the standard library):
+
+    python3 fork_server.py <socket fd> <source path>
+
+It compiles the source file and imports commonly used modules once, and then forks a child to run the source for each
+request it gets on the socket, so that cases don't pay for interpreter startup.  The server sends {"ready": true} once it
+is ready to take requests.
+
+Messages are a 4-byte length followed by that many bytes of JSON.  A request is {"args": [...], "memory_limit": <bytes
+or 0>, "file_size_limit": <bytes or 0>, "cpus": <list of CPUs to pin the run to, or null>}, sent along with the STDIN,
+STDOUT and STDERR file descriptors of the run (SCM_RIGHTS).  The server replies with {"pid": <child pid>} as soon as the
+child is started, and {"status": <wait status>, "rusage": [user time, system time, max RSS, context switches]} once it
+exits.  The server exits when the socket is closed
+"""
+
+import atexit
+import json
+import os
+import signal
+import socket
+import struct
+import sys
+import traceback
+import types
+
+# Imported before forking, so that solutions don't pay for importing them
+PRELOAD_MODULES = ('array', 'bisect', 'collections', 'copy', 'decimal', 'fractions', 'functools', 'heapq', 'io',
+                   'itertools', 'math', 'operator', 'random', 're', 'string', 'typing')
+
+HEADER = struct.Struct('<I')
+
+
+def recv_exact(sock, size):
+    data = b''
+    while len(data) < size:
+        chunk = sock.recv(size - len(data))
+        if not chunk:
+            return None
+        data += chunk
+    return data
+
+
+def send_message(sock, obj):
+    data = json.dumps(obj).encode('utf8')
+    sock.sendall(HEADER.pack(len(data)) + data)
+
+
+def recv_request(sock):
+    """
+    Returns a tuple (request, fds), or None if the socket was closed
+    """
+    header, fds, _, _ = socket.recv_fds(sock, HEADER.size, 3)
+    if len(header) < HEADER.size:
+        rest = recv_exact(sock, HEADER.size - len(header)) if header else None
+        if rest is None:
+            return None
+        header += rest
+    data = recv_exact(sock, HEADER.unpack(header)[0])
+    if data is None:
+        return None
+    return json.loads(data), fds
+
+
+def run_child(code, src_path, args, memory_limit, file_size_limit, cpus, fds):
+    """
+    Runs the source in the (forked) child process, with its standard streams replaced by fds.  Never returns
+    """
+    for target, fd in enumerate(fds):
+        os.dup2(fd, target)
+        os.close(fd)
+    signal.signal(signal.SIGINT, signal.SIG_DFL)
+    if cpus:
+        os.sched_setaffinity(0, cpus)
+    if memory_limit or file_size_limit:
+        import resource
+        if memory_limit:
+            resource.setrlimit(resource.RLIMIT_AS, (memory_limit, memory_limit))
+        if file_size_limit:
+            resource.setrlimit(resource.RLIMIT_FSIZE, (file_size_limit, file_size_limit))
+
+    # Same setup as `python3 <src_path> <args...>`
+    sys.stdin = open(0, 'r', closefd=False)
+    sys.stdout = open(1, 'w', closefd=False)
+    sys.stderr = open(2, 'w', closefd=False, errors='backslashreplace')
+    sys.argv = [src_path] + args
+    main = types.ModuleType('__main__')
+    main.__file__ = src_path
+    sys.modules['__main__'] = main
+
+    code_ret = 0
+    try:
+        if isinstance(code, BaseException):  # The source failed to compile
+            traceback.print_exception(type(code), code, None)
+            code_ret = 1
+        else:
+            exec(code, main.__dict__)
+    except SystemExit as e:
+        if e.code is None:
+            code_ret = 0
+        elif isinstance(e.code, int):
+            code_ret = e.code
+        else:
+            print(e.code, file=sys.stderr)
+            code_ret = 1
+    except BaseException as e:
+        traceback.print_exception(type(e), e, e.__traceback__.tb_next)  # Without the frame of this function
+        code_ret = 1
+
+    # Like the interpreter, wait for non-daemon threads (solutions often run in a thread to get a bigger stack) and run
+    # exit handlers before exiting
+    threading = sys.modules.get('threading')
+    if threading is not None:
+        threading._shutdown()
+    atexit._run_exitfuncs()
+
+    try:
+        sys.stdout.flush()
+    except Exception:
+        code_ret = code_ret or 120  # Same exit code as the interpreter when flushing fails
+    try:
+        sys.stderr.flush()
+    except Exception:
+        pass
+    os._exit(code_ret & 0xFF)
+
+
+def main():
+    sock = socket.socket(fileno=int(sys.argv[1]))
+    src_path = sys.argv[2]
+    sys.path[0] = os.path.dirname(os.path.abspath(src_path))  # Instead of the directory of this script
+
+    for module in PRELOAD_MODULES:
+        __import__(module)
+    try:
+        with open(src_path, 'rb') as f:
+            code = compile(f.read(), src_path, 'exec')
+    except (SyntaxError, ValueError, OSError) as e:
+        code = e
+
+    signal.signal(signal.SIGINT, signal.SIG_IGN)  # The client handles Ctrl+C
+    send_message(sock, {'ready': True})
+    while True:
+        request = recv_request(sock)
+        if request is None:
+            break
+        obj, fds = request
+
+        sys.stdout.flush()
+        sys.stderr.flush()
+        pid = os.fork()
+        if pid == 0:
+            sock.close()
+            run_child(code, src_path, obj['args'], obj['memory_limit'], obj.get('file_size_limit', 0),
+                      obj.get('cpus'), fds)
+
+        for fd in fds:
+            os.close(fd)
+        send_message(sock, {'pid': pid})
+        _, status, rusage = os.wait4(pid, 0)
+        send_message(sock, {'status': status, 'rusage': [rusage.ru_utime, rusage.ru_stime, rusage.ru_maxrss,
+                                                         rusage.ru_nvcsw + rusage.ru_nivcsw]})
+
+
+if __name__ == '__main__':
+    main()
@@ -33,8 +33,9 @@ def write_cases_file(path, problem, checker=get_option("default_checker")):
             problem['tests'].append({'input': 'foo', 'output': 'bar'})  # Any sample sequence
 
         for case in problem['tests']:
-            inp = case['input'] + ('\n' if case['input'][-1] != '\n' else '')
-            out = case['output'] + ('\n' if case['output'][-1] != '\n' else '')
+            # Cases can be empty (i.e. a directory case without a .out file)
+            inp = case['input'] + ('\n' if case['input'] and case['input'][-1] != '\n' else '')
+            out = case['output'] + ('\n' if case['output'] and case['output'][-1] != '\n' else '')
 
             if len(inp) > 0:
                 f.write('  - in: |\n')
@@ -0,0 +1,86 @@
+import io
+import sys
+
+# Line that follows each case when a generator or reference solution handles multiple cases in one run
+CASE_DELIMITER = '=== cptools: end of case ==='
+
+
+def split_cases(text, count):
+    """
+    Splits the output of a batch run into the text of each case
+    :param text: The output, where each case is followed by a CASE_DELIMITER line
+    :param count: The expected number of cases
+    :return: A list of str, or None if the output does not contain exactly count cases
+    """
+    parts = text.replace('\r\n', '\n').split(CASE_DELIMITER + '\n')
+    if len(parts) != count + 1 or parts[-1]:
+        return None
+    return parts[:-1]
+
+
+def join_cases(cases):
+    """
+    Joins the text of multiple cases into the input of a batch run.  A newline is added to the end of a case if it does
+    not have one already
+    """
+    return ''.join(case + ('' if not case or case[-1] == '\n' else '\n') + CASE_DELIMITER + '\n' for case in cases)
+
+
+def _run_captured(fn, args, stdin):
+    old_streams = sys.stdin, sys.stdout, sys.stderr
+    sys.stdin, sys.stdout, sys.stderr = io.StringIO(stdin), io.StringIO(), io.StringIO()
+    try:
+        fn(*args)
+        return sys.stdout.getvalue(), sys.stderr.getvalue()
+    finally:
+        sys.stdin, sys.stdout, sys.stderr = old_streams
+
+
+def _batch_seeds():
+    if len(sys.argv) < 3:
+        return None
+    first, count = int(sys.argv[1]), int(sys.argv[2])
+    return range(first, first + count)
+
+
+def run_generator(generate):
+    """
+    Runs a generator that supports the batch protocol of cptools-stress-test.  When the stress test info file has a
+    batch option, the generator is given a first seed and a number of cases, and prints every case followed by a
+    delimiter line (on both STDOUT and STDERR).  Otherwise, it is given a single seed
+    :param generate: A function generate(seed) that prints a single case to STDOUT (and its output to STDERR if the
+    stress test has no reference solution)
+    """
+
+    seeds = _batch_seeds()
+    if seeds is None:
+        generate(int(sys.argv[1]))
+        return
+
+    outs, errs = [], []
+    for seed in seeds:
+        out, err = _run_captured(generate, (seed,), '')
+        outs.append(out)
+        errs.append(err)
+    sys.stdout.write(join_cases(outs))
+    sys.stderr.write(join_cases(errs))
+
+
+def run_solution(solve):
+    """
+    Runs a reference solution that supports the batch protocol of cptools-stress-test.  When the stress test info file
+    has the batch_slow option, the solution is given the inputs of all cases of a batch on STDIN, each followed by a
+    delimiter line, and prints the output of each case followed by a delimiter line.  Otherwise, it is given a single
+    case
+    :param solve: A function solve() that reads a single case from STDIN and prints its output to STDOUT
+    """
+
+    seeds = _batch_seeds()
+    if seeds is None:
+        solve()
+        return
+
+    inputs = split_cases(sys.stdin.read(), len(seeds))
+    if inputs is None:
+        raise ValueError(f'Expected {len(seeds)} cases on STDIN')
+    sys.stdout.write(join_cases(_run_captured(solve, (), case_in)[0] for case_in in inputs))
@@ -0,0 +1,21 @@
+import sys
+
+
+def run_stream_checker(check):
+    """
+    Runs a checker that uses the protocol of the custom-stream checker, calling check on each case until cptools closes
+    the checker's STDIN
+    :param check: A function check(input, expected, output) that returns 'OK' if output is accepted, and feedback
+    (str) otherwise
+    """
+
+    stdin, stdout = sys.stdin.buffer, sys.stdout.buffer
+    while True:
+        header = stdin.readline()
+        if not header.strip():
+            break
+
+        input, expected, output = (str(stdin.read(int(length)), 'utf8') for length in header.split())
+        feedback = check(input, expected, output).encode('utf8')
+        stdout.write(f'{len(feedback)}\n'.encode('utf8') + feedback)
+        stdout.flush()
@@ -0,0 +1,116 @@
+"""
+Precompiled headers for GCC executors with the pch option.  When the first include of a source file is one of the
+headers in the pch_headers config option (i.e. bits/stdc++.h), the header is precompiled with the same flags as the
+source (once, since precompiled headers are kept in .cptools/pch) and the directory containing it is added to the
+include path, so that GCC uses it instead of parsing the header again.  Precompiled headers are keyed by the header,
+compile flags and compiler version, so they are rebuilt whenever one of those changes
+"""
+
+import logging
+import os
+import re
+import shutil
+import subprocess as sub
+import tempfile
+
+import cptools.data as data
+from cptools.cache import hash_key, compiler_version
+
+FIRST_INCLUDE_REGEX = re.compile(rb'^\s*#\s*include\s*[<"]([^>"]+)[>"]', re.MULTILINE)
+
+# Maximum number of precompiled headers that are kept (they are around 100MB each).  The least recently used ones are
+# removed first
+MAX_PCH_COUNT = 8
+
+
+def first_include(src_path):
+    """
+    Returns the first header included by a source file, or None if it includes none
+    """
+    try:
+        with open(src_path, 'rb') as f:
+            match = FIRST_INCLUDE_REGEX.search(f.read())
+    except OSError:
+        return None
+    return match and str(match.group(1), 'utf8', errors='replace')
+
+
+def header_flags(command, src_path, exe_path):
+    """
+    Returns the flags of a compile command that also apply when compiling a header: all arguments except the compiler,
+    the source file and the output file
+    """
+    flags = []
+    args = iter(command[1:])
+    for arg in args:
+        if arg == '-o':
+            next(args, None)
+        elif arg not in (src_path, f'-o{exe_path}'):
+            flags.append(arg)
+    return flags
+
+
+def _evict():
+    entries = sorted(os.scandir(data.PCH_DIR), key=lambda entry: entry.stat().st_mtime, reverse=True)
+    for entry in entries[MAX_PCH_COUNT:]:
+        shutil.rmtree(entry.path, ignore_errors=True)
+
+
+def _build(pch_dir, compiler, flags, header):
+    """
+    Precompiles a header into <pch_dir>/include/<header>.gch.  The header is compiled from a file that includes it,
+    which is kept outside of the include directory so that the include directory doesn't contain the header itself
+    :return: True if the header was built successfully
+    """
+    gch_path = os.path.join(pch_dir, 'include', header + '.gch')
+    src_path = os.path.join(pch_dir, 'header.h')
+    tmp_path = None
+    try:
+        os.makedirs(os.path.dirname(gch_path), exist_ok=True)
+        with open(src_path, 'w') as f:
+            f.write(f'#include <{header}>\n')
+
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(gch_path), prefix='.tmp')
+        os.close(fd)
+        res = sub.run([compiler] + flags + ['-x', 'c++-header', src_path, '-o', tmp_path], stdout=sub.PIPE,
+                      stderr=sub.PIPE)
+        if res.returncode != 0:
+            logging.warning(f'Could not precompile {header}, compiling without it (Error: '
+                            f'{str(res.stderr, "utf8", errors="replace").strip()})')
+            return False
+        os.replace(tmp_path, gch_path)  # Atomic, so that other processes never use a partially written header
+    except OSError as e:
+        logging.warning(f'Could not precompile {header}, compiling without it (Error: {e})')
+        return False
+    finally:
+        if tmp_path and os.path.exists(tmp_path):
+            os.unlink(tmp_path)
+    return True
+
+
+def add_pch(command, src_path, exe_path):
+    """
+    Returns a compile command that uses a precompiled header for the source file, building the precompiled header if it
+    doesn't exist yet
+    :param command: The compile command, with placeholders substituted
+    :param src_path: Path to the source file
+    :param exe_path: Path to the executable
+    :return: The new command, or command itself if the source file doesn't start with one of the pch_headers or the
+    header could not be precompiled
+    """
+    header = first_include(src_path)
+    if header not in data.get_option('pch_headers'):
+        return command
+
+    compiler, flags = command[0], header_flags(command, src_path, exe_path)
+    pch_dir = os.path.join(data.PCH_DIR, hash_key(header, '\0'.join(flags), compiler_version(compiler))[:32])
+    gch_path = os.path.join(pch_dir, 'include', header + '.gch')
+    if os.path.exists(gch_path):
+        os.utime(pch_dir)
+    else:
+        logging.info(f'Precompiling {header} (only done once for each set of compile flags)...')
+        if not _build(pch_dir, compiler, flags, header):
+            return command
+        _evict()
+
+    return [compiler, '-I', os.path.join(pch_dir, 'include')] + command[1:]
@@ -0,0 +1,139 @@
+"""
+Profiling of solutions (cptools-run --profile).  Executors that support profiling have a profile node saying how to
+build and run a source file under a profiler:
+
+    profile:
+      compile_flags: ['-pg']                      # Compiled executors only: extra flags for the profiling build
+      command: ['python3', '-m', 'cProfile', ...]  # Command to run the program with (default: the executor's command)
+      env: {GMON_OUT_PREFIX: '{profile_path}'}     # Extra environment variables (optional)
+      report: gprof                               # Format of the profile data: cprofile or gprof
+
+The command and env are templated like the executor's command, with the extra {profile_path} placeholder: the path that
+the profile data of a run should be written to.  gprof data is written to {profile_path}.<pid>, since GMON_OUT_PREFIX
+adds the process ID
+"""
+
+import glob
+import os
+import pstats
+import re
+import subprocess as sub
+from collections import namedtuple
+
+# Executable of the profiling build of compiled executors (so that it doesn't replace the normal build)
+PROFILE_EXE_FORMAT = '{src_name}.prof.exe'
+
+# Rows of the flat profile of gprof: %time, cumulative seconds, self seconds, and then calls, self time per call and
+# total time per call (only for functions that were compiled with -pg, rounded and in a unit that depends on the times),
+# and the name
+GPROF_ROW_REGEX = re.compile(r'^\s*[\d.]+\s+[\d.]+\s+([\d.]+)\s+(?:(\d+)\s+[\d.]+\s+[\d.]+\s+)?(\S.*)$')
+# Primary lines of the call graph of gprof: [index], %time, self seconds, children seconds, calls (if known, with
+# recursive calls after a +), and the name, followed by the cycle it's part of (if any) and the index
+GPROF_CALL_GRAPH_REGEX = re.compile(r'^\[\d+\]\s+[\d.]+\s+([\d.]+)\s+([\d.]+)\s+(?:[\d+]+\s+)?'
+                                    r'(\S.*?)(?: <cycle \d+>)? \[\d+\]$')
+
+HotFunction = namedtuple('HotFunction', 'name self_time total_time calls')
+
+
+def profile_executor_info(executor_info):
+    """
+    Returns the executor info (see executors.yml) for profiling with an executor.  For compiled executors, the source
+    file is compiled with the compile_flags of the profile node added, to a separate executable
+    :raises ValueError: If the executor doesn't support profiling
+    """
+    if 'profile' not in executor_info:
+        raise ValueError('The executor does not support profiling (it has no profile node)')
+
+    info = dict(executor_info)
+    info.pop('fork_server', None)  # Runs use the profile command instead
+    if 'compiled' in info:
+        command = info['compiled']['command']
+        info['compiled'] = dict(info['compiled'], exe_format=PROFILE_EXE_FORMAT,
+                                command=command[:1] + info['profile'].get('compile_flags', []) + command[1:])
+    return info
+
+
+def data_files(report, profile_path):
+    """
+    Returns the paths of the profile data written by a run
+    :param report: The report option of the executor's profile node
+    :param profile_path: The {profile_path} of the run
+    """
+    if report == 'gprof':
+        return sorted(glob.glob(glob.escape(profile_path) + '.*'))
+    return [profile_path] if os.path.exists(profile_path) else []
+
+
+def _cprofile_functions(paths, _exe_path):
+    stats = pstats.Stats(*paths).stats
+    functions = []
+    for (file, line, name), (_, calls, self_time, total_time, _) in stats.items():
+        if file != '~':  # Built-in functions are only named
+            name = f'{name} ({os.path.basename(file)}:{line})'
+        functions.append(HotFunction(name, self_time, total_time, calls))
+    return functions
+
+
+def _gprof_functions(paths, exe_path):
+    res = sub.run(['gprof', '-b', '-p', '-q', exe_path] + paths, stdout=sub.PIPE, stderr=sub.PIPE)
+    if res.returncode != 0:
+        raise OSError(str(res.stderr, 'utf8', errors='replace').strip())
+    flat_profile, _, call_graph = str(res.stdout, 'utf8', errors='replace').partition('Call graph')
+
+    # The total time of a function is its self time plus the time of its children in the call graph
+    total_times = {}
+    for line in call_graph.splitlines():
+        match = GPROF_CALL_GRAPH_REGEX.match(line)
+        if match:
+            self_time, children_time, name = match.groups()
+            total_times[name] = float(self_time) + float(children_time)
+
+    functions = []
+    for line in flat_profile.splitlines():
+        match = GPROF_ROW_REGEX.match(line)
+        if match:
+            self_time, calls, name = match.groups()
+            name = name.strip()
+            functions.append(HotFunction(name, float(self_time), total_times.get(name), int(calls) if calls else None))
+    return functions
+
+
+REPORTERS = {
+    'cprofile': _cprofile_functions,
+    'gprof': _gprof_functions
+}
+
+
+def hot_functions(report, paths, exe_path):
+    """
+    Reads profile data.  Data from several runs is added up
+    :param report: The report option of the executor's profile node
+    :param paths: Paths to the profile data of the runs
+    :param exe_path: Path to the executable that was profiled
+    :return: A list of HotFunction (self_time and total_time are in seconds, and total_time and calls can be None if
+    unknown), from highest to lowest self time
+    :raises OSError: If the data could not be read
+    """
+    if not paths:
+        return []
+    try:
+        functions = REPORTERS[report](paths, exe_path)
+    except (TypeError, ValueError, EOFError) as e:  # Raised by pstats for invalid files
+        raise OSError(f'Invalid profile data ({e})')
+    return sorted(functions, key=lambda f: f.self_time, reverse=True)
+
+
+def format_functions(functions, limit):
+    """
+    Formats the first limit hot functions as a table
+    :return: A list of lines
+    """
+    if not functions:
+        return ['No profile data (the program may have been killed before it could write it)']
+
+    lines = [f'{"Self":>9} {"Total":>9} {"Calls":>9}  Function']
+    for f in functions[:limit]:
+        total = '?' if f.total_time is None else f'{f.total_time:.3f}s'
+        calls = '?' if f.calls is None else str(f.calls)
+        lines.append(f'{f.self_time:8.3f}s {total:>9} {calls:>9}  {f.name}')
+    return lines
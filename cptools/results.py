@@ -0,0 +1,172 @@
+"""
+Append-only store of cptools-run results, kept in an SQLite database in the workspace's data folder.  Every run of a
+source file on a data file is recorded along with the verdict, time and resource usage of each of its cases
+"""
+
+import hashlib
+import os
+import sqlite3
+import time
+from collections import namedtuple
+
+import cptools.data as data
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS runs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    time REAL NOT NULL,
+    src_path TEXT NOT NULL,
+    src_hash TEXT NOT NULL,
+    data_path TEXT NOT NULL,
+    data_hash TEXT NOT NULL,
+    executor TEXT NOT NULL,
+    checker TEXT NOT NULL,
+    bench_runs INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS runs_src ON runs (src_path, data_path, id);
+CREATE INDEX IF NOT EXISTS runs_src_hash ON runs (src_hash);
+
+CREATE TABLE IF NOT EXISTS cases (
+    run_id INTEGER NOT NULL REFERENCES runs (id) ON DELETE CASCADE,
+    case_index INTEGER NOT NULL,
+    verdict TEXT NOT NULL,
+    wall_time REAL,
+    user_time REAL,
+    sys_time REAL,
+    max_rss INTEGER,
+    feedback TEXT,
+    PRIMARY KEY (run_id, case_index)
+);
+'''
+
+RunRecord = namedtuple('RunRecord', 'id time src_path src_hash data_path data_hash executor checker bench_runs '
+                                    'case_count ac_count')
+CaseRecord = namedtuple('CaseRecord', 'run_id index verdict wall_time user_time sys_time max_rss feedback')
+
+RUN_COLUMNS = 'runs.id, runs.time, src_path, src_hash, data_path, data_hash, executor, checker, bench_runs, ' \
+              'COUNT(cases.case_index), COALESCE(SUM(cases.verdict = \'AC\'), 0)'
+CASE_COLUMNS = 'run_id, case_index, verdict, wall_time, user_time, sys_time, max_rss, feedback'
+
+
+def connect(path=data.RESULTS_DB_PATH):
+    """
+    Opens the results database, creating it if it does not exist
+    :param path: Path to the database
+    """
+    dir_name = os.path.dirname(path)
+    if dir_name:
+        os.makedirs(dir_name, exist_ok=True)
+    conn = sqlite3.connect(path, timeout=30)  # Other cptools processes may be writing at the same time
+    conn.execute('PRAGMA foreign_keys = ON')
+    conn.executescript(SCHEMA)
+    return conn
+
+
+def file_hash(path):
+    """
+    Returns the SHA-256 hex digest of the content of a file
+    """
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 16), b''):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def data_hash(path):
+    """
+    Returns a hex digest identifying a data file or test set directory.  For directories, the names, sizes and
+    modification times of the files are hashed instead of their content, which could be large
+    """
+    if not os.path.isdir(path):
+        return file_hash(path)
+    h = hashlib.sha256()
+    for entry in sorted(os.scandir(path), key=lambda entry: entry.name):
+        stat = entry.stat()
+        h.update(f'{entry.name}\0{stat.st_size}\0{stat.st_mtime_ns}\n'.encode('utf8'))
+    return h.hexdigest()
+
+
+def add_run(conn, src_path, data_path, executor, checker, bench_runs, cases):
+    """
+    Records a run in the database
+    :param conn: The database connection
+    :param src_path: Path to the source file that was run
+    :param data_path: Path to the data file or test set directory that the cases are from
+    :param executor: Name of the executor used
+    :param checker: The checker string of the data file
+    :param bench_runs: The number of times each case was run (the recorded wall time is the median of them)
+    :param cases: A list of tuples (case index, verdict, wall time, ResourceUsage or None, feedback or None)
+    :return: The id of the new run
+    """
+    with conn:
+        run_id = conn.execute(
+            'INSERT INTO runs (time, src_path, src_hash, data_path, data_hash, executor, checker, bench_runs) '
+            'VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+            (time.time(), os.path.abspath(src_path), file_hash(src_path), os.path.abspath(data_path),
+             data_hash(data_path), executor, checker, bench_runs)).lastrowid
+        conn.executemany(
+            f'INSERT INTO cases ({CASE_COLUMNS}) VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+            ((run_id, index, verdict, wall_time, usage and usage.user_time, usage and usage.sys_time,
+              usage and usage.max_rss, feedback) for index, verdict, wall_time, usage, feedback in cases))
+    return run_id
+
+
+def _filters(src_path, data_path):
+    clauses, params = [], []
+    if src_path is not None:
+        clauses.append('src_path = ?')
+        params.append(os.path.abspath(src_path))
+    if data_path is not None:
+        clauses.append('data_path = ?')
+        params.append(os.path.abspath(data_path))
+    return (' WHERE ' + ' AND '.join(clauses) if clauses else ''), params
+
+
+def get_runs(conn, src_path=None, data_path=None, limit=None):
+    """
+    Returns a list of RunRecord objects for the most recent runs, newest first
+    :param src_path: If specified, only runs of this source file are returned
+    :param data_path: If specified, only runs on this data file are returned
+    :param limit: The maximum number of runs to return, or None for no limit
+    """
+    where, params = _filters(src_path, data_path)
+    query = f'SELECT {RUN_COLUMNS} FROM runs LEFT JOIN cases ON cases.run_id = runs.id{where} ' \
+            f'GROUP BY runs.id ORDER BY runs.id DESC'
+    if limit is not None:
+        query += ' LIMIT ?'
+        params.append(limit)
+    return [RunRecord(*row) for row in conn.execute(query, params)]
+
+
+def get_run(conn, run_id):
+    """
+    Returns the RunRecord with the given id, or None if there is none
+    """
+    row = conn.execute(f'SELECT {RUN_COLUMNS} FROM runs LEFT JOIN cases ON cases.run_id = runs.id WHERE runs.id = ? '
+                       f'GROUP BY runs.id', (run_id,)).fetchone()
+    return row and RunRecord(*row)
+
+
+def get_cases(conn, run_ids):
+    """
+    Returns the CaseRecord objects of the given runs, ordered by run and then by case index
+    :param run_ids: A list of run ids
+    """
+    if not run_ids:
+        return []
+    placeholders = ', '.join('?' * len(run_ids))
+    return [CaseRecord(*row) for row in conn.execute(
+        f'SELECT {CASE_COLUMNS} FROM cases WHERE run_id IN ({placeholders}) ORDER BY run_id, case_index', run_ids)]
+
+
+def clear(conn, src_path=None, data_path=None):
+    """
+    Deletes runs (and their cases) from the database
+    :param src_path: If specified, only runs of this source file are deleted
+    :param data_path: If specified, only runs on this data file are deleted
+    :return: The number of runs deleted
+    """
+    where, params = _filters(src_path, data_path)
+    with conn:
+        return conn.execute(f'DELETE FROM runs{where}', params).rowcount
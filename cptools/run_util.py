@@ -0,0 +1,215 @@
+import functools
+import logging
+import math
+import os
+import statistics
+from collections import deque, namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+import yaml
+from colorama import Fore
+
+import cptools.cases as cases
+import cptools.common as common
+import cptools.data as data
+
+
+def resolve_jobs(jobs):
+    """
+    Returns the actual number of workers to use for a --jobs option
+    :param jobs: The value of the option.  Values <= 0 mean "use all available cores"
+    """
+    if jobs is None:
+        return 1
+    if jobs <= 0:
+        return os.cpu_count() or 1
+    return jobs
+
+
+def load_cases(data_file):
+    """
+    Loads and validates a data (.yml) file or test set directory (see cases.py), exiting if it is invalid.  The input
+    and output of each case are made to end with a newline
+    :param data_file: Path to the data file or directory
+    :return: The data object (a dict with the keys checker and cases).  For directories, cases is a DirectoryCases
+    object, which only reads a case when it is accessed
+    """
+
+    logging.info('Loading test data...')
+
+    if not os.path.exists(data_file):
+        logging.error('Data file does not exist!')
+        common.exit()
+
+    if os.path.isdir(data_file):
+        try:
+            return cases.load_directory(data_file)
+        except (OSError, ValueError, yaml.YAMLError) as e:
+            logging.error(f'Error while loading test set directory: {e}')
+            common.exit()
+
+    try:
+        with open(data_file) as f:
+            tests = yaml.unsafe_load(f.read())
+            msg = data.validate_data_object(tests)
+            if msg:
+                logging.error(f'Error while parsing data: {msg}')
+                common.exit()
+
+            for case in tests['cases']:
+                if case['in'] and case['in'][-1] != '\n':
+                    case['in'] += '\n'
+                if case['out'] and case['out'][-1] != '\n':
+                    case['out'] += '\n'
+    except KeyError or IndexError:
+        logging.error(f'Malformed test data. {Fore.RED}', exc_info=True)
+        common.exit()
+
+    return tests
+
+
+def judge(res, tle, checker, checker_str, case):
+    """
+    Returns the verdict of a run of a case as a tuple (verdict, feedback).  The verdict is one of AC, WA, TLE, MLE, OLE
+    or RTE, and the feedback is the checker's feedback (or None if the checker wasn't used)
+    :param res: The CompletedProcess object returned by Executor.run
+    :param tle: Whether the run timed out
+    :param checker: The (already setup) Checker object
+    :param checker_str: The checker string from the data file
+    :param case: The case (a dict with the keys in and out)
+    """
+
+    if tle:
+        return 'TLE', None
+    if res.mle:
+        return 'MLE', None
+    if res.ole:
+        return 'OLE', None
+    if res.stderr or res.returncode:
+        return 'RTE', None
+    if not case['out'] and not checker_str.startswith('custom'):
+        return 'AC', ''
+    ac, feedback = checker.check(case['in'], case['out'], res.stdout)
+    return ('AC' if ac else 'WA'), feedback
+
+
+def run_ordered(fn, items, jobs):
+    """
+    Calls fn on each item, running up to jobs calls concurrently, and yields the results in the same order as items.
+    Each result is yielded as a zero-argument callable which returns the return value of fn (or raises the exception
+    that fn raised), so that callers can handle errors on a per-item basis.
+    :param fn: The function to call on each item
+    :param items: An iterable of items
+    :param jobs: The maximum number of concurrent calls.  If jobs <= 1, the calls are done lazily in the calling thread
+    (i.e. the next call is only done once the previous result has been consumed)
+    """
+
+    if jobs <= 1:
+        for item in items:
+            yield functools.partial(fn, item)
+        return
+
+    it = iter(items)
+    pool = ThreadPoolExecutor(jobs)
+    try:
+        pending = deque()
+        for item in it:  # Keep a few calls queued up ahead of the workers so they're never idle
+            pending.append(pool.submit(fn, item))
+            if len(pending) >= jobs * 2:
+                break
+
+        while pending:
+            fut = pending.popleft()
+            for item in it:
+                pending.append(pool.submit(fn, item))
+                break
+            yield fut.result
+    finally:
+        pool.shutdown(wait=True, cancel_futures=True)
+
+
+def format_memory(usage):
+    """
+    Returns the peak memory of a ResourceUsage object (which may be None) as a str
+    """
+    if usage is None:
+        return 'N/A'
+    return f'{usage.max_rss / (1 << 20):.1f} MB'
+
+
+def format_usage(usage):
+    """
+    Returns a summary of a ResourceUsage object (which may be None) as a str
+    """
+    if usage is None:
+        return 'Resource usage not available'
+    return f'CPU: {usage.user_time:.3f}s user, {usage.sys_time:.3f}s sys | Peak Memory: {format_memory(usage)} | ' \
+           f'Context Switches: {usage.ctx_switches}'
+
+
+BenchStats = namedtuple('BenchStats', 'min median p95 stdev')
+MANN_WHITNEY_EXACT_LIMIT = 400  # Maximum product of the sample sizes for which the exact test is used
+
+
+def bench_stats(samples):
+    """
+    Returns a BenchStats object summarizing a list of timing samples (in seconds).  The 95th percentile uses the
+    nearest-rank method, so it is always one of the samples
+    :param samples: A non-empty list of samples
+    """
+    ordered = sorted(samples)
+    p95 = ordered[max(0, math.ceil(len(ordered) * 0.95) - 1)]
+    stdev = statistics.stdev(ordered) if len(ordered) > 1 else 0.
+    return BenchStats(ordered[0], statistics.median(ordered), p95, stdev)
+
+
+def format_bench_stats(stats):
+    """
+    Returns a BenchStats object as a str
+    """
+    return f'min {stats.min:.3f}s | median {stats.median:.3f}s | p95 {stats.p95:.3f}s | stdev {stats.stdev:.3f}s'
+
+
+def mann_whitney_p(a, b):
+    """
+    Returns the two-sided p-value of the Mann-Whitney U test for whether the samples a and b come from the same
+    distribution.  The exact distribution of U is used for small samples (ignoring ties), and the normal approximation
+    (with a tie correction) otherwise
+    :param a: A non-empty list of samples
+    :param b: A non-empty list of samples
+    """
+    n1, n2 = len(a), len(b)
+    ranked = sorted([(x, 0) for x in a] + [(x, 1) for x in b])
+
+    # Ranks, with tied values getting the average of their ranks
+    rank_sum, tie_term, i = 0., 0, 0
+    while i < len(ranked):
+        j = i
+        while j < len(ranked) and ranked[j][0] == ranked[i][0]:
+            j += 1
+        rank_sum += (i + j + 1) / 2 * sum(1 for _, group in ranked[i:j] if group == 0)
+        tie_term += (j - i) ** 3 - (j - i)
+        i = j
+    u = rank_sum - n1 * (n1 + 1) / 2
+    u = min(u, n1 * n2 - u)
+
+    if n1 * n2 <= MANN_WHITNEY_EXACT_LIMIT:
+        # counts[k] = number of ways for the first m elements of a to get U = k, over all orderings of the samples
+        counts = [[1] + [0] * (n1 * n2) for _ in range(n2 + 1)]  # counts[j][k] for n1 = 0
+        for m in range(1, n1 + 1):
+            new_counts = [[0] * (n1 * n2 + 1) for _ in range(n2 + 1)]
+            new_counts[0][0] = 1
+            for j in range(1, n2 + 1):
+                for k in range(m * j + 1):
+                    # The largest element is either from a (adding j to U) or from b
+                    new_counts[j][k] = (counts[j][k - j] if k >= j else 0) + new_counts[j - 1][k]
+            counts = new_counts
+        dist = counts[n2]
+        return min(1., 2 * sum(dist[:math.floor(u) + 1]) / math.comb(n1 + n2, n1))
+
+    n = n1 + n2
+    sigma = math.sqrt(n1 * n2 / 12 * ((n + 1) - tie_term / (n * (n - 1))))
+    if sigma == 0:
+        return 1.
+    z = (n1 * n2 / 2 - u - 0.5) / sigma  # With continuity correction
+    return min(1., math.erfc(max(z, 0.) / math.sqrt(2)))
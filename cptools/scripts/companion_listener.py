@@ -2,8 +2,11 @@ import argparse
 import json
 import logging
 import os
+import queue
 import string
-from http.server import HTTPServer, BaseHTTPRequestHandler
+import threading
+import time
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
 
 from cptools.data import get_option
 from cptools.gen import write_cases_file, try_write_source_file
@@ -22,37 +25,130 @@ def fix_name(name: str):
         .translate(str.maketrans('', '', TO_REMOVE))
 
 
+def reserve_name(name, src_lang):
+    """
+    Picks a unique name for the files of a problem in the save directory, by adding a number to the name if needed.
+    The name is reserved by creating its (empty) data file with O_EXCL, so concurrent requests never get the same name
+    :param name: The fixed problem name
+    :param src_lang: The extension of source files (i.e. ".cpp")
+    :return: The path of the files without an extension
+    """
+    fname = name
+    ctr = 1
+    while True:
+        path = os.path.join(save_path, fname)
+        if fname and not os.path.exists(path + src_lang):
+            try:
+                os.close(os.open(path + '.yml', os.O_CREAT | os.O_EXCL | os.O_WRONLY, 0o666))
+                return path
+            except FileExistsError:
+                pass
+        fname = name + str(ctr)
+        ctr += 1
+
+
+class ListenerStats:
+    """
+    Counters shown by the /stats endpoint.  Updated by the request handler threads and the writer thread
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.requests = self.rejected = self.written = self.write_errors = 0
+        self.total_latency = self.max_latency = 0.
+        self.total_write_time = 0.
+
+    def record_request(self, latency, accepted):
+        with self.lock:
+            self.requests += 1
+            self.rejected += not accepted
+            self.total_latency += latency
+            self.max_latency = max(self.max_latency, latency)
+
+    def record_write(self, elapsed, ok):
+        with self.lock:
+            self.written += ok
+            self.write_errors += not ok
+            self.total_write_time += elapsed
+
+    def to_dict(self, pending_writes):
+        with self.lock:
+            return {
+                'requests': self.requests,
+                'rejected': self.rejected,
+                'written': self.written,
+                'write_errors': self.write_errors,
+                'pending_writes': pending_writes,
+                'mean_latency_ms': self.total_latency / max(self.requests, 1) * 1000,
+                'max_latency_ms': self.max_latency * 1000,
+                'mean_write_time_ms': self.total_write_time / max(self.written + self.write_errors, 1) * 1000
+            }
+
+
+def write_files(jobs):
+    """
+    Writes the data and source files of received problems, in the order that they were received.  Run in a background
+    thread, so that requests are acknowledged without waiting for their files.  Stops when it gets None
+    :param jobs: A queue of tuples (path without extension, problem object, source file extension)
+    """
+    while (job := jobs.get()) is not None:
+        path, problem, src_lang = job
+        start = time.perf_counter()
+        try:
+            write_cases_file(path + '.yml', problem)
+            if not args.skip_source_file:
+                try_write_source_file(path, src_lang)
+            logging.info(f'Wrote {path}.yml')
+            ok = True
+        except (OSError, KeyError, TypeError, IndexError) as e:
+            logging.error(f'Could not write files for {path} (Error: {e})')
+            ok = False
+        stats.record_write(time.perf_counter() - start, ok)
+
+
+class ListenerServer(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 64  # Competitive Companion can send a whole contest at once
+
+
 # Source: https://gist.github.com/mdonkers/63e115cc0c79b4f6b8b3a6b797e485c7
 class RequestHandler(BaseHTTPRequestHandler):
-    def _set_response(self):
-        self.send_response(200)
-        self.send_header('Content-type', 'text/html')
+    def _set_response(self, code=200, content_type='text/html'):
+        self.send_response(code)
+        self.send_header('Content-type', content_type)
         self.end_headers()
 
-    def do_POST(self):
-        content_length = int(self.headers['Content-Length'])  # <--- Gets the size of data
-        problem = json.loads(self.rfile.read(content_length))  # <--- Gets the data itself
+    def do_GET(self):
+        if self.path.rstrip('/') != '/stats':
+            self._set_response(404)
+            return
 
-        name = fix_name(problem['name'].strip())
-        logging.info(
-            f'Received problem "{name}" from {problem["group"]}.  Contains {len(problem["tests"])} sample cases')
-
-        self._set_response()
-        self.wfile.write("POST request for {}".format(self.path).encode('utf-8'))
+        self._set_response(content_type='application/json')
+        self.wfile.write(json.dumps(stats.to_dict(write_queue.qsize())).encode('utf-8'))
 
-        # Make name unique
+    def do_POST(self):
+        start = time.perf_counter()
+        try:
+            content_length = int(self.headers['Content-Length'])  # <--- Gets the size of data
+            problem = json.loads(self.rfile.read(content_length))  # <--- Gets the data itself
+            name = fix_name(problem['name'].strip())
+            group, tests = problem['group'], problem['tests']
+        except (TypeError, ValueError, KeyError, AttributeError) as e:
+            logging.error(f'Received invalid problem data (Error: {e})')
+            self._set_response(400)
+            stats.record_request(time.perf_counter() - start, False)
+            return
+
+        logging.info(f'Received problem "{name}" from {group}.  Contains {len(tests)} sample cases')
+
+        # Reserve a unique name and leave writing the files to the writer thread
         src_lang = os.path.splitext(get_option('template_path'))[1]
+        path = reserve_name(name, src_lang)
+        write_queue.put((path, problem, src_lang))
 
-        fname = name
-        ctr = 1
-        while not fname or os.path.exists(fname + '.yml') or os.path.exists(fname + src_lang):
-            fname = name + str(ctr)
-            ctr += 1
-
-        # Write case file and source file
-        write_cases_file(os.path.join(save_path, fname + '.yml'), problem)
-        if not args.skip_source_file:
-            try_write_source_file(os.path.join(save_path, fname), src_lang)
+        self._set_response()
+        self.wfile.write("POST request for {}".format(self.path).encode('utf-8'))
+        stats.record_request(time.perf_counter() - start, True)
 
     # Source: https://stackoverflow.com/questions/3389305/how-to-silent-quiet-httpserver-and-basichttprequesthandlers-stderr-output
     # Silences pesky log messages
@@ -71,6 +167,8 @@ parser.add_argument('-ss', '--skip-source-file', help='Don\'t autogenerate sourc
                     action='store_true')
 save_path = None
 args = None
+stats = ListenerStats()
+write_queue = queue.Queue()
 
 
 def main():
@@ -86,5 +184,16 @@ def main():
 
     port = args.port or DEFAULT_PORT
     logging.info(f'Starting HTTP server on port {port}...')
-    server = HTTPServer(('localhost', port), RequestHandler)
-    server.serve_forever()
+    server = ListenerServer(('localhost', port), RequestHandler)
+    logging.info(f'Stats are available at http://localhost:{port}/stats')
+
+    writer = threading.Thread(target=write_files, args=(write_queue,))
+    writer.start()
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        logging.info('Stopping...')
+    finally:
+        server.server_close()
+        write_queue.put(None)  # Files of problems that were already received are still written
+        writer.join()
@@ -0,0 +1,146 @@
+import argparse
+import logging
+import os
+import statistics
+
+from colorama import Style, Fore
+
+import cptools.data as data
+import cptools.common as common
+from cptools.checker import parse_checker
+from cptools.executor import compile_source_file
+from cptools.run_util import load_cases, judge, mann_whitney_p
+
+parser = argparse.ArgumentParser(description='Compares the running times of two source files on a set of cases.  The '
+                                             'two programs are run alternately on each case, so that changes in the '
+                                             'load of the machine affect both equally')
+parser.add_argument('data_file', type=str, help='The test cases, as a .yml file or a test set directory')
+parser.add_argument('old_src_file', type=str, help='The source file to compare against')
+parser.add_argument('new_src_file', type=str, help='The source file to compare')
+parser.add_argument('-e', '--executor', type=str, help='The executor to use for both source files (will use first '
+                                                       'listed available executor for each file extension if this '
+                                                       'option is not specified)',
+                    choices=data.get_executors().keys())
+parser.add_argument('-o', '--only-case', help='Only run a single case', type=int)
+parser.add_argument('-r', '--runs', help='The number of timed runs of each program on each case (default: 5).  At least '
+                                         '4 runs are needed for a difference to be significant', type=int, default=5)
+parser.add_argument('-w', '--warmup', help='The number of untimed runs of each program on each case done before the '
+                                           'timed runs (default: 1)', type=int, default=1)
+parser.add_argument('-s', '--significance', help='The significance level for time differences, which are tested with '
+                                                 'the Mann-Whitney U test (default: 0.05)', type=float, default=0.05)
+
+VERDICT_COLOURS = {
+    'AC': Fore.LIGHTGREEN_EX,
+    'WA': Fore.LIGHTRED_EX,
+    'TLE': Style.DIM + Fore.WHITE,
+    'MLE': Fore.MAGENTA,
+    'OLE': Fore.CYAN,
+    'RTE': Fore.YELLOW
+}
+
+
+def run_interleaved(executors, case, runs, warmup):
+    """
+    Runs each executor on a case runs + warmup times, alternating between them.  The order is reversed every round
+    (ABBA...) so that neither program is always run first.  A program is not run again once one of its runs does not
+    finish normally, since that run's result is what's shown
+    :return: A list with a tuple (CompletedProcess, times, TLE) for each executor, where times is a list with the time
+    of each timed run (or of the failed run)
+    """
+    case_in = case['in']
+    results = [None] * len(executors)
+    times = [[] for _ in executors]
+    failed = [False] * len(executors)
+    for i in range(warmup + runs):
+        order = range(len(executors)) if i % 2 == 0 else reversed(range(len(executors)))
+        for j in order:
+            if failed[j]:
+                continue
+            res, elapsed, tle = executors[j].run(case_in)
+            results[j] = res, tle
+            if tle or res.mle or res.returncode:
+                failed[j] = True
+                times[j] = [elapsed]
+            elif i >= warmup:
+                times[j].append(elapsed)
+    return [(res, time_list, tle) for (res, tle), time_list in zip(results, times)]
+
+
+def main():
+    common.init_common(parser)
+    args = parser.parse_args()
+    common.init_common_options(args, True)
+
+    if args.runs < 1 or args.warmup < 0:
+        logging.error('Number of runs and warmup runs must be at least 1 and 0 respectively')
+        common.exit()
+
+    src_files = [args.old_src_file, args.new_src_file]
+    names = [os.path.basename(src_file) for src_file in src_files]
+    if names[0] == names[1]:
+        names = src_files
+
+    logging.info(f'Comparing {src_files[1]} against {src_files[0]} using cases from {args.data_file}')
+    logging.debug(f'Timeout: {data.get_option("timeout")}')
+    logging.debug(f'{args.runs} runs ({args.warmup} warmup runs) per case')
+
+    executors = [compile_source_file(src_file, args.executor) for src_file in src_files]
+
+    tests = load_cases(args.data_file)
+    indices = range(len(tests['cases']))
+    if args.only_case is not None:
+        if args.only_case >= len(indices):
+            logging.error('Case index out of range!')
+            common.exit()
+        indices = [args.only_case]
+        logging.warning(f'Only running case #{args.only_case}')
+
+    checker = parse_checker(tests['checker'])
+    checker.setup()
+
+    print()  # For formatting
+
+    name_width = max(map(len, names))
+    speedups = []
+    disagreements = 0
+    for ind in indices:
+        case = tests['cases'][ind]
+        print(f'{Style.BRIGHT}Case #{ind}:{Style.RESET_ALL}')
+        verdicts, samples = [], []
+        for name, (res, times, tle) in zip(names, run_interleaved(executors, case, args.runs, args.warmup)):
+            verdict, feedback = judge(res, tle, checker, tests['checker'], case)
+            feedback_str = f' ({feedback})' if feedback else ''
+            time_str = f'>{data.get_option("timeout"):.3f}s' if tle else f'median {statistics.median(times):.3f}s'
+            print(f'  {name.ljust(name_width)}  {VERDICT_COLOURS[verdict]}{verdict}{Style.RESET_ALL}{feedback_str} '
+                  f'[{time_str}]')
+            verdicts.append(verdict)
+            samples.append(times)
+
+        if verdicts != ['AC', 'AC']:
+            disagreements += 1
+            print(f'  {Fore.YELLOW}Not compared, since both programs need to be accepted{Style.RESET_ALL}')
+            continue
+
+        old_times, new_times = samples
+        speedup = statistics.median(old_times) / max(statistics.median(new_times), 1e-9)
+        p = mann_whitney_p(old_times, new_times)
+        speedups.append(speedup)
+
+        if p >= args.significance:
+            print(f'  {Style.DIM}Speedup: {speedup:.2f}x (not significant, p = {p:.3f}){Style.RESET_ALL}')
+        elif speedup >= 1:
+            print(f'  {names[1]} is {Fore.LIGHTGREEN_EX}{speedup:.2f}x faster{Style.RESET_ALL} (p = {p:.3f})')
+        else:
+            print(f'  {names[1]} is {Fore.LIGHTRED_EX}{1 / speedup:.2f}x slower{Style.RESET_ALL} (p = {p:.3f})')
+
+    print()
+    if speedups:
+        print(f'{Style.BRIGHT}Geometric mean speedup of {names[1]}: {statistics.geometric_mean(speedups):.3f}x '
+              f'over {len(speedups)} cases{Style.RESET_ALL}')
+    if disagreements:
+        logging.warning(f'{disagreements} cases were not compared since at least one program was not accepted')
+
+    for exc in executors:
+        exc.cleanup()
+    checker.cleanup()
+    common.exit(0)
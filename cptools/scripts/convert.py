@@ -0,0 +1,31 @@
+import argparse
+import logging
+import os
+
+import cptools.common as common
+from cptools.cases import write_directory
+from cptools.gen import write_cases_file
+from cptools.run_util import load_cases
+
+parser = argparse.ArgumentParser(description='Converts test cases between .yml files and test set directories (where '
+                                             'case i is stored in i.in and i.out).  Directories are faster to load '
+                                             'when the cases are large, since only the cases that are run are read')
+parser.add_argument('src', type=str, help='The .yml file or test set directory to convert')
+parser.add_argument('dest', type=str, help='The file or directory to write.  If src is a .yml file, a directory is '
+                                           'written, and otherwise a .yml file is written')
+
+
+def main():
+    common.init_common(parser)
+    args = parser.parse_args()
+    common.init_common_options(args, False)
+
+    tests = load_cases(args.src)
+    if os.path.isdir(args.src):
+        logging.info(f'Writing {len(tests["cases"])} cases to {args.dest}...')
+        write_cases_file(args.dest, {'tests': [{'input': case['in'], 'output': case['out']} for case in tests['cases']]},
+                         tests['checker'])
+    else:
+        logging.info(f'Writing {len(tests["cases"])} cases to directory {args.dest}...')
+        write_directory(args.dest, tests['checker'], tests['cases'])
+    common.exit(0)
@@ -1,87 +1,192 @@
 import argparse
+import contextlib
 import logging
+import math
 import os
+import sqlite3
+import statistics
+import tempfile
 
-import yaml
 from colorama import Style, Fore
 
 import cptools.data as data
 import cptools.common as common
+import cptools.profiling as profiling
+import cptools.trace as trace
+import cptools.results as results
+from cptools.cache import source_files
+from cptools.cases import DirectoryCase
 from cptools.checker import parse_checker
-from cptools.executor import Executor, default_executor_name, compile_source_file
+from cptools.executor import Executor, OutputFile, default_executor_name, compile_source_file
+from cptools.run_util import run_ordered, resolve_jobs, format_memory, format_usage, bench_stats, format_bench_stats, \
+    load_cases, judge
+from cptools.watch import Watcher
 
 parser = argparse.ArgumentParser(description='Compiles and executes a source file on a set of cases')
-parser.add_argument('data_file', type=str, help='The test cases, as a .yml file')
+parser.add_argument('data_file', type=str, help='The test cases, as a .yml file or a test set directory')
 parser.add_argument('src_file', type=str, help='The source file to use')
 parser.add_argument('-e', '--executor', type=str, help='The executor to use (will use first listed available executor '
                                                        'for the file extension if this option is not specified)',
                     choices=data.get_executors().keys())
 parser.add_argument('-a', '--list-all', help='Always display output, even if the case was correct', action='store_true')
 parser.add_argument('-o', '--only-case', help='Only run a single case', type=int)
+parser.add_argument('-j', '--jobs', help='Run up to JOBS cases at the same time (0 uses all CPU cores).  Verdicts are '
+                                         'still displayed in case order.  Note that times are less accurate when '
+                                         'multiple cases are run at once, so the default is to run cases one at a '
+                                         'time', type=int, default=1)
+parser.add_argument('-f', '--file-io', help='Feed the input to the program from a file and write its output to '
+                                            'temporary files instead of keeping it in memory.  Recommended for cases '
+                                            'with very large inputs or outputs', action='store_true')
+parser.add_argument('-b', '--bench', help='Benchmark mode: run each case BENCH times and display the minimum, median, '
+                                          '95th percentile and standard deviation of the times.  Cases are always run '
+                                          'one at a time in this mode', type=int)
+parser.add_argument('-w', '--warmup', help='In benchmark mode, the number of extra runs of each case done before the '
+                                           'timed runs (default: 0)', type=int, default=0)
+parser.add_argument('-m', '--margin', help='In benchmark mode, cases whose 95th percentile time is within MARGIN (as a '
+                                           'fraction of the timeout) of the timeout are marked as close to the timeout '
+                                           '(default: 0.1)', type=float, default=0.1)
+parser.add_argument('-W', '--watch', help='Watch mode: keep running, and compile and run the cases again whenever the '
+                                          'source file (or a local header that it includes) or the data file changes.  '
+                                          'Cases that failed or were slowest in the previous run are run first',
+                    action='store_true')
+parser.add_argument('-p', '--profile', help='Profile mode: run the solution under the profiler of its executor (cProfile '
+                                            'for Python, and a build with -pg and gprof for C++) and show its hottest '
+                                            'functions for each case and across all cases.  The full report is saved '
+                                            'as <src_file>.profile.txt.  Cases are run one at a time, and results are '
+                                            'not saved, since profilers slow programs down', action='store_true')
+parser.add_argument('--timings', help='When done, print how long cptools spent in each of its stages (loading cases, '
+                                       'compiling, running programs, checking, printing, etc.).  If TRACE_FILE is '
+                                       'given, the spans are also saved to it in Chrome trace format (for '
+                                       'chrome://tracing or ui.perfetto.dev)',
+                    nargs='?', const='', metavar='TRACE_FILE')
 
+# Number of hot functions shown for each case and across all cases, on the terminal and in the saved report
+PROFILE_CASE_SHOWN, PROFILE_TOTAL_SHOWN = 3, 10
+PROFILE_REPORT_LIMIT = 25
 
-def main():
-    common.init_common(parser)
-    args = parser.parse_args()
-    common.init_common_options(args, True)
 
-    cfg = data.get_config()
+def case_order(count, history):
+    """
+    Returns the order to run cases in: cases that weren't run in the previous run first, then the cases that were not
+    accepted, and then the others, from slowest to fastest.  Without a previous run, this is the normal order
+    :param count: The number of cases
+    :param history: A dict of case index -> (verdict, wall time) from the previous run
+    :return: A list of case indices
+    """
+    def key(ind):
+        if ind not in history:
+            return False, -math.inf
+        verdict, wall_time = history[ind]
+        return verdict == 'AC', -(wall_time or 0)
 
-    logging.info(f'Running {args.src_file} using cases from {args.data_file}')
-    logging.debug(f'Working directory: {os.getcwd()}')
-    logging.debug(f'Timeout: {cfg["timeout"]}')
-    logging.debug(f'Display Character Limit: {cfg["char_limit"]}')
+    return sorted(range(count), key=key)
 
-    exc = compile_source_file(args.src_file, args.executor)
 
-    # Load data
-    logging.info('Loading test data...')
+def read_profile(exc, paths):
+    """
+    Returns the hot functions (see profiling.hot_functions) in the profile data of runs, or an empty list if it could
+    not be read
+    """
+    try:
+        return profiling.hot_functions(exc.executor_info['profile']['report'], paths, exc.exec_file)
+    except OSError as e:
+        logging.warning(f'Could not read profile data (Error: {e})')
+        return []
+
 
-    if not os.path.exists(args.data_file):
-        logging.error('Data file does not exist!')
-        common.exit()
+def save_profile(args, exc, case_profiles, all_paths):
+    """
+    Prints the hot functions across all cases, and saves the report of each case and of all cases
+    :param case_profiles: A list of tuples (case index, wall time, hot functions)
+    :param all_paths: The paths of the profile data of all cases
+    """
+    functions = read_profile(exc, all_paths)
+    print(f'\n{Style.BRIGHT}== Hot Functions (All Cases) =={Style.RESET_ALL}')
+    print('\n'.join(profiling.format_functions(functions, PROFILE_TOTAL_SHOWN)))
 
+    lines = [f'Profile of {args.src_file} on {args.data_file} ({exc.executor_info["profile"]["report"]})', '']
+    for ind, wall_time, case_functions in sorted(case_profiles, key=lambda profile: profile[0]):
+        lines += [f'== Case #{ind} [{wall_time:.3f}s] ==', *profiling.format_functions(case_functions,
+                                                                                       PROFILE_REPORT_LIMIT), '']
+    lines += ['== All Cases ==', *profiling.format_functions(functions, PROFILE_REPORT_LIMIT)]
+
+    report_path = f'{args.src_file}.profile.txt'
     try:
-        with open(args.data_file) as f:
-            tests = yaml.unsafe_load(f.read())
-            msg = data.validate_data_object(tests)
-            if msg:
-                logging.error(f'Error while parsing data: {msg}')
-                common.exit()
-
-            cases = tests['cases']
-            for i in range(len(cases)):
-                if cases[i]['in'][-1] != '\n':
-                    cases[i]['in'] += '\n'
-                if cases[i]['out'][-1] != '\n':
-                    cases[i]['out'] += '\n'
-    except KeyError or IndexError:
-        logging.error(f'Malformed test data. {Fore.RED}', exc_info=True)
-        common.exit()
-
-    # Checker
-    checker = parse_checker(tests['checker'])
-    checker.setup()
-
-    # Run program
-    if args.only_case is not None:
-        if args.only_case >= len(cases):
-            logging.error('Case index out of range!')
-            common.exit()
-        cases = [cases[args.only_case]]
-        logging.warning(f'Only running case #{args.only_case}')
+        with open(report_path, 'w') as f:
+            f.write('\n'.join(lines) + '\n')
+        logging.info(f'Saved profile to {report_path}')
+    except OSError as e:
+        logging.warning(f'Could not save profile (Error: {e})')
+
 
-    char_limit = data.get_option('char_limit')
-    timeout = data.get_option('timeout')
+def run_cases(args, jobs, exc, tests, cases, checker, order, profile_dir=None):
+    """
+    Runs the cases, printing the verdict of each one, and saves the results if the save_results option is on
+    :param cases: The cases to run (all of the cases of tests, or only the one given with --only-case)
+    :param order: The order to run the cases in, as a list of indices into cases
+    :param profile_dir: In profile mode, the directory that the profile data of the cases is written to
+    :return: A list of tuples (case index, verdict, wall time, ResourceUsage or None, feedback or None), as recorded in
+    the results database
+    """
+
+    cfg = data.get_config()
+    char_limit = cfg['char_limit']
+    timeout = cfg['timeout']
 
     print()  # For formatting
 
-    verdicts = []
-    for ind, case in enumerate(cases):
-        case_in = case['in']
-        case_out = case['out']
+    def run_once(ind, case):
+        if profile_dir is not None:
+            return exc.run_profiled(case['in'], os.path.join(profile_dir, f'case{ind}'))
+        if not args.file_io:
+            return exc.run(case['in'])
+        if type(case) == DirectoryCase:  # The input can be read directly from the case's file
+            with open(case.in_path, 'rb') as f:
+                return exc.run_file(f)
+        with tempfile.TemporaryFile() as f:
+            f.write(case['in'].encode('utf8'))
+            f.seek(0)
+            return exc.run_file(f)
+
+    def discard(res):
+        if args.file_io:
+            res.stdout.close()
+            res.stderr.close()
+
+    def run_case(ind):
+        """
+        Returns a tuple (CompletedProcess, times, TLE), where times is a list with the time of each timed run.  In
+        benchmark mode, the runs stop early if one of them does not finish normally, since its result is what's shown
+        """
+        case = cases[ind]
+        if args.bench is None:
+            res, elapsed, tle = run_once(ind, case)
+            return res, [elapsed], tle
+
+        for _ in range(args.warmup):
+            res, elapsed, tle = run_once(ind, case)
+            if tle or res.mle or res.returncode:
+                return res, [elapsed], tle
+            discard(res)
+
+        times = []
+        for i in range(args.bench):
+            res, elapsed, tle = run_once(ind, case)
+            times.append(elapsed)
+            if tle or res.mle or res.returncode or i == args.bench - 1:
+                return res, times, tle
+            discard(res)
+
+    verdicts = {}
+    all_stats = []
+    records = []  # For the results database
+    case_profiles, all_profile_paths = [], []
+    first_case = args.only_case or 0
+    case_results = run_ordered(run_case, order, jobs)
+    for ind, get_result in zip(order, case_results):
+        case = cases[ind]
         try:
-            res, elapsed, tle = exc.run(case_in)
+            res, times, tle = get_result()
         except UnicodeEncodeError:
             logging.error('Invalid character in Input', exc_info=True)
             common.exit()
@@ -89,46 +194,213 @@ def main():
             logging.error('Invalid character in Output/Error Stream', exc_info=True)
             common.exit()
 
-        def print_verdict(verdict, verdict_clr, is_timeout=False, extra=''):
-            elapsed_str = f'[>{timeout:.3f}s]' if is_timeout else f'[{elapsed:.3f}s]'
-            print(f'{Style.BRIGHT}Case #{ind}: {verdict_clr}{verdict}{Style.RESET_ALL + Style.BRIGHT} {extra}{elapsed_str}{Style.RESET_ALL}')
+        def print_verdict(verdict, verdict_clr, is_timeout=False, extra='', feedback=None):
+            wall_time = statistics.median(times) if args.bench is not None and not is_timeout else times[-1]
+            records.append((first_case + ind, verdict, wall_time, res.usage, feedback))
+            if is_timeout:
+                elapsed_str = f'[>{timeout:.3f}s]'
+            elif args.bench is None:
+                elapsed_str = f'[{times[0]:.3f}s]'
+            else:
+                stats = bench_stats(times)
+                elapsed_str = f'[{format_bench_stats(stats)}]'
+                if stats.p95 >= timeout * (1 - args.margin):
+                    elapsed_str += f' {Fore.YELLOW}(close to timeout){Style.RESET_ALL}'
+                all_stats.append(stats)
+            with trace.span('print'):
+                print(f'{Style.BRIGHT}Case #{ind}: {verdict_clr}{verdict}{Style.RESET_ALL + Style.BRIGHT} {extra}{elapsed_str}{Style.RESET_ALL}')
 
-        if tle:
+        verdict, feedback = judge(res, tle, checker, tests['checker'], case)
+        ac = verdict == 'AC'
+        if verdict == 'TLE':
             print_verdict('TLE', Style.DIM + Fore.WHITE, True)
-            ac = False
-            verdicts.append(Style.DIM + Fore.WHITE + 't')
-        elif res.stderr or res.returncode:
+            verdicts[ind] = Style.DIM + Fore.WHITE + 't'
+        elif verdict == 'MLE':
+            print_verdict('MLE', Fore.MAGENTA, False, f'(Peak Memory: {format_memory(res.usage)}) ')
+            verdicts[ind] = Fore.MAGENTA + 'm'
+        elif verdict == 'OLE':
+            print_verdict('OLE', Fore.CYAN, False,
+                          f'(Output Limit: {data.get_option("output_limit")} MB, set by the output_limit config option) ')
+            verdicts[ind] = Fore.CYAN + 'o'
+        elif verdict == 'RTE':
             print_verdict('RTE', Fore.YELLOW, False, f'(Exit Code: {res.returncode}) ')
-            ac = False
-            verdicts.append(Fore.YELLOW + '!')
+            verdicts[ind] = Fore.YELLOW + '!'
+        elif ac:
+            print_verdict('AC', Fore.LIGHTGREEN_EX)
+            verdicts[ind] = Fore.LIGHTGREEN_EX + '*'
         else:
-            if not case_out and not tests['checker'].startswith('custom'):
-                ac, feedback = True, ''
-            else:
-                ac, feedback = checker.check(case_in, case_out, res.stdout)
-            if ac:
-                print_verdict('AC', Fore.LIGHTGREEN_EX)
-                verdicts.append(Fore.LIGHTGREEN_EX + '*')
-            else:
-                feedback_str = f'({feedback}) ' if feedback else ''
-                print_verdict('WA', Fore.LIGHTRED_EX, False, feedback_str)
-                verdicts.append(Fore.LIGHTRED_EX + 'x')
+            feedback_str = f'({feedback}) ' if feedback else ''
+            print_verdict('WA', Fore.LIGHTRED_EX, False, feedback_str, feedback)
+            verdicts[ind] = Fore.LIGHTRED_EX + 'x'
+
+        if args.verbose:
+            print(f'{Style.DIM}{format_usage(res.usage)}{Style.RESET_ALL}')
+
+        if profile_dir is not None:
+            paths = profiling.data_files(exc.executor_info['profile']['report'], os.path.join(profile_dir, f'case{ind}'))
+            functions = read_profile(exc, paths)
+            case_profiles.append((ind, times[-1], functions))
+            all_profile_paths += paths
+            print(Style.DIM + '\n'.join(profiling.format_functions(functions, PROFILE_CASE_SHOWN)) + Style.RESET_ALL)
 
         if not ac or args.list_all:
             def print_stream(label, text, style_before='', style_after=Style.RESET_ALL):
-                print(f'== {label} ==\n{style_before}{common.truncate(text, char_limit)}{style_after}')
+                if type(text) == OutputFile:
+                    # Enough to know if it needs to be truncated, or the end of the output if it went over the limit
+                    text = text.tail() if res.ole else text.text(char_limit + 1)
+                with trace.span('print'):
+                    print(f'== {label} ==\n{style_before}{common.truncate(text, char_limit)}{style_after}')
 
             if res.stderr:
                 print_stream('Errors', res.stderr, Fore.LIGHTRED_EX)
-            print_stream('Input', case_in)
+            print_stream('Input', case['in'])
             print_stream('Output', res.stdout)
+            case_out = case['out']
             if case_out:
                 print_stream('Expected Output', case_out)
 
-    verdicts = [v + Style.RESET_ALL + Style.BRIGHT for v in verdicts]
+        discard(res)
+
+    verdicts = [verdicts[ind] + Style.RESET_ALL + Style.BRIGHT for ind in sorted(verdicts)]
     print(f'\n{Style.BRIGHT}Results: [ {" ".join(verdicts)} ]')
+    if all_stats:
+        print(f'Total: median {sum(stats.median for stats in all_stats):.3f}s, '
+              f'slowest median {max(stats.median for stats in all_stats):.3f}s{Style.RESET_ALL}')
+    if profile_dir is not None:
+        save_profile(args, exc, case_profiles, all_profile_paths)
+
+    records.sort()
+    if cfg['save_results'] and profile_dir is None:
+        try:
+            with trace.span('save_results'):
+                conn = results.connect()
+                run_id = results.add_run(conn, args.src_file, args.data_file, args.executor or
+                                         default_executor_name(args.src_file), tests['checker'], args.bench or 1,
+                                         records)
+                conn.close()
+            logging.debug(f'Saved results as run #{run_id}')
+        except (sqlite3.Error, OSError) as e:
+            logging.warning(f'Could not save results (Error: {e})')
+
+    return records
+
+
+def main():
+    common.init_common(parser)
+    args = parser.parse_args()
+    if args.timings is not None:
+        trace.enable(args.timings or None)
+    common.init_common_options(args, True)
+
+    cfg = data.get_config()
+
+    logging.info(f'Running {args.src_file} using cases from {args.data_file}')
+    logging.debug(f'Working directory: {os.getcwd()}')
+    logging.debug(f'Timeout: {cfg["timeout"]}')
+    logging.debug(f'Display Character Limit: {cfg["char_limit"]}')
+    if cfg['memory_limit']:
+        logging.debug(f'Memory Limit: {cfg["memory_limit"]} MB')
+
+    jobs = resolve_jobs(args.jobs)
+    if args.bench is not None:
+        if args.bench < 1 or args.warmup < 0:
+            logging.error('Number of benchmark and warmup runs must be at least 1 and 0 respectively')
+            common.exit()
+        if jobs > 1:
+            logging.warning('Benchmark mode runs cases one at a time, ignoring --jobs')
+            jobs = 1
+        logging.debug(f'Benchmark mode: {args.bench} runs ({args.warmup} warmup runs) per case')
+    if args.profile:
+        if args.bench is not None:
+            logging.error('Profile mode and benchmark mode can not be used together')
+            common.exit()
+        if jobs > 1:
+            logging.warning('Profile mode runs cases one at a time, ignoring --jobs')
+            jobs = 1
+        if args.file_io:
+            logging.warning('Profile mode always feeds the input through a pipe, ignoring --file-io')
+            args.file_io = False
+    if jobs > 1:
+        logging.debug(f'Running up to {jobs} cases at once')
+
+    if args.watch:
+        common.pause_when_done = False  # Errors don't end watch mode, so there's nothing to wait for
+
+    # In watch mode, the executor, cases and checker are kept between runs, and only reloaded when their files change
+    exc, tests, cases, checker = None, None, None, None
+    data_path = os.path.abspath(args.data_file)
+    src_paths, watcher = set(), None
+    history = {}
+    try:
+        while True:
+            if args.watch:
+                # Local headers are watched too, and they can change when the source file changes.  The watcher is set
+                # up before running, so that changes saved during the run aren't missed
+                paths = {os.path.abspath(path) for path in source_files(args.src_file)} | \
+                        {os.path.abspath(args.src_file)}
+                if paths != src_paths:
+                    src_paths, old_watcher = paths, watcher
+                    watcher = Watcher(src_paths | {data_path})
+                    if old_watcher:
+                        old_watcher.close()
+
+            try:
+                if exc is None:
+                    exc = compile_source_file(args.src_file, args.executor, args.profile)
+
+                if tests is None:
+                    with trace.span('load_cases'):
+                        tests = load_cases(args.data_file)
+                    cases = tests['cases']
+                    if args.only_case is not None:
+                        if args.only_case >= len(cases):
+                            logging.error('Case index out of range!')
+                            tests = None
+                            common.exit()
+                        cases = [cases[args.only_case]]
+                        logging.warning(f'Only running case #{args.only_case}')
+
+                    if checker is None or checker_str != tests['checker']:
+                        if checker:
+                            checker.cleanup()
+                        checker = parse_checker(tests['checker'])
+                        checker_str = tests['checker']
+                        with trace.span('checker_setup'):
+                            checker.setup()
+
+                with tempfile.TemporaryDirectory() if args.profile else contextlib.nullcontext() as profile_dir:
+                    records = run_cases(args, jobs, exc, tests, cases, checker, case_order(len(cases), history),
+                                        profile_dir)
+                history = {ind - (args.only_case or 0): (verdict, wall_time)
+                           for ind, verdict, wall_time, _, _ in records}
+            except SystemExit:  # Errors were already logged
+                if not args.watch:
+                    raise
+
+            if not args.watch:
+                break
+
+            logging.info('Waiting for changes (press Ctrl+C to stop)...')
+            changed = watcher.wait()
+            logging.info(f'Changed: {", ".join(os.path.relpath(path) for path in sorted(changed))}')
+
+            if data_path in changed:
+                tests = None
+            if changed & src_paths:
+                if exc:
+                    exc.cleanup()
+                exc = None
+    except KeyboardInterrupt:
+        if not args.watch:
+            raise
+        print()
+        logging.info('Stopped watching')
 
     # Cleanup
-    exc.cleanup()
-    checker.cleanup()
+    if watcher:
+        watcher.close()
+    if exc:
+        exc.cleanup()
+    if checker:
+        checker.cleanup()
     common.exit(0)
@@ -1,14 +1,24 @@
+from collections import namedtuple, deque
+from concurrent.futures import ProcessPoolExecutor
 from subprocess import CompletedProcess
 
+import asyncio
+import multiprocessing
+import itertools
 import yaml
 import os
 import argparse
 import logging
 
+import cptools.cache as cache
 import cptools.common as common
 import cptools.data as data
+import cptools.trace as trace
 from cptools.checker import parse_checker
 from cptools.executor import compile_source_file
+from cptools.gutils.batch import split_cases, join_cases
+from cptools.run_util import resolve_jobs, format_memory
+from cptools.shrink import shrink
 
 from colorama import Style, Fore
 
@@ -25,11 +35,453 @@ parser.add_argument('-l', '--case-limit', help='Only run CASE_LIMIT cases (norma
 parser.add_argument('-s', '--seed', help='By default, the case number supplied when the --test-generate option is used '
                                          'is 0.  By specifying this option with an integer, that seed will be used '
                                          'instead', type=int, default=0)
+parser.add_argument('-j', '--jobs', help='Run cases in JOBS worker processes (0 uses all CPU cores).  Seeds are handed '
+                                         'out to workers in blocks, and the failing case that is reported is always '
+                                         'the one with the smallest seed', type=int, default=1)
+parser.add_argument('-p', '--pipeline', help='Overlap the stages of testing consecutive seeds: while the tested '
+                                            'solution runs on a case, the next cases are generated and run on the '
+                                            'reference solution.  Note that this makes times less accurate, since the '
+                                            'stages compete for the CPU', action='store_true')
+parser.add_argument('-P', '--pipeline-depth', help='With --pipeline, the maximum number of cases waiting between two '
+                                                  'stages (default 4)', type=int, default=4)
+parser.add_argument('-b', '--block-size', help='Number of consecutive seeds given to a worker process at a time when '
+                                               '--jobs is used (default 16)', type=int, default=16)
+parser.add_argument('-S', '--shrink', help='When a case fails, search for a smaller input that fails with the same '
+                                          'verdict by removing lines and tokens and making integers smaller.  '
+                                          'Candidates are run in parallel (on all CPU cores, or JOBS workers if --jobs '
+                                          'is specified)', action='store_true')
+parser.add_argument('--shrink-time', help='The maximum time (in seconds) spent shrinking a failing case (default 60)',
+                    type=float, default=60)
+parser.add_argument('--timings', help='When done, print how long cptools spent in each of its stages (generating '
+                                       'cases, running programs, checking, printing, etc.).  If TRACE_FILE is given, '
+                                       'the spans are also saved to it in Chrome trace format (for chrome://tracing '
+                                       'or ui.perfetto.dev).  With --jobs, only the main process is traced',
+                    nargs='?', const='', metavar='TRACE_FILE')
+parser.add_argument('-c', '--cache', help='Cache the outputs of the generator and reference solution, and reuse the '
+                                         'ones cached by earlier runs (in .cptools/stress_cache, unless the '
+                                         'stress_cache config option says otherwise).  Only use this if the generator '
+                                         'and reference solution are deterministic', action='store_true')
+
+# Result of running the tested solution on a single seed.  verdict is one of AC, WA, TLE, MLE, OLE, RTE
+CaseResult = namedtuple('CaseResult', 'seed verdict case_in case_out proc_out feedback')
+
+
+class GenerationError(Exception):
+    """
+    Raised when the generator or reference solution fails on a seed
+    """
+    pass
+
+
+def describe_seeds(seeds):
+    return f'seed {seeds[0]}' if len(seeds) == 1 else f'seeds {seeds[0]} to {seeds[-1]}'
+
+
+def check_proc(seeds, proc_name, proc_out: CompletedProcess, is_tle):
+    """
+    Check if the process TLEd or RTEd and raises a GenerationError if so
+    :param seeds: The RNG seeds (a range, used for logging)
+    :param proc_name: Process name (used for logging)
+    :param proc_out: The CompletedProcess object after running the process
+    :param is_tle: A bool specifying whether the process TLEd
+    """
+    if is_tle:
+        raise GenerationError(f'Error while generating case using {describe_seeds(seeds)}\n'
+                              f'{proc_name} timed out.  Terminating process...')
+    if proc_out.returncode != 0:
+        raise GenerationError(f'Error while generating case using {describe_seeds(seeds)}\n'
+                              f'{proc_name} runtime error (exit code: {proc_out.returncode})\n'
+                              f'STDERR:\n{proc_out.stderr}')
+
+
+def split_batch(seeds, proc_name, text):
+    """
+    Splits the output of a process run in batch mode into cases, raising a GenerationError if it is malformed
+    """
+    cases = split_cases(text, len(seeds))
+    if cases is None:
+        raise GenerationError(f'Error while generating case using {describe_seeds(seeds)}\n'
+                              f'{proc_name} did not output {len(seeds)} cases, each followed by a delimiter line (see '
+                              f'cptools.gutils.batch)')
+    return cases
+
+
+def run_reference(slow_exc, seed, case_in, case_cache=None):
+    """
+    Runs the reference solution on an input, or takes its output from the cache
+    :param case_cache: The CaseCache, or None if the cache isn't used
+    :return: The output
+    """
+    res_out = case_cache and case_cache.get_reference(case_in)
+    if res_out is None:
+        with trace.span('reference', seed=seed):
+            slow_out, _, slow_tle = slow_exc.run(case_in, None, str(seed), judged=False)
+        check_proc(range(seed, seed + 1), 'Reference solution', slow_out, slow_tle)
+        res_out = slow_out.stdout
+        if case_cache:
+            case_cache.put_reference(case_in, res_out)
+    return res_out
+
+
+def generate_case(gen_exc, slow_exc, seed, case_cache=None):
+    """
+    Generates a test case using a given seed
+    :param gen_exc: Generator executor
+    :param slow_exc: Reference solution executor, or None if the output should be taken from the generator's STDERR
+    :param seed: The seed (int)
+    :param case_cache: The CaseCache to take the outputs of the generator and reference solution from (and add them
+    to), or None if the cache isn't used
+    :return: A tuple (input, output)
+    """
+    generated = case_cache and case_cache.get_generated(seed)
+    if generated is None:
+        with trace.span('generate', seed=seed):
+            gen_out, _, gen_tle = gen_exc.run('', None, str(seed), judged=False)
+        check_proc(range(seed, seed + 1), 'Generator', gen_out, gen_tle)
+        generated = gen_out.stdout, gen_out.stderr
+        if case_cache:
+            case_cache.put_generated(seed, *generated)
+
+    res_in, gen_err = generated
+    res_out = run_reference(slow_exc, seed, res_in, case_cache) if slow_exc else gen_err
+    return res_in, res_out
+
+
+def generate_batch(gen_exc, slow_exc, seeds, batch_slow, case_cache=None):
+    """
+    Generates the test cases for a range of seeds with a single run of the generator, which is given the first seed
+    and the number of seeds as arguments (see cptools.gutils.batch).  The generator is only run if some of the cases
+    aren't cached
+    :param seeds: The seeds (a range)
+    :param batch_slow: Whether the reference solution should also be run once for all of the cases, instead of once per
+    case
+    :param case_cache: See generate_case
+    :return: A list with a tuple (input, output) for each seed
+    """
+    args = str(seeds[0]), str(len(seeds))
+    generated = case_cache and [case_cache.get_generated(seed, batch=True) for seed in seeds]
+    if not generated or None in generated:
+        with trace.span('generate', seed=seeds[0], count=len(seeds)):
+            gen_out, _, gen_tle = gen_exc.run('', None, *args, judged=False)
+        check_proc(seeds, 'Generator', gen_out, gen_tle)
+        inputs = split_batch(seeds, 'Generator', gen_out.stdout)
+        if slow_exc:  # STDERR is only used for debugging output, so it might not be split into cases
+            errors = split_cases(gen_out.stderr, len(seeds)) or [''] * len(seeds)
+        else:
+            errors = split_batch(seeds, 'Generator', gen_out.stderr)
+        generated = list(zip(inputs, errors))
+        if case_cache:
+            for seed, (case_in, case_err) in zip(seeds, generated):
+                case_cache.put_generated(seed, case_in, case_err, batch=True)
+    inputs, errors = map(list, zip(*generated))
+
+    if not slow_exc:
+        outputs = errors
+    elif batch_slow:
+        outputs = [case_cache.get_reference(case_in, batch=True) for case_in in inputs] if case_cache else [None]
+        if None in outputs:
+            with trace.span('reference', seed=seeds[0], count=len(seeds)):
+                slow_out, _, slow_tle = slow_exc.run(join_cases(inputs), None, *args, judged=False)
+            check_proc(seeds, 'Reference solution', slow_out, slow_tle)
+            outputs = split_batch(seeds, 'Reference solution', slow_out.stdout)
+            if case_cache:
+                for case_in, case_out in zip(inputs, outputs):
+                    case_cache.put_reference(case_in, case_out, batch=True)
+    else:
+        outputs = [run_reference(slow_exc, seed, case_in, case_cache) for seed, case_in in zip(seeds, inputs)]
+
+    return list(zip(inputs, outputs))
+
+
+def iter_cases(gen_exc, slow_exc, seeds, batch, batch_slow, case_cache=None):
+    """
+    Yields a tuple (seed, input, output) for each seed in seeds, generating them in batches if batch is not None
+    :param seeds: An iterable of consecutive seeds (can be infinite)
+    :param batch: The maximum number of cases to generate with each run of the generator, or None to use the normal
+    (one case per run) protocol
+    :param case_cache: See generate_case
+    """
+    if batch is None:
+        for seed in seeds:
+            yield (seed, *generate_case(gen_exc, slow_exc, seed, case_cache))
+        return
+
+    seeds = iter(seeds)
+    while True:
+        block = list(itertools.islice(seeds, batch))
+        if not block:
+            return
+        block = range(block[0], block[-1] + 1)
+        for seed, (case_in, case_out) in zip(block, generate_batch(gen_exc, slow_exc, block, batch_slow, case_cache)):
+            yield seed, case_in, case_out
+
+
+def test_case(fast_exc, checker, seed, case_in, case_out):
+    """
+    Runs the tested solution on a generated case
+    :return: A CaseResult object
+    """
+    with trace.span('test', seed=seed):
+        proc_out, _, tle = fast_exc.run(case_in)
+
+    if tle:
+        return CaseResult(seed, 'TLE', case_in, case_out, proc_out, '')
+    elif proc_out.mle:
+        return CaseResult(seed, 'MLE', case_in, case_out, proc_out, '')
+    elif proc_out.ole:
+        return CaseResult(seed, 'OLE', case_in, case_out, proc_out, '')
+    elif proc_out.stderr or proc_out.returncode:
+        return CaseResult(seed, 'RTE', case_in, case_out, proc_out, '')
+
+    res, feedback = checker.check(case_in, case_out, proc_out.stdout)
+    return CaseResult(seed, 'AC' if res else 'WA', case_in, case_out, proc_out, feedback)
+
+
+def print_failure(result: CaseResult):
+    """
+    Prints the information about a failed case
+    """
+    seed, proc_out = result.seed, result.proc_out
+    if result.verdict == 'TLE':
+        print(f'\n{Style.BRIGHT}Case {seed} {Style.DIM}TLE{Style.RESET_ALL} (generator seed {seed}){Style.RESET_ALL}\n\n'
+              f'Process Output:\n'
+              f'{proc_out.stdout}')
+    elif result.verdict == 'MLE':
+        print(f'\n{Style.BRIGHT}Case {seed}: {Fore.MAGENTA}MLE{Style.RESET_ALL} (generator seed {seed}){Style.RESET_ALL}\n\n'
+              f'Peak Memory: {format_memory(proc_out.usage)}\n'
+              f'Process STDERR:\n'
+              f'{proc_out.stderr}\n'
+              f'Process Output:\n'
+              f'{proc_out.stdout}')
+    elif result.verdict == 'OLE':
+        print(f'\n{Style.BRIGHT}Case {seed}: {Fore.CYAN}OLE{Style.RESET_ALL} (generator seed {seed}){Style.RESET_ALL}\n\n'
+              f'Output Limit: {data.get_option("output_limit")} MB (the output_limit config option)\n'
+              f'Process STDERR:\n'
+              f'{proc_out.stderr}\n'
+              f'Process Output:\n'
+              f'{proc_out.stdout}')
+    elif result.verdict == 'RTE':
+        print(f'\n{Style.BRIGHT}Case {seed}: {Fore.YELLOW}RTE{Style.RESET_ALL} (generator seed {seed}){Style.RESET_ALL}\n\n'
+              f'Exit Code: {proc_out.returncode}\n'
+              f'Process STDERR:\n'
+              f'{proc_out.stderr}\n'
+              f'Process Output:\n'
+              f'{proc_out.stdout}')
+    else:
+        print(f'\n{Style.BRIGHT}Case {seed}: {Fore.RED}WA{Style.RESET_ALL} (generator seed {seed}){Style.RESET_ALL}\n\n'
+              f'Process Output:\n'
+              f'{proc_out.stdout}\n'
+              f'Checker Feedback: {result.feedback}\n')
+
+    print(f'{Style.BRIGHT}== Test Case Info =={Style.RESET_ALL}\n'
+          f'Case Input:\n'
+          f'{result.case_in}\n'
+          f'Case Output:\n'
+          f'{result.case_out}')
+
+
+def shrink_failure(failure: CaseResult, slow_exc, fast_exc, checker, jobs, time_limit, case_cache=None):
+    """
+    Searches for a smaller input that fails with the same verdict as a failed case (see cptools.shrink).  An input is
+    only considered if the reference solution runs normally on it, so that inputs that break the input format are
+    skipped
+    :param case_cache: See generate_case
+    :return: A tuple (CaseResult of the smallest failing input found, number of inputs evaluated)
+    """
+
+    results = {}
+
+    def is_failing(case_in):
+        case_out = ''  # Only used when the verdict is WA, which needs a reference solution
+        if slow_exc:
+            try:
+                case_out = run_reference(slow_exc, failure.seed, case_in, case_cache)
+            except GenerationError:
+                return False
+
+        result = test_case(fast_exc, checker, failure.seed, case_in, case_out)
+        if result.verdict != failure.verdict:
+            return False
+        results[case_in] = result
+        return True
+
+    case_in, evaluated = shrink(failure.case_in, is_failing, jobs, time_limit)
+    return results.get(case_in, failure), evaluated
+
+
+"""
+PIPELINED STRESS TESTING
+"""
+
+
+async def run_pipeline(gen_exc, slow_exc, fast_exc, checker, batch, batch_slow, case_limit, depth, case_cache=None):
+    """
+    Runs the stress test as a pipeline of three stages (generator, reference solution, and tested solution with the
+    checker) connected by bounded queues, so that the stages work on consecutive seeds at the same time.  Each stage
+    handles seeds in increasing order, so results are still reported in seed order.  When the cases are generated in
+    batches or there's no reference solution, the first two stages are combined
+    :param depth: The maximum number of cases waiting in each queue
+    :param case_cache: See generate_case
+    :return: The CaseResult of the smallest failing seed, or None if all case_limit cases passed
+    """
+
+    seeds = itertools.count() if case_limit == -1 else range(case_limit)
+    generated, referenced = asyncio.Queue(depth), asyncio.Queue(depth)
+
+    # Queue items are (seed, input, output) tuples, followed by None when there are no more seeds.  If a stage fails,
+    # it puts the exception in the queue instead so that it is raised in the last stage.  This includes SystemExit (i.e.
+    # from common.exit), so that the stages after it don't wait for items forever
+    async def generate():
+        try:
+            if batch is None and slow_exc:
+                for seed in seeds:
+                    case = case_cache and case_cache.get_generated(seed)
+                    if case is None:
+                        gen_out, _, gen_tle = await gen_exc.run_async('', None, str(seed), judged=False)
+                        check_proc(range(seed, seed + 1), 'Generator', gen_out, gen_tle)
+                        case = gen_out.stdout, gen_out.stderr
+                        if case_cache:
+                            case_cache.put_generated(seed, *case)
+                    await generated.put((seed, case[0], None))
+            else:
+                cases = iter_cases(gen_exc, slow_exc, seeds, batch, batch_slow, case_cache)
+                while (item := await asyncio.to_thread(next, cases, None)) is not None:
+                    await generated.put(item)
+            await generated.put(None)
+        except asyncio.CancelledError:
+            raise
+        except BaseException as e:
+            await generated.put(e)
+
+    async def reference():
+        while True:
+            item = await generated.get()
+            if item is not None and not isinstance(item, BaseException) and item[2] is None:
+                seed, case_in, _ = item
+                try:
+                    case_out = case_cache and case_cache.get_reference(case_in)
+                    if case_out is None:
+                        slow_out, _, slow_tle = await slow_exc.run_async(case_in, None, str(seed), judged=False)
+                        check_proc(range(seed, seed + 1), 'Reference solution', slow_out, slow_tle)
+                        case_out = slow_out.stdout
+                        if case_cache:
+                            case_cache.put_reference(case_in, case_out)
+                    item = seed, case_in, case_out
+                except asyncio.CancelledError:
+                    raise
+                except BaseException as e:
+                    item = e
+            await referenced.put(item)
+            if item is None or isinstance(item, BaseException):
+                return
+
+    tasks = [asyncio.create_task(generate()), asyncio.create_task(reference())]
+    try:
+        while True:
+            item = await referenced.get()
+            if item is None:
+                return None
+            if isinstance(item, BaseException):
+                raise item
+
+            result = await asyncio.to_thread(test_case, fast_exc, checker, *item)
+            if result.verdict != 'AC':
+                return result
+            with trace.span('print'):
+                print(f'Passed case {result.seed}')
+    finally:
+        for task in tasks:
+            task.cancel()
+
+
+"""
+PARALLEL STRESS TESTING
+"""
+
+_worker_state = None
+
+
+def _init_worker(gen_exc, slow_exc, fast_exc, checker, batch, batch_slow, case_cache, lowest_failure):
+    global _worker_state
+    common.pause_when_done = False  # Only the main process should ever wait for the user
+    _worker_state = gen_exc, slow_exc, fast_exc, checker, batch, batch_slow, case_cache, lowest_failure
+
+
+def _test_block(start, count):
+    """
+    Tests the seeds [start, start+count) in a worker process, stopping at the first failure
+    :return: A tuple (seeds passed, CaseResult of the failure or None).  Note that seeds passed may be less than count
+    without a failure if a smaller failing seed was already found by another worker
+    """
+    gen_exc, slow_exc, fast_exc, checker, batch, batch_slow, case_cache, lowest_failure = _worker_state
+    seeds = range(start, start + count)
+    for seed, case_in, case_out in iter_cases(gen_exc, slow_exc, seeds, batch, batch_slow, case_cache):
+        if 0 <= lowest_failure.value < seed:  # Can't be the smallest failing seed anymore
+            return seed - start, None
+
+        result = test_case(fast_exc, checker, seed, case_in, case_out)
+        if result.verdict != 'AC':
+            with lowest_failure.get_lock():
+                if lowest_failure.value < 0 or seed < lowest_failure.value:
+                    lowest_failure.value = seed
+            return seed - start, result
+    return count, None
+
+
+def run_parallel(gen_exc, slow_exc, fast_exc, checker, batch, batch_slow, case_limit, jobs, block_size,
+                 case_cache=None):
+    """
+    Runs the stress test over multiple worker processes.  Blocks of seeds are handed out in increasing order and their
+    results are processed in the same order, so the reported failure is always the one with the smallest seed
+    :return: The CaseResult of the smallest failing seed, or None if all case_limit cases passed
+    """
+
+    lowest_failure = multiprocessing.Value('q', -1)
+    seeds = itertools.count(0, block_size)
+    if case_limit != -1:
+        seeds = iter(range(0, case_limit, block_size))
+
+    with ProcessPoolExecutor(jobs, initializer=_init_worker,
+                             initargs=(gen_exc, slow_exc, fast_exc, checker, batch, batch_slow, case_cache,
+                                       lowest_failure)) as pool:
+        pending = deque()
+
+        def submit_next():
+            for start in seeds:
+                count = block_size if case_limit == -1 else min(block_size, case_limit - start)
+                pending.append((start, pool.submit(_test_block, start, count)))
+                return
+
+        for _ in range(jobs * 2):
+            submit_next()
+
+        try:
+            while pending:
+                start, fut = pending.popleft()
+                try:
+                    passed, result = fut.result()
+                except SystemExit:  # The worker exited (i.e. the checker failed), which the worker already logged
+                    common.exit()
+                with trace.span('print'):
+                    for seed in range(start, start + passed):
+                        print(f'Passed case {seed}')
+                if result:
+                    return result
+                submit_next()
+        finally:
+            with lowest_failure.get_lock():  # Stops workers that are in the middle of a block
+                if lowest_failure.value < 0:
+                    lowest_failure.value = 0
+            pool.shutdown(wait=True, cancel_futures=True)
+
+    return None
 
 
 def main():
     common.init_common(parser)
     args = parser.parse_args()
+    if args.timings is not None:
+        trace.enable(args.timings or None)
     common.init_common_options(args, True)
 
     if not os.path.exists(args.config_file):
@@ -57,97 +509,70 @@ def main():
     logging.info('Loading to be tested (fast) solution...')
     fast_exc = compile_source_file(info['fast'], executors_dict.get('fast'))
 
-    # Utils
-    def check_proc(seed, proc_name, proc_out: CompletedProcess, is_tle):
-        """
-        Check if the process TLEd or RTEd and exits CPTools accordingly if so
-        :param seed: RNG seed (used for logging)
-        :param proc_name: Process name (used for logging)
-        :param proc_out: The CompletedProcess object after running the process
-        :param is_tle: A bool specifying whether the process TLEd
-        """
-        if is_tle:
-            logging.error(f'Error while generating case using seed {seed}')
-            logging.error(f'{proc_name} timed out.  Terminating process...')
-            common.exit()
-        if proc_out.returncode != 0:
-            logging.error(f'Error while generating case using seed {seed}')
-            logging.error(f'{proc_name} runtime error (exit code: {proc_out.returncode})')
-            logging.error(f'STDERR:\n{proc_out.stderr}')
-            common.exit()
-
-    def generate_case(seed):
-        """
-        Generates a test case using a given seed
-        :param seed: The seed (int)
-        :return: A tuple (input, output)
-        """
-        gen_out, _, gen_tle = gen_exc.run('', None, str(seed))
-        check_proc(seed, 'Generator', gen_out, gen_tle)
-
-        res_in = gen_out.stdout
-
-        if slow_exc:
-            slow_out, _, slow_tle = slow_exc.run(res_in, None, str(seed))
-            check_proc(seed, 'Reference solution', slow_out, slow_tle)
-            res_out = slow_out.stdout
-        else:
-            res_out = gen_out.stderr
-
-        return res_in, res_out
+    files = cache.get_stress_cache(args.cache)
+    case_cache = files and cache.CaseCache(files, gen_exc, slow_exc)
 
     # Test generate
     if args.test_generate:
         logging.info(f'Using seed {args.seed}')
-        case_in, case_out = generate_case(args.seed)
+        try:
+            case_in, case_out = generate_case(gen_exc, slow_exc, args.seed, case_cache)
+        except GenerationError as e:
+            logging.error(e)
+            common.exit()
         print(f'== Case Input ==\n{case_in}\n== Case Output ==\n{case_out}')
         common.exit(0)
 
     # Load checker
     checker = parse_checker(info['checker'])
-    checker.setup()
+    with trace.span('checker_setup'):
+        checker.setup()
 
     # Run stress test
-    i = 0
-    while i != args.case_limit:  # If args.case_limit==-1, it will keep going forever since i will never equal -1
-        case_in, case_out = generate_case(i)
-
-        def print_case_info():
-            print(f'{Style.BRIGHT}== Test Case Info =={Style.RESET_ALL}\n'
-                  f'Case Input:\n'
-                  f'{case_in}\n'
-                  f'Case Output:\n'
-                  f'{case_out}')
-
-        proc_out, elapsed, tle = fast_exc.run(case_in)
-
-        if tle:
-            print(f'\n{Style.BRIGHT}Case {i} {Style.DIM}TLE{Style.RESET_ALL} (generator seed {i}){Style.RESET_ALL}\n\n'
-                  f'Process Output:\n'
-                  f'{proc_out.stdout}')
-            print_case_info()
-            common.exit(0)
-        elif proc_out.stderr or proc_out.returncode:
-            print(f'\n{Style.BRIGHT}Case {i}: {Fore.YELLOW}RTE{Style.RESET_ALL} (generator seed {i}){Style.RESET_ALL}\n\n'
-                  f'Exit Code: {proc_out.returncode}\n'
-                  f'Process STDERR:\n'
-                  f'{proc_out.stderr}\n'
-                  f'Process Output:\n'
-                  f'{proc_out.stdout}')
-            print_case_info()
-            common.exit(0)
+    jobs = resolve_jobs(args.jobs)
+    batch, batch_slow = info.get('batch'), info.get('batch_slow', False)
+    if batch:
+        logging.info(f'Generating {batch} cases per generator run')
+    if args.pipeline and jobs > 1:
+        logging.error('--pipeline and --jobs can\'t be used together')
+        common.exit()
+    try:
+        if args.pipeline:
+            logging.info('Running stress test as a pipeline')
+            failure = asyncio.run(run_pipeline(gen_exc, slow_exc, fast_exc, checker, batch, batch_slow,
+                                               args.case_limit, max(args.pipeline_depth, 1), case_cache))
+        elif jobs > 1:
+            logging.info(f'Running stress test with {jobs} worker processes')
+            failure = run_parallel(gen_exc, slow_exc, fast_exc, checker, batch, batch_slow, args.case_limit, jobs,
+                                   max(args.block_size, 1), case_cache)
         else:
-            res, feedback = checker.check(case_in, case_out, proc_out.stdout)
-            if res: print(f'Passed case {i}')
-            else:
-                print(f'\n{Style.BRIGHT}Case {i}: {Fore.RED}WA{Style.RESET_ALL} (generator seed {i}){Style.RESET_ALL}\n\n'
-                      f'Process Output:\n'
-                      f'{proc_out.stdout}\n'
-                      f'Checker Feedback: {feedback}\n')
-                print_case_info()
-                common.exit(0)
+            failure = None
+            seeds = itertools.count() if args.case_limit == -1 else range(args.case_limit)
+            for seed, case_in, case_out in iter_cases(gen_exc, slow_exc, seeds, batch, batch_slow, case_cache):
+                result = test_case(fast_exc, checker, seed, case_in, case_out)
+                if result.verdict != 'AC':
+                    failure = result
+                    break
+                with trace.span('print'):
+                    print(f'Passed case {seed}')
+    except GenerationError as e:
+        logging.error(e)
+        common.exit()
 
-        i += 1
+    if failure:
+        print_failure(failure)
+
+        if args.shrink and failure.verdict == 'WA' and not slow_exc:
+            logging.warning('Can\'t shrink a WA case without a reference solution')
+        elif args.shrink:
+            shrink_jobs = jobs if args.jobs != 1 else resolve_jobs(0)
+            logging.info(f'Shrinking case {failure.seed} with {shrink_jobs} workers...')
+            shrunk, evaluated = shrink_failure(failure, slow_exc, fast_exc, checker, shrink_jobs, args.shrink_time,
+                                               case_cache)
+            print(f'\n{Style.BRIGHT}== Shrunk Case ({len(failure.case_in)} -> {len(shrunk.case_in)} characters, '
+                  f'{evaluated} inputs tried) =={Style.RESET_ALL}')
+            print_failure(shrunk)
+        common.exit(0)
 
     print(f'Done {args.case_limit} cases!')
 
@@ -155,4 +580,5 @@ def main():
     gen_exc.cleanup()
     if slow_exc: slow_exc.cleanup()
     fast_exc.cleanup()
+    checker.cleanup()
     common.exit(0)
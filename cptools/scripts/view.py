@@ -0,0 +1,138 @@
+import argparse
+import datetime
+import logging
+import os
+
+from colorama import Style, Fore
+
+import cptools.common as common
+import cptools.data as data
+import cptools.results as results
+
+parser = argparse.ArgumentParser(description='Views the results of previous runs of cptools-run')
+action = parser.add_mutually_exclusive_group()
+action.add_argument('-l', '--list', help='List stored runs, newest first (this is the default)', action='store_true')
+action.add_argument('-p', '--prev', help='Show the cases of the most recent run', action='store_true')
+action.add_argument('-i', '--id', help='Show the cases of the run with the specified ID', type=int)
+action.add_argument('-t', '--trend', help='Show how the time of each case changed over the most recent runs of a source '
+                                          'file (the source file and data file of the newest matching run are used)',
+                    action='store_true')
+action.add_argument('-c', '--clear', help='Delete stored runs (only those matching --src and --data if they are '
+                                          'specified)', action='store_true')
+parser.add_argument('-s', '--src', help='Only consider runs of this source file', type=str)
+parser.add_argument('-d', '--data', help='Only consider runs using cases from this data file', type=str)
+parser.add_argument('-n', '--limit', help='The maximum number of runs to list or show in a trend (default: 10)',
+                    type=int, default=10)
+
+VERDICT_COLOURS = {
+    'AC': Fore.LIGHTGREEN_EX,
+    'WA': Fore.LIGHTRED_EX,
+    'TLE': Style.DIM + Fore.WHITE,
+    'MLE': Fore.MAGENTA,
+    'OLE': Fore.CYAN,
+    'RTE': Fore.YELLOW
+}
+TREND_THRESHOLD = 0.1  # Relative change in time needed for it to be highlighted in a trend
+TREND_CELL_WIDTH = 10
+
+
+def format_time(timestamp):
+    return datetime.datetime.fromtimestamp(timestamp).strftime('%Y-%m-%d %H:%M:%S')
+
+
+def format_verdict(verdict):
+    return f'{VERDICT_COLOURS.get(verdict, "")}{verdict}{Style.RESET_ALL}'
+
+
+def describe_run(run):
+    return f'{Style.BRIGHT}Run #{run.id}{Style.RESET_ALL} [{format_time(run.time)}] ' \
+           f'{os.path.relpath(run.src_path)} ({run.src_hash[:8]}) on {os.path.relpath(run.data_path)}: ' \
+           f'{run.ac_count}/{run.case_count} AC'
+
+
+def show_run(conn, run):
+    print(describe_run(run))
+    print(f'Executor: {run.executor} | Checker: {run.checker} | Runs per case: {run.bench_runs}\n')
+    for case in results.get_cases(conn, [run.id]):
+        feedback = f' ({case.feedback})' if case.feedback else ''
+        usage = ''
+        if case.user_time is not None:
+            usage = f' CPU: {case.user_time + case.sys_time:.3f}s | Peak Memory: {case.max_rss / (1 << 20):.1f} MB'
+        print(f'Case #{case.index}: {format_verdict(case.verdict)}{feedback} [{case.wall_time:.3f}s]{usage}')
+
+
+def show_trend(conn, runs):
+    runs = runs[::-1]  # Oldest first
+    cases = {}
+    for case in results.get_cases(conn, [run.id for run in runs]):
+        cases.setdefault(case.index, {})[case.run_id] = case
+
+    def row(label, cells):
+        print(label.ljust(TREND_CELL_WIDTH) + ''.join(cells))
+
+    def cell(text, style=''):  # Padding is done before adding the style, since escape codes have no width
+        return f'{style}{text.ljust(TREND_CELL_WIDTH)}{Style.RESET_ALL}'
+
+    row('Run', [cell(f'#{run.id}') for run in runs])
+    hashes = [cell(run.src_hash[:8], Style.BRIGHT if i and run.src_hash != runs[i - 1].src_hash else '')
+              for i, run in enumerate(runs)]
+    row('Source', hashes)
+
+    for index in sorted(cases):
+        cells, prev = [], None
+        for run in runs:
+            case = cases[index].get(run.id)
+            if case is None:
+                cells.append(cell('-'))
+                prev = None
+            elif case.verdict != 'AC':
+                cells.append(cell(case.verdict, VERDICT_COLOURS.get(case.verdict, '')))
+                prev = None
+            else:
+                style = ''
+                if prev is not None and case.wall_time > prev * (1 + TREND_THRESHOLD):
+                    style = Fore.LIGHTRED_EX
+                elif prev is not None and case.wall_time < prev * (1 - TREND_THRESHOLD):
+                    style = Fore.LIGHTGREEN_EX
+                cells.append(cell(f'{case.wall_time:.3f}s', style))
+                prev = case.wall_time
+        row(f'Case #{index}', cells)
+
+
+def main():
+    common.init_common(parser)
+    args = parser.parse_args()
+    common.init_common_options(args, False)
+
+    if not os.path.exists(data.RESULTS_DB_PATH):
+        logging.error('No results have been saved in this directory')
+        common.exit()
+    conn = results.connect()
+
+    if args.clear:
+        count = results.clear(conn, args.src, args.data)
+        logging.info(f'Deleted {count} runs')
+    elif args.prev or args.id is not None:
+        if args.id is not None:
+            run = results.get_run(conn, args.id)
+        else:
+            run = next(iter(results.get_runs(conn, args.src, args.data, 1)), None)
+        if run is None:
+            logging.error('No such run')
+            common.exit()
+        show_run(conn, run)
+    elif args.trend:
+        latest = results.get_runs(conn, args.src, args.data, 1)
+        if not latest:
+            logging.error('No matching runs')
+            common.exit()
+        show_trend(conn, results.get_runs(conn, latest[0].src_path, latest[0].data_path, args.limit))
+    else:
+        runs = results.get_runs(conn, args.src, args.data, args.limit)
+        if not runs:
+            logging.info('No matching runs')
+        for run in runs:
+            print(describe_run(run))
+
+    conn.close()
+    common.exit(0)
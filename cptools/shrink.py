@@ -0,0 +1,172 @@
+"""
+Minimization of failing inputs.  Starting from an input that fails, reductions are tried roughly in order of how much
+they remove (chunks of lines, then chunks of tokens within a line, then smaller values of integers), and a reduction is
+kept whenever the reduced input still fails.  Candidates are evaluated in parallel, and the result for each input is
+remembered so that no input is ever run twice
+"""
+
+import logging
+import re
+import threading
+import time
+
+from cptools.run_util import run_ordered
+
+INTEGER_REGEX = re.compile(r'-?\d+')
+
+
+def _parse(text):
+    return [line.split() for line in text.rstrip('\n').split('\n')]
+
+
+def _format(lines):
+    return ''.join(' '.join(tokens) + '\n' for tokens in lines)
+
+
+def _size(text):
+    """
+    Key used to compare inputs: shorter inputs are smaller, and otherwise inputs with smaller integers are smaller
+    """
+    return len(text), sum(abs(int(token)) for token in INTEGER_REGEX.findall(text))
+
+
+def _removals(items):
+    """
+    Yields (start, end) for each chunk of items to try removing, from chunks of half the items down to single items
+    """
+    size = len(items) // 2
+    while size >= 1:
+        for start in range(0, len(items), size):
+            yield start, min(start + size, len(items))
+        size //= 2
+
+
+def _smaller_integers(value):
+    """
+    Yields smaller (in absolute value) replacements for an integer, smallest first
+    """
+    seen = {value}
+    for candidate in (0, 1 if value > 0 else -1, int(value / 2), value - 1 if value > 0 else value + 1):
+        if candidate not in seen and abs(candidate) < abs(value):
+            seen.add(candidate)
+            yield candidate
+
+
+def _replace(lines, i, j, token):
+    return lines[:i] + [lines[i][:j] + [token] + lines[i][j + 1:]] + lines[i + 1:]
+
+
+def _line_count_token(lines, start, end):
+    """
+    Finds the integer that most likely holds the number of lines in a block containing lines [start, end): the nearest
+    integer before them whose value is at least end - start and which counts lines up to at least line end - 1
+    :return: A tuple (line index, token index, value), or None if there is none
+    """
+    for i in range(start - 1, -1, -1):
+        for j, token in enumerate(lines[i]):
+            if INTEGER_REGEX.fullmatch(token):
+                value = int(token)
+                if value >= end - start and i + value >= end - 1:
+                    return i, j, value
+    return None
+
+
+def _token_count_token(lines, i, start):
+    """
+    Finds the integer that most likely holds the number of tokens of line i: an earlier token of the line whose value
+    is the number of tokens after it (and before token start), or otherwise the nearest integer in an earlier line whose
+    value is the number of tokens of line i
+    :return: A tuple (line index, token index, value), or None if there is none
+    """
+    tokens = lines[i]
+    for j in range(start):
+        if tokens[j] == str(len(tokens) - j - 1):
+            return i, j, len(tokens) - j - 1
+    for k in range(i - 1, -1, -1):
+        for j, token in enumerate(lines[k]):
+            if token == str(len(tokens)):
+                return k, j, len(tokens)
+    return None
+
+
+def _candidates(lines):
+    """
+    Yields the reductions of an input (given as a list of lines, each a list of tokens), as lists of lines.  Since
+    inputs usually give the sizes of arrays and blocks of lines, each removal is first tried along with making the
+    integer that most likely holds the size (if any) smaller by the number of items removed
+    """
+    for start, end in _removals(lines):
+        reduced = lines[:start] + lines[end:]
+        count = _line_count_token(lines, start, end)
+        if count:
+            i, j, value = count
+            yield _replace(reduced, i, j, str(value - (end - start)))
+        yield reduced
+
+    for i, tokens in enumerate(lines):
+        if len(tokens) > 1:
+            for start, end in _removals(tokens):
+                reduced = lines[:i] + [tokens[:start] + tokens[end:]] + lines[i + 1:]
+                count = _token_count_token(lines, i, start)
+                if count:
+                    k, j, value = count
+                    yield _replace(reduced, k, j, str(value - (end - start)))
+                yield reduced
+
+    for i, tokens in enumerate(lines):
+        for j, token in enumerate(tokens):
+            if INTEGER_REGEX.fullmatch(token):
+                for value in _smaller_integers(int(token)):
+                    yield _replace(lines, i, j, str(value))
+
+
+def shrink(text, is_failing, jobs=1, time_limit=None):
+    """
+    Finds a small input that still fails, by repeatedly applying the first reduction (see _candidates) that still fails
+    until no reduction does.  Whitespace in reduced inputs is normalized to single spaces and newlines
+    :param text: The failing input
+    :param is_failing: A function is_failing(input) that returns whether an input still fails.  It is called from up to
+    jobs threads at once.  Its results are remembered, so it is not called again for inputs that were already evaluated
+    :param jobs: The number of candidates to evaluate at the same time
+    :param time_limit: The time (in seconds) after which no more candidates are evaluated, or None for no limit
+    :return: A tuple (smallest failing input found, number of inputs evaluated).  The input is text itself if no
+    reduction of it fails
+    """
+
+    deadline = None if time_limit is None else time.monotonic() + time_limit
+    results = {}
+    results_lock = threading.Lock()
+
+    def expired():
+        return deadline is not None and time.monotonic() >= deadline
+
+    def evaluate(candidate):
+        with results_lock:
+            if candidate in results:
+                return candidate, results[candidate]
+        if expired():
+            return candidate, False
+        failing = is_failing(candidate)
+        with results_lock:
+            results[candidate] = failing
+        return candidate, failing
+
+    best, best_size = text, _size(text)
+    improved = True
+    while improved and not expired():
+        improved = False
+        candidates = (candidate for candidate in map(_format, _candidates(_parse(best)))
+                      if _size(candidate) < best_size)
+        for result in run_ordered(evaluate, candidates, jobs):
+            candidate, failing = result()
+            if failing:
+                best, best_size = candidate, _size(candidate)
+                improved = True
+                logging.debug(f'Shrunk input to {len(best)} characters')
+                break
+            if expired():
+                break
+
+    if expired():
+        logging.warning('Time limit reached while shrinking the input')
+    return best, len(results)
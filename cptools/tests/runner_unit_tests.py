@@ -1,9 +1,25 @@
+import contextlib
+import json
+import socket
 import subprocess as sub
+import time
 import unittest
 import re
 import os
 import os.path as path
+import shutil
+import tempfile
+import threading
+import urllib.error
+import urllib.request
 from textwrap import dedent
+from unittest import mock
+
+import yaml
+
+import cptools.affinity as affinity
+import cptools.data as data
+import cptools.pch as pch
 
 # 7-bit and 8-bit C1 ANSI sequences
 ANSI_ESCAPE_REGEX = re.compile(br'''
@@ -30,11 +46,44 @@ def remove_ansi_escapes(s):
 
 
 # Note: CWD should be set to <repository location>/cptools/tests
-def get_output(cmd, proc_in=''):
-    res = sub.run(cmd, stdout=sub.PIPE, stderr=sub.STDOUT, text=True, input=proc_in)
+def get_output(cmd, proc_in='', cwd=None):
+    res = sub.run(cmd, stdout=sub.PIPE, stderr=sub.STDOUT, text=True, input=proc_in, cwd=cwd)
     return remove_ansi_escapes(res.stdout)
 
 
+# Context manager that gives a temporary directory containing copies of files, with config options changed from the
+# ones in CWD
+@contextlib.contextmanager
+def config_workspace(files, **options):
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for file in files:
+            (shutil.copytree if path.isdir(file) else shutil.copy)(file, path.join(tmp_dir, file))
+        os.mkdir(path.join(tmp_dir, '.cptools'))
+        for name in ('executors.yml', 'compile_cache', 'pch'):  # So that sources aren't compiled again
+            src_path, dest_path = path.join('.cptools', name), path.join(tmp_dir, '.cptools', name)
+            if name == 'pch' and path.exists(src_path):
+                os.symlink(path.abspath(src_path), dest_path)  # Shared rather than copied, since it's big
+            elif path.isdir(src_path):
+                shutil.copytree(src_path, dest_path)
+            elif path.isfile(src_path):
+                shutil.copy(src_path, dest_path)
+
+        config = {}
+        if path.isfile(path.join('.cptools', 'config.yml')):
+            with open(path.join('.cptools', 'config.yml')) as f:
+                config = yaml.safe_load(f) or {}
+        config.update(options)
+        with open(path.join(tmp_dir, '.cptools', 'config.yml'), 'w') as f:
+            yaml.safe_dump(config, f)
+        yield tmp_dir
+
+
+# Runs cmd in a config_workspace
+def get_output_with_config(cmd, files, proc_in='', **options):
+    with config_workspace(files, **options) as tmp_dir:
+        return get_output(cmd, proc_in, cwd=tmp_dir)
+
+
 LOG_TIMEHOST_REGEX = r'\[\d+:\d+:\d+\/\w+]'
 RUN_REGEX = f'''{LOG_TIMEHOST_REGEX} INFO Running [\\w.]+ using cases from [\\w.]+
 {LOG_TIMEHOST_REGEX} INFO Compiling...
@@ -51,7 +100,7 @@ class RegexBasedTest(unittest.TestCase):
 
 TEST_AC_WA_REGEX = f'''
     Case #0: AC {TIME_REGEX}
-    Case #1: WA {TIME_REGEX}
+    Case #1: WA \\(token #1 \\(line 1, column 1\\): expected '12', got '13'\\) {TIME_REGEX}
     == Input ==
     6 7
 
@@ -83,7 +132,7 @@ class VerdictTests(RegexBasedTest):
         == Expected Output ==
         7
 
-        Case #1: WA {TIME_REGEX}
+        Case #1: WA \\(token #1 \\(line 1, column 1\\): expected '12', got '13'\\) {TIME_REGEX}
         == Input ==
         6 7
 
@@ -145,6 +194,35 @@ class VerdictTests(RegexBasedTest):
         2
         ''')
 
+    def test_mle(self):
+        files = ['test_aplusb.yml', 'test_aplusb.cpp', 'test_aplusb_mle.cpp']
+        out = get_output_with_config(['cptools-run', 'test_aplusb.yml', 'test_aplusb_mle.cpp'], files, memory_limit=32)
+        self._check_run(out, rf'''
+        Case #0: MLE \(Peak Memory: \d+\.\d MB\) {TIME_REGEX}
+        == Errors ==
+        .*std::bad_alloc.*
+        ''')
+        # The memory of cptools itself (inherited by the programs it starts) must not count
+        out = get_output_with_config(['cptools-run', 'test_aplusb.yml', 'test_aplusb.cpp'], files, memory_limit=32)
+        self._check_run(out, TEST_AC_WA_REGEX)
+
+    def test_ole(self):
+        files = ['test_aplusb.yml', 'test_aplusb_ole.cpp']
+        for options in ([], ['--file-io']):
+            with self.subTest(options=options):
+                out = get_output_with_config(['cptools-run', 'test_aplusb.yml', 'test_aplusb_ole.cpp'] + options, files,
+                                             output_limit=1)
+                self._check_run(out, rf'''
+                Case #0: OLE \(Output Limit: 1 MB, set by the output_limit config option\) {TIME_REGEX}
+                == Input ==
+                3 4
+
+                == Output ==
+                \[Output limit exceeded: \d+ bytes not shown\]
+                \n?7
+                7
+                ''')
+
     def test_ce(self):
         out = get_output(['cptools-run', 'test_aplusb.yml', 'test_aplusb_rte.cpp', '-e', 'cpp-debug'])
         self._check_run(out, rf'''
@@ -175,12 +253,62 @@ class InvalidConfigurationTests(RegexBasedTest):
             r' in path "cpp.compiled" \(expected list of strings\)')
         os.chdir(old_dir)
 
+    def test_old_config(self):
+        # A config generated before options were added, which should fill the missing ones with their default values
+        old_config = {'timeout': 1., 'char_limit': 1000000, 'default_checker': 'tokens',
+                      'template_path': '.template.cpp', 'saved_files_dir': '.'}
+        cmd = ['cptools-run', 'test_aplusb.yml', 'test_aplusb.cpp']
+        with config_workspace(['test_aplusb.yml', 'test_aplusb.cpp']) as tmp_dir:
+            config_path = path.join(tmp_dir, '.cptools', 'config.yml')
+            with open(config_path, 'w') as f:
+                yaml.safe_dump(old_config, f)
+            self._check_run(get_output(cmd, cwd=tmp_dir), TEST_AC_WA_REGEX)
+
+            # Invalid values are still rejected, both for the options in the file and the ones that were added
+            for key, value, expected in (('default_checker', 123, 'expected string'),
+                                         ('compile_cache', 'sometimes', 'expected one of local, global, off')):
+                with self.subTest(key=key):
+                    with open(config_path, 'w') as f:
+                        yaml.safe_dump({**old_config, key: value}, f)
+                    self._check_run(get_output(cmd, cwd=tmp_dir), fr'{LOG_TIMEHOST_REGEX} ERROR Error while parsing '
+                                    fr'config: Invalid value "{value}" for config key "{key}" \({expected}\)')
+
+
+class DataTests(unittest.TestCase):
+    def test_edited_data_files(self):
+        old_dir = os.getcwd()
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            os.chdir(tmp_dir)
+            try:
+                data.reset_all()
+                self.assertEqual(data.get_option('timeout'), 5.)
+                self.assertEqual(data.get_executor('py')['command'][0], 'python3')
+
+                # Same-size edits made within the mtime granularity (simulated by restoring the mtime) are picked up
+                for file_path, old, new in ((data.CONFIG_PATH, 'timeout: 5.', 'timeout: 7.'),
+                                            (data.EXECUTORS_PATH, "'python3'", "'python9'")):
+                    stat = os.stat(file_path)
+                    with open(file_path) as f:
+                        content = f.read()
+                    self.assertIn(old, content)
+                    with open(file_path, 'w') as f:
+                        f.write(content.replace(old, new, 1))
+                    os.utime(file_path, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+                self.assertEqual(data.get_option('timeout'), 7.)
+                self.assertEqual(data.get_executor('py')['command'][0], 'python9')
+            finally:
+                os.chdir(old_dir)
+
 
 class LanguageTests(RegexBasedTest):
     def test_py(self):
         out = get_output(['cptools-run', 'test_aplusb.yml', 'test_aplusb.py'])
         self._check_run(out, TEST_AC_WA_REGEX)
 
+    def test_py_fork_server(self):
+        out = get_output(['cptools-run', 'test_aplusb.yml', 'test_aplusb.py', '-e', 'py-fork'])
+        self._check_run(out, TEST_AC_WA_REGEX)
+
 
 class OptionTests(RegexBasedTest):
     def test_verbose(self):
@@ -195,13 +323,160 @@ class OptionTests(RegexBasedTest):
             {LOG_TIMEHOST_REGEX} DEBUG Compile time: \d+\.\d{{3}}s
         ''')
 
+    def test_jobs(self):
+        out = get_output(['cptools-run', 'test_aplusb.yml', 'test_aplusb.cpp', '--jobs', '4'])
+        self._check_run(out, TEST_AC_WA_REGEX)
+
+    def test_file_io(self):
+        out = get_output(['cptools-run', 'test_aplusb.yml', 'test_aplusb.cpp', '--file-io'])
+        self._check_run(out, TEST_AC_WA_REGEX)
+
+    def test_directory_cases(self):
+        out = get_output(['cptools-run', 'test_aplusb_dir', 'test_aplusb.cpp'])
+        self._check_run(out, TEST_AC_WA_REGEX)
+
+    def test_directory_cases_file_io(self):
+        out = get_output(['cptools-run', 'test_aplusb_dir', 'test_aplusb.cpp', '--file-io'])
+        self._check_run(out, TEST_AC_WA_REGEX)
+
+    def test_bench(self):
+        out = get_output(['cptools-run', 'test_aplusb.yml', 'test_aplusb.cpp', '--bench', '3', '--warmup', '1'])
+        bench_regex = r'\[min \d+\.\d{3}s \| median \d+\.\d{3}s \| p95 \d+\.\d{3}s \| stdev \d+\.\d{3}s\]'
+        self._check_run(out, rf'''
+        Case #0: AC {bench_regex}
+        Case #1: WA \(token #1 \(line 1, column 1\): expected '12', got '13'\) {bench_regex}
+        ''')
+        self.assertRegex(out, r'Total: median \d+\.\d{3}s, slowest median \d+\.\d{3}s')
+
+    def test_profile(self):
+        files = ['test_aplusb.yml', 'test_aplusb.py']
+        out = get_output_with_config(['cptools-run', 'test_aplusb.yml', 'test_aplusb.py', '--profile'], files)
+        self._check_run(out, rf'''
+        Case #0: AC {TIME_REGEX}
+             Self     Total     Calls  Function
+        (.+\n)*?   \d+\.\d{{3}}s    \d+\.\d{{3}}s         1  <module> \(test_aplusb\.py:1\)
+        ''')
+        self._check_run(out, r'''
+        == Hot Functions \(All Cases\) ==
+             Self     Total     Calls  Function
+        (.+\n)*?   \d+\.\d{3}s    \d+\.\d{3}s         4  <module> \(test_aplusb\.py:1\)
+        ''')
+        self.assertIn('Saved profile to test_aplusb.py.profile.txt', out)
+
+
+class CompileCacheTests(RegexBasedTest):
+    SOURCE = '#include <iostream>\n#include "add.h"\nint main() { int a, b; std::cin >> a >> b; std::cout << add(a, b); }\n'
+
+    # Runs the solution in tmp_dir, and returns whether the compile cache was hit or missed
+    def _run(self, tmp_dir, src='sol.cpp'):
+        out = get_output(['cptools-run', 'test_aplusb.yml', src, '-v'], cwd=tmp_dir)
+        return re.search(r'DEBUG Compile cache: (\w+)', out).group(1), out
+
+    def _write(self, tmp_dir, name, content):
+        with open(path.join(tmp_dir, name), 'w') as f:
+            f.write(content)
+
+    def test_compile_cache(self):
+        with config_workspace(['test_aplusb.yml'], compile_cache='local') as tmp_dir:
+            self._write(tmp_dir, 'sol.cpp', self.SOURCE)
+            self._write(tmp_dir, 'add.h', 'int add(int a, int b) { return a + b; }\n')
+            self.assertEqual(self._run(tmp_dir)[0], 'miss')
+            cache_hit, out = self._run(tmp_dir)
+            self.assertEqual(cache_hit, 'hit')
+            self._check_run(out, r'Results: \[ \* x \* \* \]')
+
+            # Editing the source file or a header that it includes recompiles it
+            self._write(tmp_dir, 'sol.cpp', self.SOURCE + '// Edited\n')
+            self.assertEqual(self._run(tmp_dir)[0], 'miss')
+            self.assertEqual(self._run(tmp_dir)[0], 'hit')
+            self._write(tmp_dir, 'add.h', 'int add(int a, int b) { return b + a; }\n')
+            self.assertEqual(self._run(tmp_dir)[0], 'miss')
+            self.assertEqual(self._run(tmp_dir)[0], 'hit')
+
+    def test_compile_cache_ce(self):
+        with config_workspace(['test_aplusb.yml'], compile_cache='local') as tmp_dir:
+            self._write(tmp_dir, 'sol.cpp', self.SOURCE)  # add.h doesn't exist
+            cache_dir = path.join(tmp_dir, '.cptools', 'compile_cache')
+            cached = set(os.listdir(cache_dir)) if path.isdir(cache_dir) else set()
+            for _ in range(2):
+                cache_hit, out = self._run(tmp_dir)
+                self.assertEqual(cache_hit, 'miss')
+                self._check_run(out, rf'{LOG_TIMEHOST_REGEX} ERROR Compile failed!')
+            self.assertEqual(set(os.listdir(cache_dir)) if path.isdir(cache_dir) else set(), cached)
+
+
+class PchTests(unittest.TestCase):
+    SOURCE = '#include <iostream>\nint main() { std::cout << 1; }\n'
+
+    @contextlib.contextmanager
+    def _workspace(self):
+        with tempfile.TemporaryDirectory() as tmp_dir, \
+                mock.patch.object(data, 'PCH_DIR', path.join(tmp_dir, 'pch')), \
+                mock.patch.object(data, 'get_option', {'pch_headers': ['iostream']}.__getitem__):
+            with open(path.join(tmp_dir, 'sol.cpp'), 'w') as f:
+                f.write(self.SOURCE)
+            yield tmp_dir
+
+    # Makes a compiler that runs g++, with its own version string
+    @staticmethod
+    def _compiler(tmp_dir, name, header_fails=False):
+        compiler = path.join(tmp_dir, name)
+        with open(compiler, 'w') as f:
+            f.write('#!/bin/sh\n'
+                    f'[ "$1" = --version ] && echo {name} && exit\n' +
+                    ('case "$*" in *c++-header*) exit 1;; esac\n' if header_fails else '') +
+                    'exec g++ "$@"\n')
+        os.chmod(compiler, 0o755)
+        return compiler
+
+    # Returns the command used to compile the solution with compiler and flags, after checking that it compiles
+    def _compile(self, tmp_dir, compiler, *flags):
+        src_path, exe_path = path.join(tmp_dir, 'sol.cpp'), path.join(tmp_dir, 'sol')
+        command = pch.add_pch([compiler, *flags, '-o', exe_path, src_path], src_path, exe_path)
+        self.assertEqual(sub.call(command), 0)
+        return command
+
+    # Returns the precompiled header used by a compile command
+    @staticmethod
+    def _gch_path(command):
+        return path.join(command[command.index('-I') + 1], 'iostream.gch')
+
+    def test_rebuild(self):
+        with self._workspace() as tmp_dir:
+            compiler = self._compiler(tmp_dir, 'gcc-a')
+            gch_path = self._gch_path(self._compile(tmp_dir, compiler, '-O0'))
+            mtime = os.stat(gch_path).st_mtime_ns
+            self.assertEqual(self._gch_path(self._compile(tmp_dir, compiler, '-O0')), gch_path)
+            self.assertEqual(os.stat(gch_path).st_mtime_ns, mtime)  # Reused
+
+            # Changing the flags or the compiler builds another precompiled header
+            other_paths = {self._gch_path(self._compile(tmp_dir, compiler, '-O2')),
+                           self._gch_path(self._compile(tmp_dir, self._compiler(tmp_dir, 'gcc-b'), '-O0'))}
+            self.assertEqual(len(other_paths), 2)
+            self.assertNotIn(gch_path, other_paths)
+            self.assertTrue(all(path.isfile(gch_path) for gch_path in other_paths))
+
+    def test_failed_build(self):
+        with self._workspace() as tmp_dir:
+            # Precompiling fails, but compiling the source file doesn't
+            compiler = self._compiler(tmp_dir, 'gcc-a', header_fails=True)
+            with self.assertLogs(level='WARNING'):
+                self.assertNotIn('-I', self._compile(tmp_dir, compiler, '-O0'))
+            self.assertEqual([name for _, _, names in os.walk(data.PCH_DIR) for name in names], ['header.h'])
+
+            # The directory for precompiled headers can't be created
+            shutil.rmtree(data.PCH_DIR)
+            open(data.PCH_DIR, 'w').close()
+            with self.assertLogs(level='WARNING'):
+                self.assertNotIn('-I', self._compile(tmp_dir, self._compiler(tmp_dir, 'gcc-b'), '-O0'))
+
 
 class CheckerTests(RegexBasedTest):
     def test_float_checker(self):
         out = get_output(['cptools-run', 'test_float.yml', 'test_float.py'])
         self._check_run(out, rf'''
         Case #0: AC {TIME_REGEX}
-        Case #1: WA {TIME_REGEX}
+        Case #1: WA \(worst error at number #1: expected 3, got 3\.1 \(error 0\.1\)\) {TIME_REGEX}
         == Input ==
         3 0\.1
 
@@ -211,7 +486,7 @@ class CheckerTests(RegexBasedTest):
         == Expected Output ==
         3
 
-        Case #2: WA {TIME_REGEX}
+        Case #2: WA \(worst error at number #1: expected 3, got 4 \(error 1\)\) {TIME_REGEX}
         == Input ==
         3 1
 
@@ -251,6 +526,266 @@ class CheckerTests(RegexBasedTest):
         Case #3: AC {TIME_REGEX}
         ''')
 
+    def test_custom_stream_checker(self):
+        out = get_output(['cptools-run', 'test_aplusb_stream_checker.yml', 'test_aplusb.cpp'])
+        self._check_run(out, rf'''
+        Case #0: AC {TIME_REGEX}
+        Case #1: WA \(diff 1, wanted 12, got 13\) {TIME_REGEX}
+        == Input ==
+        6 7
+
+        == Output ==
+        13
+
+        == Expected Output ==
+        12
+
+        Case #2: AC {TIME_REGEX}
+        Case #3: AC {TIME_REGEX}
+        ''')
+
+    def test_malformed_stream_checker_response(self):
+        out = get_output(['cptools-run', 'test_aplusb_bad_stream_checker.yml', 'test_aplusb.cpp'])
+        self._check_run(out, rf'''
+        {LOG_TIMEHOST_REGEX} ERROR Checker sent a malformed response \(ValueError: .+\)
+        {LOG_TIMEHOST_REGEX} ERROR STDERR info: Replying without a length
+        ''')
+
+
+class CompareTests(RegexBasedTest):
+    def test_compare(self):
+        out = get_output(['cptools-compare', 'test_aplusb.yml', 'test_aplusb.py', 'test_aplusb.cpp', '--runs', '4'])
+        self._check_run(out, rf'''
+        Case #0:
+          test_aplusb\.py   AC \[median \d+\.\d{{3}}s\]
+          test_aplusb\.cpp  AC \[median \d+\.\d{{3}}s\]
+          .*(faster|slower|not significant).*
+        Case #1:
+          test_aplusb\.py   WA \(token #1 \(line 1, column 1\): expected '12', got '13'\) \[median \d+\.\d{{3}}s\]
+          test_aplusb\.cpp  WA \(token #1 \(line 1, column 1\): expected '12', got '13'\) \[median \d+\.\d{{3}}s\]
+          Not compared, since both programs need to be accepted
+        ''')
+        self.assertRegex(out, r'Geometric mean speedup of test_aplusb\.cpp: \d+\.\d{3}x over 3 cases')
+
+
+class ConvertTests(unittest.TestCase):
+    def test_round_trip(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            src_dir = path.join(tmp_dir, 'cases')
+            shutil.copytree('test_aplusb_dir', src_dir)
+            # A case without expected output, and one without input
+            with open(path.join(src_dir, '4.in'), 'w') as f:
+                f.write('5 5\n')
+            open(path.join(src_dir, '5.in'), 'w').close()
+            open(path.join(src_dir, '5.out'), 'w').close()
+
+            yml_path = path.join(tmp_dir, 'cases.yml')
+            dest_dir = path.join(tmp_dir, 'converted')
+            get_output(['cptools-convert', src_dir, yml_path])
+            get_output(['cptools-convert', yml_path, dest_dir])
+            for i in range(6):
+                for ext in ('in', 'out'):
+                    src_path = path.join(src_dir, f'{i}.{ext}')
+                    with open(path.join(dest_dir, f'{i}.{ext}')) as f:
+                        converted = f.read()
+                    if path.exists(src_path):
+                        with open(src_path) as f:
+                            self.assertEqual(converted, f.read())
+                    else:
+                        self.assertEqual(converted, '')
+
+
+class CompanionListenerTests(unittest.TestCase):
+    PROBLEM = {'name': 'A. Plus B', 'group': 'Test Round', 'tests': [{'input': '3 4\n', 'output': '7\n'}]}
+
+    @staticmethod
+    def _get_stats(url, timeout=10.):
+        # Retries until the server is up
+        deadline = time.monotonic() + timeout
+        while True:
+            try:
+                with urllib.request.urlopen(url + '/stats', timeout=timeout) as res:
+                    return json.load(res)
+            except (urllib.error.URLError, ConnectionError):
+                if time.monotonic() > deadline:
+                    raise
+                time.sleep(0.1)
+
+    def test_concurrent_problems(self):
+        with socket.socket() as sock:  # Find a free port
+            sock.bind(('localhost', 0))
+            port = sock.getsockname()[1]
+        url = f'http://localhost:{port}'
+
+        with config_workspace(['template.cpp'], template_path='template.cpp', saved_files_dir='.') as tmp_dir:
+            proc = sub.Popen(['cptools-companion-server', '-p', str(port)], cwd=tmp_dir, stdout=sub.DEVNULL,
+                             stderr=sub.DEVNULL)
+            try:
+                self._get_stats(url)
+
+                # Two problems with the same name are sent at the same time
+                barrier = threading.Barrier(2)
+                codes = []
+
+                def post():
+                    request = urllib.request.Request(url, json.dumps(self.PROBLEM).encode('utf8'),
+                                                     {'Content-Type': 'application/json'})
+                    barrier.wait()
+                    with urllib.request.urlopen(request, timeout=10) as res:
+                        codes.append(res.status)
+
+                threads = [threading.Thread(target=post) for _ in range(2)]
+                for thread in threads:
+                    thread.start()
+                for thread in threads:
+                    thread.join()
+                self.assertEqual(codes, [200, 200])
+
+                # Files are written in the background
+                deadline = time.monotonic() + 10
+                while (stats := self._get_stats(url))['written'] < 2 and time.monotonic() < deadline:
+                    time.sleep(0.1)
+                self.assertEqual({key: stats[key] for key in ('requests', 'rejected', 'written', 'write_errors',
+                                                              'pending_writes')},
+                                 {'requests': 2, 'rejected': 0, 'written': 2, 'write_errors': 0, 'pending_writes': 0})
+            finally:
+                proc.terminate()
+                proc.wait()
+
+            for name in ('a-plus-b', 'a-plus-b1'):
+                with open(path.join(tmp_dir, name + '.yml')) as f:
+                    self.assertEqual(yaml.safe_load(f)['cases'], [{'in': '3 4\n', 'out': '7\n'}])
+                with open(path.join(tmp_dir, name + '.cpp')) as f:
+                    self.assertEqual(f.readline(), f'// ./{name}.yml\n')
+
+
+class StressTests(RegexBasedTest):
+    @staticmethod
+    def _stage_counts(out):
+        """
+        Returns the number of times each program was run, from the --timings breakdown
+        """
+        counts = re.findall(r'^(generate|reference|test) +(\d+) ', out, re.MULTILINE)
+        return {name: int(count) for name, count in counts}
+
+    def _failing_seed(self, config_file, *options):
+        """
+        Runs a stress test without the cache, and returns the seed of the failing case it reports
+        """
+        out = get_output(['cptools-stress-test', config_file] + list(options))
+        match = re.search(r'^Case (\d+): WA \(generator seed \d+\)', out, re.MULTILINE)
+        self.assertIsNotNone(match, out)
+        return int(match.group(1))
+
+    def test_jobs(self):
+        # Seeds 34 and 75 fail.  With small blocks, a worker can fail on seed 75 before seed 34 is tested
+        self.assertEqual(self._failing_seed('stress_testing/test_sum.yml', '--jobs', '2', '--block-size', '4'),
+                         self._failing_seed('stress_testing/test_sum.yml'))
+
+    def test_batch(self):
+        # The failing seed is in the middle of a batch of 8 cases
+        self.assertEqual(self._failing_seed('stress_testing/test_sum_batch.yml'),
+                         self._failing_seed('stress_testing/test_sum.yml'))
+
+    def test_pipeline(self):
+        expected = self._failing_seed('stress_testing/test_sum.yml')
+        # With separate generator and reference solution stages, and with the two combined (batches)
+        for config_file in ('stress_testing/test_sum.yml', 'stress_testing/test_sum_batch.yml'):
+            with self.subTest(config_file=config_file):
+                self.assertEqual(self._failing_seed(config_file, '--pipeline'), expected)
+
+    def test_shrink(self):
+        out = get_output(['cptools-stress-test', 'stress_testing/test_sum.yml', '--shrink', '--shrink-time', '30'])
+        # The solution fails when one of the numbers is 300, so the smallest failing input is that number alone
+        self._check_run(out, r'''
+        == Shrunk Case \(\d+ -> 4 characters, \d+ inputs tried\) ==
+
+        Case 34: WA \(generator seed 34\)
+
+        Process Output:
+        301
+
+        Checker Feedback: token #1 \(line 1, column 1\): expected '300', got '301'
+
+        == Test Case Info ==
+        Case Input:
+        300
+        ''')
+
+    def test_cache_off(self):
+        with config_workspace(['stress_testing']) as tmp_dir:
+            cmd = ['cptools-stress-test', 'stress_testing/test_sum.yml', '-l', '20', '--timings']
+            for _ in range(2):
+                self.assertEqual(self._stage_counts(get_output(cmd, cwd=tmp_dir)),
+                                 {'generate': 20, 'reference': 20, 'test': 20})
+            # --cache turns it on for a single run
+            self.assertEqual(self._stage_counts(get_output(cmd + ['--cache'], cwd=tmp_dir)),
+                             {'generate': 20, 'reference': 20, 'test': 20})
+            self.assertEqual(self._stage_counts(get_output(cmd + ['--cache'], cwd=tmp_dir)), {'test': 20})
+
+    def test_cache(self):
+        with config_workspace(['stress_testing'], stress_cache='local') as tmp_dir:
+            cmd = ['cptools-stress-test', 'stress_testing/test_sum.yml', '-l', '20', '--timings']
+            self.assertEqual(self._stage_counts(get_output(cmd, cwd=tmp_dir)),
+                             {'generate': 20, 'reference': 20, 'test': 20})
+            # The second run only runs the tested solution
+            self.assertEqual(self._stage_counts(get_output(cmd, cwd=tmp_dir)), {'test': 20})
+
+            # Cases generated with the batch protocol (8 cases per run) are cached apart from the others
+            cmd = ['cptools-stress-test', 'stress_testing/test_sum_batch.yml', '-l', '20', '--timings']
+            self.assertEqual(self._stage_counts(get_output(cmd, cwd=tmp_dir)),
+                             {'generate': 3, 'reference': 3, 'test': 20})
+            self.assertEqual(self._stage_counts(get_output(cmd, cwd=tmp_dir)), {'test': 20})
+
+
+class AffinityTests(unittest.TestCase):
+    def test_parse_cpu_list(self):
+        self.assertEqual(affinity.parse_cpu_list('0-3,8,10-11\n'), {0, 1, 2, 3, 8, 10, 11})
+        self.assertEqual(affinity.parse_cpu_list('5'), {5})
+        self.assertEqual(affinity.parse_cpu_list('\n'), set())
+
+    def test_physical_cores(self):
+        with tempfile.TemporaryDirectory() as sysfs_dir:
+            # Two cores with two threads each, and CPU 4 without topology information
+            for cpu, siblings in ((0, '0,2'), (1, '1,3'), (2, '0,2'), (3, '1,3')):
+                os.makedirs(path.join(sysfs_dir, f'cpu{cpu}', 'topology'))
+                with open(path.join(sysfs_dir, f'cpu{cpu}', 'topology', 'thread_siblings_list'), 'w') as f:
+                    f.write(siblings + '\n')
+            self.assertEqual(affinity.physical_cores({0, 1, 2, 3, 4}, sysfs_dir), [(0, 2), (1, 3), (4,)])
+            # Siblings that aren't available are left out
+            self.assertEqual(affinity.physical_cores({0, 1, 3}, sysfs_dir), [(0,), (1, 3)])
+
+    def test_core_layout(self):
+        with tempfile.TemporaryDirectory() as lock_dir, mock.patch.object(affinity, 'LOCK_DIR', lock_dir):
+            layout = affinity.CoreLayout([(0, 2), (1, 3), (4,)])
+            self.assertEqual(layout.untimed_cpus(), {0, 1, 2, 3, 4})
+            cpu1, lock1 = layout.acquire()
+            cpu2, lock2 = layout.acquire()
+            self.assertEqual({cpu1, cpu2}, {1, 4})
+            self.assertEqual(layout.untimed_cpus(), {0, 2})
+
+            # Once all cores are taken, a timed run waits for whichever is released first
+            threading.Timer(0.1, lock2.close).start()
+            cpu3, lock3 = layout.acquire()
+            self.assertEqual(cpu3, cpu2)
+            lock1.close()
+            lock3.close()
+
+
+class ResultsTests(RegexBasedTest):
+    def test_view_prev(self):
+        get_output(['cptools-run', 'test_aplusb.yml', 'test_aplusb.cpp'])
+        out = get_output(['cptools-view', '--prev'])
+        self._check_run(out, rf'''
+        Run #\d+ \[[\d\- :]+\] test_aplusb\.cpp \([0-9a-f]{{8}}\) on test_aplusb\.yml: 3/4 AC
+        Executor: cpp \| Checker: tokens \| Runs per case: 1
+
+        Case #0: AC {TIME_REGEX}.*
+        Case #1: WA \(token #1 \(line 1, column 1\): expected '12', got '13'\) {TIME_REGEX}.*
+        Case #2: AC {TIME_REGEX}.*
+        Case #3: AC {TIME_REGEX}.*
+        ''')
+
 
 class BugTests(RegexBasedTest):
     # Just check if it terminates normally
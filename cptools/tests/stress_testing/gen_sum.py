@@ -0,0 +1,11 @@
+import random
+
+from cptools.gutils.batch import run_generator
+
+
+def generate(seed):
+    random.seed(seed)
+    print(*(random.randint(1, 300) for _ in range(random.randint(1, 10))))
+
+
+run_generator(generate)
@@ -0,0 +1,8 @@
+from cptools.gutils.batch import run_solution
+
+
+def solve():
+    print(sum(map(int, input().split())))
+
+
+run_solution(solve)
@@ -0,0 +1,8 @@
+import sys
+
+# A broken streaming checker, which replies to the first case with a line that isn't the length of the feedback
+sys.stdin.buffer.readline()
+sys.stderr.write('Replying without a length\n')
+sys.stderr.flush()
+print('OK', flush=True)
+sys.stdin.buffer.read()
@@ -0,0 +1,11 @@
+#include <bits/stdc++.h>
+
+using namespace std;
+
+int main() {
+    long long a, b;
+    cin >> a >> b;
+    vector<long long> v(1 << 25, a);  // 256 MB
+    cout << (v.back() + b) << endl;
+    return 0;
+}
@@ -0,0 +1,12 @@
+#include <bits/stdc++.h>
+
+using namespace std;
+
+int main() {
+    long long a, b;
+    cin >> a >> b;
+    while (true) {
+        cout << (a + b) << '\n';
+    }
+    return 0;
+}
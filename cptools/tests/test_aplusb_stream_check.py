@@ -0,0 +1,14 @@
+from cptools.gutils.checker import run_stream_checker
+
+
+def check(_, expected, output):
+    exp = int(expected)
+    out = int(output)
+
+    if out == exp:
+        return 'OK'
+    else:
+        return f'diff {abs(exp - out)}, wanted {exp}, got {out}'
+
+
+run_stream_checker(check)
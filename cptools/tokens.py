@@ -0,0 +1,150 @@
+"""
+Streaming comparison of program outputs.  Sources can be str, bytes or OutputFile objects, and are read in chunks so
+that outputs never have to be split into full token lists
+"""
+
+import re
+
+from cptools.executor import OutputFile
+
+CHUNK_SIZE = 1 << 16
+TOKEN_REGEX = re.compile(rb'\S+')
+DISPLAY_TOKEN_LEN = 32
+
+
+def iter_chunks(source, chunk_size=CHUNK_SIZE):
+    """
+    Yields the content of source as bytes objects.  Str sources are encoded as UTF-8
+    """
+    if type(source) == OutputFile:
+        yield from source.chunks(chunk_size)
+    elif type(source) == bytes:
+        for i in range(0, len(source), chunk_size):
+            yield source[i:i + chunk_size]
+    else:
+        for i in range(0, len(source), chunk_size):
+            yield source[i:i + chunk_size].encode('utf8')
+
+
+def line_col(source, offset):
+    """
+    Returns the (line, column) of a byte offset in source, both 1-indexed
+    """
+    line, line_start, pos = 1, 0, 0
+    for chunk in iter_chunks(source):
+        if pos >= offset:
+            break
+        end = min(len(chunk), offset - pos)
+        line += chunk.count(b'\n', 0, end)
+        last_newline = chunk.rfind(b'\n', 0, end)
+        if last_newline != -1:
+            line_start = pos + last_newline + 1
+        pos += len(chunk)
+    return line, offset - line_start + 1
+
+
+def first_byte_difference(expected, output):
+    """
+    Returns the byte offset of the first difference between expected and output, or None if they are identical.  If
+    one is a prefix of the other, the offset is the length of the shorter one
+    """
+    expected_chunks, output_chunks = iter_chunks(expected), iter_chunks(output)
+    exp_buf = out_buf = memoryview(b'')
+    pos = 0
+    while True:
+        if not exp_buf:
+            exp_buf = memoryview(next(expected_chunks, b''))
+        if not out_buf:
+            out_buf = memoryview(next(output_chunks, b''))
+        if not exp_buf or not out_buf:
+            return None if not exp_buf and not out_buf else pos
+
+        n = min(len(exp_buf), len(out_buf))
+        if exp_buf[:n] != out_buf[:n]:
+            return pos + next(i for i in range(n) if exp_buf[i] != out_buf[i])
+        pos += n
+        exp_buf, out_buf = exp_buf[n:], out_buf[n:]
+
+
+def iter_token_batches(source):
+    """
+    Yields the whitespace-separated tokens of source as lists of tokens, one list per chunk.  This is much faster than
+    yielding tokens one at a time since the splitting is done in C, and only one chunk's worth of tokens is kept in
+    memory
+    """
+    pending = b''
+    for chunk in iter_chunks(source):
+        buf = pending + chunk if pending else chunk
+        tokens = buf.split()
+        pending = tokens.pop() if tokens and not buf[-1:].isspace() else b''  # Might continue in the next chunk
+        if tokens:
+            yield tokens
+    if pending:
+        yield [pending]
+
+
+def token_offset(source, index):
+    """
+    Returns the byte offset of the token with the given (0-indexed) index in source, or the offset of the end of the
+    last token if source has no such token
+    """
+    seen, offset, pending = 0, 0, b''
+    last_buf, last_base = b'', 0  # Last chunk that had complete tokens
+    for chunk in iter_chunks(source):
+        buf = pending + chunk if pending else chunk
+        base = offset - len(pending)
+        offset += len(chunk)
+
+        tokens = buf.split()
+        pending = tokens.pop() if tokens and not buf[-1:].isspace() else b''
+        if seen + len(tokens) > index:  # The token is in this chunk, so find its exact position
+            for i, match in enumerate(TOKEN_REGEX.finditer(buf)):
+                if seen + i == index:
+                    return base + match.start()
+        seen += len(tokens)
+        if tokens:
+            last_buf, last_base = buf[:len(buf) - len(pending)], base
+
+    if pending:
+        return offset - len(pending) if seen == index else offset
+    return last_base + len(last_buf.rstrip())
+
+
+def first_token_difference(expected, output):
+    """
+    Returns None if expected and output have the same whitespace-separated tokens, and otherwise a tuple
+    (token index, expected token, output token, byte offset in output) describing the first token that differs.  The
+    tokens are None if the corresponding source ran out of tokens.  The token index is 0-indexed
+    """
+    expected_batches, output_batches = iter_token_batches(expected), iter_token_batches(output)
+    exp, out = [], []
+    exp_pos = out_pos = index = 0
+    while True:
+        if exp is not None and exp_pos == len(exp):
+            exp, exp_pos = next(expected_batches, None), 0
+        if out is not None and out_pos == len(out):
+            out, out_pos = next(output_batches, None), 0
+        if exp is None or out is None:
+            if exp is None and out is None:
+                return None
+            exp_token = exp[exp_pos] if exp is not None else None
+            out_token = out[out_pos] if out is not None else None
+            return index, exp_token, out_token, token_offset(output, index)
+
+        n = min(len(exp) - exp_pos, len(out) - out_pos)
+        if exp[exp_pos:exp_pos + n] != out[out_pos:out_pos + n]:
+            k = next(k for k in range(n) if exp[exp_pos + k] != out[out_pos + k])
+            index += k
+            return index, exp[exp_pos + k], out[out_pos + k], token_offset(output, index)
+        index += n
+        exp_pos += n
+        out_pos += n
+
+
+def describe_token(token):
+    if token is None:
+        return 'end of output'
+    token = str(token, 'utf8', errors='replace')
+    if len(token) > DISPLAY_TOKEN_LEN:
+        token = token[:DISPLAY_TOKEN_LEN] + '...'
+    return repr(token)
@@ -0,0 +1,143 @@
+"""
+Lightweight tracing of where cptools spends its time (--timings).  Stages are wrapped in spans:
+
+    with trace.span('compile', src=src_path):
+        ...
+
+When tracing is off, span returns a shared no-op context manager, so spans cost a function call.  When it's on, each
+span records its duration and its self time (the part not spent in spans nested in it on the same thread).  At exit,
+the spans are summed up by name and printed, and optionally written to a file in the Chrome trace event format (which
+can be opened with chrome://tracing or https://ui.perfetto.dev).  Only spans of the process that enabled tracing are
+included (not those of stress test worker processes)
+"""
+
+import atexit
+import contextlib
+import json
+import logging
+import os
+import threading
+import time
+from collections import namedtuple
+
+from colorama import Style
+
+SpanRecord = namedtuple('SpanRecord', 'name start duration self_time tid args')
+
+_import_time = time.perf_counter_ns()  # About when cptools started, since this is imported early (by cptools.data)
+_enabled = False
+_enabled_pid = None
+_spans = []  # list.append is atomic, so spans from any thread are added without a lock
+_local = threading.local()
+_NULL_SPAN = contextlib.nullcontext()
+
+
+class _Span:
+    __slots__ = ('name', 'args', 'start', 'child_time')
+
+    def __init__(self, name, args):
+        self.name = name
+        self.args = args
+
+    def __enter__(self):
+        stack = getattr(_local, 'stack', None)
+        if stack is None:
+            stack = _local.stack = []
+        stack.append(self)
+        self.child_time = 0
+        self.start = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, *_):
+        duration = time.perf_counter_ns() - self.start
+        stack = _local.stack
+        stack.pop()
+        if stack:
+            stack[-1].child_time += duration
+        _spans.append(SpanRecord(self.name, self.start, duration, duration - self.child_time,
+                                 threading.get_native_id(), self.args))
+
+
+def span(name, always=False, **args):
+    """
+    Returns a context manager that records the time spent in it, if tracing is enabled
+    :param name: The name of the stage.  Spans with the same name are added up in the breakdown
+    :param always: Whether to record the span even if tracing isn't enabled (yet).  Only for rare spans that can happen
+    before scripts parse their arguments (i.e. parsing the config)
+    :param args: Details shown in the trace file (values should be JSON serializable)
+    """
+    if not _enabled and not always:
+        return _NULL_SPAN
+    return _Span(name, args)
+
+
+def enable(trace_path=None):
+    """
+    Starts recording spans, and prints the breakdown when the process exits (even if it's stopped with Ctrl+C)
+    :param trace_path: The path to write the spans to in Chrome trace format, or None to only print the breakdown
+    """
+    global _enabled, _enabled_pid
+    _enabled, _enabled_pid = True, os.getpid()
+    # Mostly spent importing modules.  Spans recorded so far (i.e. parsing the config) are nested in it
+    now = time.perf_counter_ns()
+    _spans.append(SpanRecord('startup', _import_time, now - _import_time,
+                             now - _import_time - sum(record.duration for record in _spans), threading.get_native_id(),
+                             {}))
+    atexit.register(_finish, trace_path)
+
+
+def breakdown(spans):
+    """
+    Sums up spans by name
+    :return: A list of tuples (name, count, total time, self time, max time), times in nanoseconds, from highest to
+    lowest self time
+    """
+    stages = {}
+    for record in spans:
+        count, total, self_time, max_time = stages.get(record.name, (0, 0, 0, 0))
+        stages[record.name] = (count + 1, total + record.duration, self_time + record.self_time,
+                               max(max_time, record.duration))
+    return sorted(((name, *stats) for name, stats in stages.items()), key=lambda stage: stage[3], reverse=True)
+
+
+def format_breakdown(spans, wall_time):
+    """
+    Formats the breakdown of spans as a table
+    :param wall_time: The time since cptools started (nanoseconds)
+    :return: A list of lines
+    """
+    lines = [f'{"Stage":<16} {"Count":>8} {"Total":>10} {"Self":>10} {"Self %":>7} {"Mean":>10} {"Max":>10}']
+    for name, count, total, self_time, max_time in breakdown(spans):
+        lines.append(f'{name:<16} {count:>8} {total / 1e9:>9.3f}s {self_time / 1e9:>9.3f}s '
+                     f'{100 * self_time / max(wall_time, 1):>6.1f}% {total / count / 1e9:>9.5f}s '
+                     f'{max_time / 1e9:>9.3f}s')
+    lines.append(f'Wall time: {wall_time / 1e9:.3f}s.  Self is the time not spent in the other stages nested in a '
+                 f'stage, and stages in different threads can overlap')
+    return lines
+
+
+def write_chrome_trace(spans, path):
+    """
+    Writes spans to a file in the Chrome trace event format (as complete events, with times in microseconds)
+    """
+    pid = os.getpid()
+    events = [{'name': record.name, 'ph': 'X', 'ts': (record.start - _import_time) / 1000,
+               'dur': record.duration / 1000, 'pid': pid, 'tid': record.tid, 'args': record.args}
+              for record in spans]
+    with open(path, 'w') as f:
+        json.dump({'traceEvents': events, 'displayTimeUnit': 'ms'}, f)
+
+
+def _finish(trace_path):
+    if os.getpid() != _enabled_pid:  # A forked child
+        return
+    spans = list(_spans)
+    wall_time = time.perf_counter_ns() - _import_time
+    print(f'\n{Style.BRIGHT}== cptools Timings =={Style.RESET_ALL}')
+    print('\n'.join(format_breakdown(spans, wall_time)))
+    if trace_path:
+        try:
+            write_chrome_trace(spans, trace_path)
+            logging.info(f'Saved trace to {trace_path}')
+        except OSError as e:
+            logging.warning(f'Could not save trace (Error: {e})')
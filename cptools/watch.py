@@ -0,0 +1,150 @@
+"""
+Waiting for changes to files.  On Linux, inotify is used (through ctypes, since it's not in the standard library), so
+that changes are noticed as soon as they happen without polling.  The directories containing the files are watched
+rather than the files themselves, since editors often save files by replacing them.  On other systems, or if inotify
+can't be used, the modification times of the files are polled instead
+"""
+
+import ctypes
+import ctypes.util
+import logging
+import os
+import select
+import struct
+import time
+
+IN_MODIFY = 0x2
+IN_ATTRIB = 0x4
+IN_CLOSE_WRITE = 0x8
+IN_MOVED_FROM = 0x40
+IN_MOVED_TO = 0x80
+IN_CREATE = 0x100
+IN_DELETE = 0x200
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+WATCH_MASK = IN_MODIFY | IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE
+
+EVENT_HEADER = struct.Struct('iIII')  # struct inotify_event: wd, mask, cookie, len, followed by the name
+
+# Events that follow the first one within this many seconds are part of the same change (editors often write a file in
+# several steps)
+SETTLE_TIME = 0.1
+POLL_INTERVAL = 0.25
+
+
+def _load_libc():
+    if not hasattr(os, 'uname') or os.uname().sysname != 'Linux':
+        return None
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+        libc.inotify_init1, libc.inotify_add_watch  # Raises AttributeError if they're missing
+    except (OSError, AttributeError):
+        return None
+    return libc
+
+
+class Watcher:
+    """
+    Waits for changes to a set of files and directories.  A change to a directory is any change to a file directly in
+    it
+    """
+
+    def __init__(self, paths):
+        """
+        :param paths: The paths of the files and directories to watch.  They don't need to exist yet
+        """
+        self.paths = {os.path.abspath(path) for path in paths}
+        self._fd = None
+        self._watches = {}  # Watch descriptor -> watched directory
+        self._mtimes = None
+
+        libc = _load_libc()
+        if libc is not None:
+            fd = libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+            if fd >= 0:
+                self._fd = fd
+                dirs = {os.path.dirname(path) for path in self.paths}
+                dirs |= {path for path in self.paths if os.path.isdir(path)}
+                for directory in dirs:
+                    wd = libc.inotify_add_watch(fd, os.fsencode(directory), WATCH_MASK)
+                    if wd < 0:
+                        logging.warning(f'Could not watch {directory} (Error: {os.strerror(ctypes.get_errno())})')
+                    else:
+                        self._watches[wd] = directory
+
+        if self._fd is None:
+            logging.debug('inotify is not available, polling for changes instead')
+            self._mtimes = self._poll_mtimes()
+
+    def _changed_paths(self, data):
+        changed = set()
+        pos = 0
+        while pos + EVENT_HEADER.size <= len(data):
+            wd, _, _, name_len = EVENT_HEADER.unpack_from(data, pos)
+            name = data[pos + EVENT_HEADER.size:pos + EVENT_HEADER.size + name_len].rstrip(b'\0')
+            pos += EVENT_HEADER.size + name_len
+
+            directory = self._watches.get(wd)
+            if directory is None:
+                continue
+            path = os.path.join(directory, os.fsdecode(name))
+            if path in self.paths:
+                changed.add(path)
+            elif directory in self.paths:
+                changed.add(directory)
+        return changed
+
+    def _read_events(self, timeout):
+        ready, _, _ = select.select([self._fd], [], [], timeout)
+        if not ready:
+            return set()
+        try:
+            return self._changed_paths(os.read(self._fd, 1 << 16))
+        except BlockingIOError:
+            return set()
+
+    def _poll_mtimes(self):
+        mtimes = {}
+        for path in self.paths:
+            try:
+                stat = os.stat(path)
+                mtimes[path] = stat.st_mtime_ns, stat.st_size
+                if os.path.isdir(path):
+                    for entry in os.scandir(path):
+                        stat = entry.stat()
+                        mtimes[entry.path] = stat.st_mtime_ns, stat.st_size
+            except OSError:
+                mtimes[path] = None
+        return mtimes
+
+    def _poll(self):
+        while True:
+            time.sleep(POLL_INTERVAL)
+            mtimes = self._poll_mtimes()
+            changed = {path if path in self.paths else os.path.dirname(path)
+                       for path in set(mtimes) | set(self._mtimes) if mtimes.get(path) != self._mtimes.get(path)}
+            self._mtimes = mtimes
+            if changed:
+                return changed
+
+    def wait(self):
+        """
+        Blocks until some of the watched paths change
+        :return: The set of paths that changed (absolute paths)
+        """
+        if self._fd is None:
+            return self._poll()
+
+        changed = set()
+        while not changed:
+            changed = self._read_events(None)
+        while True:  # Wait for the change to settle
+            more = self._read_events(SETTLE_TIME)
+            if not more:
+                return changed
+            changed |= more
+
+    def close(self):
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
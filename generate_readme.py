@@ -29,7 +29,10 @@ COMMANDS = [
     'cptools-run',
     'cptools-companion-server',
     'cptools-stress-test',
-    'cptools-make-file'
+    'cptools-make-file',
+    'cptools-view',
+    'cptools-compare',
+    'cptools-convert'
 ]
 
 print('Substituting commands...')
@@ -24,6 +24,9 @@ setup(
     name='cp-tools-console',
     version='1.0.0',
     install_requires=install_requires,
+    extras_require={
+        'fast': ['numpy']
+    },
     python_requires='>=3.9',
     packages=setuptools.find_packages('cptools.*', exclude='cptools.tests.*'),
     url='',
@@ -50,6 +53,15 @@ setup(
 
             'cpm = cptools.scripts.make_tester:main',
             'cptools-make-file = cptools.scripts.make_tester:main',
+
+            'cpv = cptools.scripts.view:main',
+            'cptools-view = cptools.scripts.view:main',
+
+            'cpc = cptools.scripts.compare:main',
+            'cptools-compare = cptools.scripts.compare:main',
+
+            'cpconv = cptools.scripts.convert:main',
+            'cptools-convert = cptools.scripts.convert:main',
         ]
     }
 )